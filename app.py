@@ -1,22 +1,18 @@
 import streamlit as st
-from config import PAGE_CONFIG
-from firebase_service import FirebaseService
-from ollama_service import OllamaService
-from auth_interface import AuthInterface
-from chat_manager import ChatManager
+from config import PAGE_CONFIG, CHAT_CONFIG
+from auth_interface import get_auth_interface
 from ui_components import UIComponents
-from llm_service import LLMService
+from startup import get_chat_services, start_prewarm
+from telemetry import telemetry
 
 # PAGE CONFIGURATION
 st.set_page_config(**PAGE_CONFIG)
 
-# Initialize services
-firebase_service = FirebaseService()
-ollama_service = OllamaService()
-auth_interface = AuthInterface()
-chat_manager = ChatManager()
+# The login page needs only Streamlit and config; LangChain, Ollama and Firestore
+# are imported and set up on a background thread while it is on screen
+start_prewarm()
+auth_interface = get_auth_interface()
 ui_components = UIComponents()
-llm_service = LLMService(ollama_service)
 
 # Render CSS
 ui_components.render_css()
@@ -30,7 +26,14 @@ def main():
         auth_interface.render()
         return
     
-    # User is authenticated
+    # User is authenticated; waits for the pre-warm if it is still running
+    services = get_chat_services()
+    chat_storage = services["chat_storage"]
+    ollama_service = services["ollama_service"]
+    chat_manager = services["chat_manager"]
+    from llm_service import LLMService
+    llm_service = LLMService(ollama_service)
+    
     user_name = st.session_state.get('user_name', 'User')
     user_email = st.session_state.get('user_email', 'unknown@example.com')
     
@@ -38,8 +41,9 @@ def main():
     st.title("Code Companion")
     st.caption(f"Welcome back, {user_name}")
     
-    # Initialize chat sessions
+    # Initialize chat sessions and pick up changes made in the user's other tabs
     chat_manager.initialize_chat_sessions(user_name)
+    chat_manager.sync_remote_changes()
     
     # Check for code changes
     chat_manager.check_for_code_changes()
@@ -47,14 +51,11 @@ def main():
     # SIDEBAR CONFIGURATION
     with st.sidebar:
         # User info section (includes logout button)
-        ui_components.render_sidebar_user_info(user_name, user_email)
+        ui_components.render_sidebar_user_info(user_name, user_email, auth_interface)
         st.divider()
         
-        # Model selection
-        selected_model = ui_components.render_model_selection(ollama_service)
-        
-        # Temperature setting
-        temperature = ui_components.render_temperature_slider()
+        # Model selection and temperature (a fragment; read back from session state)
+        ui_components.render_model_controls(ollama_service)
         st.divider()
         
         # Model capabilities
@@ -64,47 +65,50 @@ def main():
         # Chat session management
         ui_components.render_chat_session_management(chat_manager, user_name)
         
-        # Firebase status
-        ui_components.render_firebase_status(firebase_service)
+        # Chat storage status
+        ui_components.render_storage_status(chat_storage, chat_manager)
+        if CHAT_CONFIG["sync_enabled"]:
+            ui_components.render_sync_watcher(chat_manager)
         
     
     # CHAT INTERFACE
-    chat_container = st.container()
+    render_chat_pane(chat_manager, llm_service, user_name)
+
+@st.fragment
+def render_chat_pane(chat_manager, llm_service, user_name):
+    """Render the active chat and its input; sending a message reruns only this pane, not the sidebar."""
+    # Ensure active chat exists
+    if st.session_state.active_chat not in st.session_state.chat_index:
+        st.session_state.active_chat = chat_manager.get_chat_names()[0]
+        chat_manager.ensure_chat_loaded(st.session_state.active_chat)
     
-    with chat_container:
-        # Ensure active chat exists
-        if st.session_state.active_chat not in st.session_state.chat_sessions:
-            available_chats = list(st.session_state.chat_sessions.keys())
-            if available_chats:
-                st.session_state.active_chat = available_chats[0]
-            else:
-                st.session_state.chat_sessions["default"] = [{"role": "ai", "content": f"Hi {user_name}! I'm your personal LLM. How can I help you code today?"}]
-                st.session_state.active_chat = "default"
-        
-        # Chat session header
-        ui_components.render_chat_header(st.session_state.active_chat, user_name)
-        
-        # Render chat messages
-        ui_components.render_chat_messages(st.session_state.chat_sessions, st.session_state.active_chat)
+    # Chat session header
+    ui_components.render_chat_header(st.session_state.active_chat, user_name)
+    
+    # Render chat messages, paging in older ones on request
+    ui_components.render_load_earlier_messages(chat_manager, st.session_state.active_chat)
+    ui_components.render_chat_messages(st.session_state.chat_sessions, st.session_state.active_chat)
     
     # Chat input
     user_query = st.chat_input("Type your code/query here...")
     
     if user_query:
-        # Generate AI response
-        success = llm_service.generate_response(
-            user_query, 
-            st.session_state.chat_sessions, 
-            st.session_state.active_chat, 
-            selected_model, 
-            temperature
-        )
-        
-        # Save chat sessions
-        if success:
-            chat_manager.save_chat_sessions()
+        # Tie every span of this turn together under one request ID
+        with telemetry.request():
+            # Generate AI response
+            success = llm_service.generate_response(
+                user_query, 
+                st.session_state.chat_sessions, 
+                st.session_state.active_chat, 
+                st.session_state.selected_model, 
+                st.session_state.temperature
+            )
+            
+            # Save chat sessions
+            if success:
+                chat_manager.save_chat_sessions()
         
-        st.rerun()
+        st.rerun(scope="fragment")
 
 # Run the main application
 if __name__ == "__main__":
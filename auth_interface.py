@@ -1,10 +1,15 @@
 import streamlit as st
-from firebase_service import FirebaseService
+from persistence_queue import get_persistence_queue
+from chat_sync import get_chat_sync
+from chat_search import get_chat_search
 from config import SUCCESS_MESSAGES
 
 class AuthInterface:
-    def __init__(self):
-        self.firebase_service = FirebaseService()
+    @property
+    def firebase_service(self):
+        """The Firebase service, imported on first use so the login page draws without firebase_admin."""
+        from firebase_service import get_firebase_service
+        return get_firebase_service()
     
     def render(self):
         """Render the authentication interface."""
@@ -26,15 +31,16 @@ class AuthInterface:
         
         if st.button("Login"):
             if email and password:
-                success, message = self.firebase_service.verify_user_credentials(email, password)
+                # Auth record and profile are fetched together; the profile is cached
+                success, message, user_doc = self.firebase_service.sign_in(email, password)
                 if success:
-                    # Get user info from Firebase
-                    user_doc = self.firebase_service.get_user_by_email(email)
                     if user_doc:
+                        # Chat loading is keyed by uid and starts from the profile's active chat
                         st.session_state.authenticated = True
                         st.session_state.user_email = email
                         st.session_state.user_name = user_doc.get('display_name', 'User')
                         st.session_state.user_uid = user_doc.get('uid')
+                        st.session_state.user_profile = user_doc
                         st.success(SUCCESS_MESSAGES["login_successful"])
                         st.rerun()
                     else:
@@ -44,6 +50,20 @@ class AuthInterface:
             else:
                 st.warning("Please enter both email and password")
     
+    def logout(self):
+        """Sign the user out and drop everything cached for them."""
+        user_uid = st.session_state.get('user_uid')
+        if user_uid:
+            # Write anything still queued before the session goes away
+            persistence_queue = get_persistence_queue()
+            persistence_queue.flush_user(user_uid)
+            persistence_queue.forget_user(user_uid)
+            get_chat_sync().forget_user(user_uid)
+            get_chat_search().forget_user(user_uid)
+            self.firebase_service.invalidate_user_profile(user_uid)
+        st.session_state.authenticated = False
+        st.session_state.clear()
+    
     def _render_register_tab(self):
         """Render the register tab."""
         st.markdown("### Register")
@@ -60,4 +80,9 @@ class AuthInterface:
                 else:
                     st.error(message)
             else:
-                st.warning("Please fill all fields") 
\ No newline at end of file
+                st.warning("Please fill all fields") 
+
+@st.cache_resource
+def get_auth_interface():
+    """Get the process-wide authentication interface."""
+    return AuthInterface()
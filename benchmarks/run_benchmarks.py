@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for AI Code Companion.
+
+Starts a stub Ollama server and an in-memory Firestore (or a temporary SQLite
+chat store with --storage sqlite), drives OllamaService, LLMService and
+ChatManager through a scripted conversation, and writes the results to JSON
+so runs can be compared.
+
+Usage:
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --output new.json --compare bench.json
+    python -m benchmarks.run_benchmarks --storage sqlite --output sqlite.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.stub_ollama import StubOllamaConfig, StubOllamaServer
+
+BENCH_USER = {
+    "uid": "bench-user",
+    "email": "bench@example.com",
+    "display_name": "Bench"
+}
+
+CONVERSATION = [
+    "Why does `for i in range(len(items)): items.remove(items[i])` raise IndexError?",
+    "Rewrite it with a list comprehension.",
+    "Now explain this traceback:\nTraceback (most recent call last):\n  File \"app.py\", line 12, in <module>\n    data = {k: v for k, v in pairs}\nValueError: too many values to unpack (expected 2)",
+    "Write a function that merges two sorted lists in O(n).",
+    "Add type hints and a docstring to it.",
+    "How would I test it with pytest? Include a parametrized test.",
+    "What does `dict.setdefault(key, {})` return when the key exists?",
+    "Refactor this:\ndef f(x):\n    if x: \n        return {\"a\": 1}\n    else:\n        return {\"a\": 2}"
+]
+
+# Metrics where a higher value is better; everything else is a latency or size
+HIGHER_IS_BETTER = ("tokens_per_second",)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--output", default="bench_output.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Previous results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--turns", type=int, default=12, help="Conversation turns to run")
+    parser.add_argument("--reruns", type=int, default=20, help="Idle reruns of app.py to time")
+    parser.add_argument("--rerun-history", type=int, nargs="*", default=[100, 300], help="Active chat lengths to time reruns at")
+    parser.add_argument("--logins", type=int, default=5, help="Logins to time, each in a fresh session")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters per startup measurement")
+    parser.add_argument("--iterations", type=int, default=1000, help="Calls per micro-benchmark")
+    parser.add_argument("--search-messages", type=int, default=20000, help="Messages indexed for the search benchmark")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Stub tokens per second")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="Stub seconds before the first token")
+    parser.add_argument("--load-latency", type=float, default=0.5, help="Stub cold model load seconds")
+    parser.add_argument("--response-tokens", type=int, default=64, help="Tokens per stub reply")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of stub generations that fail")
+    parser.add_argument("--storage", choices=("firestore", "sqlite"), default="firestore", help="Chat storage backend")
+    parser.add_argument("--firestore-latency", type=float, default=0.0, help="Seconds added to each Firestore round-trip")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds allowed per script run")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def summarize(values):
+    """Count, mean and percentiles of a list of numbers."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": values[len(values) // 2],
+        "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+        "max": values[-1]
+    }
+
+def configure_environment(stub_url, args):
+    """Point the app at the stub before any app module reads config."""
+    os.environ["OLLAMA_BASE_URL"] = stub_url
+    os.environ["OLLAMA_BASE_URLS"] = stub_url
+    os.environ["CHAT_STREAM_RESPONSES"] = "true"
+    # Every turn should reach the stub, otherwise we'd be timing the response cache
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    os.environ["CHAT_STORAGE_BACKEND"] = args.storage
+    if args.storage == "sqlite":
+        os.environ["CHAT_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "chats.db")
+
+def seed_user(firestore_client):
+    firestore_client.collection("users").document(BENCH_USER["uid"]).set(dict(BENCH_USER))
+
+def authenticated_session(app_test):
+    app_test.session_state["authenticated"] = True
+    app_test.session_state["user_email"] = BENCH_USER["email"]
+    app_test.session_state["user_name"] = BENCH_USER["display_name"]
+    app_test.session_state["user_uid"] = BENCH_USER["uid"]
+
+# What each page has to import, timed in a fresh interpreter
+STARTUP_IMPORTS = {
+    "login_page": "import config, telemetry, ui_components, auth_interface, startup",
+    "chat_page": "import chat_manager, llm_service, ollama_service, firebase_service",
+    "langchain_ollama": "import langchain_ollama",
+    "firebase_admin": "import firebase_admin.firestore, firebase_admin.auth"
+}
+
+LOGIN_RENDER_SCRIPT = """
+import time
+from streamlit.testing.v1 import AppTest
+app_test = AppTest.from_file("app.py", default_timeout={timeout})
+started_at = time.perf_counter()
+app_test.run()
+print(time.perf_counter() - started_at)
+"""
+
+def _time_in_fresh_interpreter(code):
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+def bench_startup(args):
+    """Cold start: import time per page and the first render of the login page, each in a new process."""
+    results = {}
+    for name, statement in STARTUP_IMPORTS.items():
+        code = f"import time\nstarted_at = time.perf_counter()\n{statement}\nprint(time.perf_counter() - started_at)"
+        timings = [_time_in_fresh_interpreter(code) for _ in range(args.startup_runs)]
+        results[f"{name}_import_seconds"] = summarize(timings)
+    
+    timings = [
+        _time_in_fresh_interpreter(LOGIN_RENDER_SCRIPT.format(timeout=args.timeout))
+        for _ in range(args.startup_runs)
+    ]
+    results["login_page_first_render_seconds"] = summarize(timings)
+    return results
+
+def bench_ollama_service(model_name, iterations):
+    """Per-call cost of the model listing and status checks run on every rerun."""
+    from ollama_service import OllamaService
+    
+    service = OllamaService()
+    service.get_available_models()  # first call populates the registry
+    
+    results = {}
+    for name, call in (
+        ("get_available_models", lambda: service.get_available_models()),
+        ("is_model_available", lambda: service.is_model_available(model_name)),
+        ("get_model_status_message", lambda: service.get_model_status_message(model_name))
+    ):
+        timings = []
+        for _ in range(iterations):
+            started_at = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started_at)
+        results[f"{name}_seconds"] = summarize(timings)
+    return results
+
+def bench_service_setup(iterations):
+    """Per-rerun cost of service setup: building every service afresh vs shared lookups."""
+    from firebase_service import FirebaseService
+    from ollama_service import OllamaService
+    from auth_interface import AuthInterface, get_auth_interface
+    from chat_manager import ChatManager
+    from llm_service import LLMService
+    from startup import get_chat_services
+    
+    # firebase_admin caches the Firestore client per app, so this only pays for creating one
+    # the first time; what a new client costs is timed separately with the real client
+    def per_rerun_construction():
+        # What app.py used to do on every rerun: app.py, ChatManager and AuthInterface
+        # each built and eagerly initialized a FirebaseService, next to fresh services
+        for _ in range(3):
+            FirebaseService().initialize_firebase()
+        ollama_service = OllamaService()
+        ChatManager()
+        AuthInterface()
+        LLMService(ollama_service)
+    
+    def shared_lookup():
+        # What app.py does now
+        get_auth_interface()
+        services = get_chat_services()
+        LLMService(services["ollama_service"])
+    
+    results = {}
+    for name, call in (("per_rerun_construction", per_rerun_construction), ("shared_lookup", shared_lookup)):
+        call()
+        timings = []
+        for _ in range(iterations):
+            started_at = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started_at)
+        results[f"{name}_seconds"] = summarize(timings)
+    
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import firestore as cloud_firestore
+    timings = []
+    for _ in range(max(iterations // 100, 1)):
+        started_at = time.perf_counter()
+        cloud_firestore.Client(project="bench", credentials=AnonymousCredentials())
+        timings.append(time.perf_counter() - started_at)
+    results["firestore_client_creation_seconds"] = summarize(timings)
+    return results
+
+def compression_corpus():
+    """Chat-like message bodies: the scripted prompts, a long traceback and code listings."""
+    corpus = list(CONVERSATION)
+    corpus.append("Traceback (most recent call last):\n" + "".join(
+        f"  File \"/srv/app/module_{i % 7}.py\", line {40 + i}, in handler_{i % 5}\n    result = process(item, retries={i % 3})\n"
+        for i in range(60)
+    ) + "KeyError: 'user_id'")
+    for name in ("chat_manager.py", "firebase_service.py", "llm_service.py", "ui_components.py"):
+        with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+            source = f.read()
+        # Code listings the size a model typically returns
+        corpus.extend(source[start:start + 4000] for start in range(0, len(source), 4000))
+    return corpus
+
+def bench_compression(iterations):
+    """Compression ratio and CPU cost of storing message bodies."""
+    from message_codec import encode_content, decode_content
+    
+    corpus = compression_corpus()
+    raw_bytes = sum(len(message.encode("utf-8")) for message in corpus)
+    encoded = [encode_content(message) for message in corpus]
+    stored_bytes = sum(
+        len(content) if encoding else len(content.encode("utf-8"))
+        for content, encoding in encoded
+    )
+    
+    rounds = max(iterations // 100, 1)
+    encode_timings = []
+    decode_timings = []
+    for _ in range(rounds):
+        for message in corpus:
+            started_at = time.perf_counter()
+            content, encoding = encode_content(message)
+            encode_timings.append(time.perf_counter() - started_at)
+            started_at = time.perf_counter()
+            decode_content(content, encoding)
+            decode_timings.append(time.perf_counter() - started_at)
+    
+    return {
+        "messages": len(corpus),
+        "compressed_messages": sum(1 for _, encoding in encoded if encoding),
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "compression_ratio": stored_bytes / raw_bytes,
+        "encode_seconds": summarize(encode_timings),
+        "decode_seconds": summarize(decode_timings)
+    }
+
+def bench_search(args):
+    """Indexing throughput, query latency and stored size of chat search."""
+    from chat_search import ChatSearchIndex
+    from message_codec import encode_content
+    
+    corpus = compression_corpus()
+    index = ChatSearchIndex()
+    messages_per_chat = 200
+    started_at = time.perf_counter()
+    for first_seq in range(0, args.search_messages, messages_per_chat):
+        chat_name = f"chat-{first_seq // (messages_per_chat * 10)}"
+        seq = first_seq % (messages_per_chat * 10)
+        batch = [
+            {"role": "user" if i % 2 == 0 else "ai", "content": corpus[(first_seq + i) % len(corpus)]}
+            for i in range(min(messages_per_chat, args.search_messages - first_seq))
+        ]
+        index.add_messages(chat_name, 1, seq, batch)
+    index_seconds = time.perf_counter() - started_at
+    
+    queries = ["IndexError", "list comprehension", "setdefault", "get_chat_names", "firebase user profile", "KeyError user_id"]
+    timings = []
+    for _ in range(max(args.iterations // 100, 1)):
+        for query in queries:
+            started_at = time.perf_counter()
+            index.search(query, 10)
+            timings.append(time.perf_counter() - started_at)
+    
+    def stored_sizes(segments):
+        return [len(encode_content(json.dumps(segment, separators=(",", ":")))[0]) for segment in segments.values()]
+    
+    segments, _ = index.take_changes()
+    segment_bytes = stored_sizes(segments)
+    # One more turn on the longest chat only rewrites its open segment
+    turn = [{"role": "user", "content": corpus[0]}, {"role": "ai", "content": corpus[1]}]
+    index.add_messages("chat-0", 1, index.indexed_count("chat-0", 1), turn)
+    turn_segments, _ = index.take_changes()
+    return {
+        "messages": args.search_messages,
+        "chats": len(index.chat_names()),
+        "segments": len(segments),
+        "index_messages_per_second": args.search_messages / index_seconds,
+        "query_seconds": summarize(timings),
+        "stored_bytes": sum(segment_bytes),
+        "max_segment_bytes": max(segment_bytes, default=0),
+        "turn_write_bytes": sum(stored_sizes(turn_segments))
+    }
+
+def _conversation_turn():
+    """One scripted turn; run by AppTest so session state behaves as in the app."""
+    import time
+    import streamlit as st
+    from ollama_service import get_ollama_service
+    from llm_service import LLMService
+    from chat_manager import get_chat_manager
+    
+    bench = st.session_state.bench
+    chat_manager = get_chat_manager()
+    llm_service = LLMService(get_ollama_service())
+    chat_manager.initialize_chat_sessions(st.session_state.user_name)
+    
+    query = bench["queries"][bench["turn"] % len(bench["queries"])]
+    llm_service.generate_response(
+        query,
+        st.session_state.chat_sessions,
+        st.session_state.active_chat,
+        bench["model"],
+        bench["temperature"]
+    )
+    stats = dict(llm_service.last_generation_stats)
+    
+    started_at = time.perf_counter()
+    chat_manager.save_chat_sessions()
+    stats["save_seconds"] = time.perf_counter() - started_at
+    
+    # Saves are write-behind; time the background flush separately
+    started_at = time.perf_counter()
+    chat_manager.persistence_queue.flush_user(st.session_state.user_uid)
+    stats["flush_seconds"] = time.perf_counter() - started_at
+    stats["history_length"] = len(st.session_state.chat_sessions[st.session_state.active_chat])
+    
+    bench["results"].append(stats)
+    bench["turn"] += 1
+
+def bench_conversation(model_name, args):
+    """Time-to-first-token, tokens/s, prompt build and save time per turn."""
+    from streamlit.testing.v1 import AppTest
+    
+    app_test = AppTest.from_function(_conversation_turn, default_timeout=args.timeout)
+    authenticated_session(app_test)
+    app_test.session_state["bench"] = {
+        "queries": CONVERSATION,
+        "model": model_name,
+        "temperature": 0.0,
+        "turn": 0,
+        "results": []
+    }
+    
+    for _ in range(args.turns):
+        app_test.run()
+    
+    turns = app_test.session_state["bench"]["results"]
+    completed = [turn for turn in turns if "total_seconds" in turn]
+    return {
+        "turns": len(turns),
+        "errors": len(turns) - len(completed),
+        "time_to_first_token_seconds": summarize(t.get("time_to_first_token") for t in completed),
+        "tokens_per_second": summarize(t.get("tokens_per_second") for t in completed),
+        "prompt_build_seconds": summarize(t.get("prompt_build_seconds") for t in completed),
+        "generation_seconds": summarize(t.get("total_seconds") for t in completed),
+        "save_seconds": summarize(t.get("save_seconds") for t in turns),
+        "flush_seconds": summarize(t.get("flush_seconds") for t in turns)
+    }
+
+def bench_login(args):
+    """Login click to first render of the chat page, each in a fresh session."""
+    from streamlit.testing.v1 import AppTest
+    from firebase_service import FirebaseService
+    
+    concurrent_sign_in = FirebaseService.sign_in
+    
+    # Replays the old flow on the same app: the Auth lookup, then the profile query
+    def sequential_sign_in(self, email, password):
+        success, message = self.verify_user_credentials(email, password)
+        profile = self.get_user_by_email(email) if success else None
+        if profile:
+            self.cache_user_profile(profile)
+            # Without an active chat hint the chat page loads its first page after the index
+            profile = {key: value for key, value in profile.items() if key != "active_chat"}
+        return success, message, profile
+    
+    def time_logins():
+        timings = []
+        for _ in range(args.logins):
+            app_test = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=args.timeout)
+            app_test.run()  # renders the login form
+            app_test.text_input(key="login_email").input(BENCH_USER["email"])
+            app_test.text_input(key="login_password").input("bench-password")
+            login_button = next(button for button in app_test.button if button.label == "Login")
+            
+            started_at = time.perf_counter()
+            login_button.click().run()  # signs in, reruns and renders the active chat
+            timings.append(time.perf_counter() - started_at)
+            
+            if not app_test.session_state["authenticated"]:
+                raise RuntimeError("Benchmark login failed")
+        return summarize(timings)
+    
+    results = {}
+    FirebaseService.sign_in = sequential_sign_in
+    try:
+        results["sequential_login_to_first_render_seconds"] = time_logins()
+    finally:
+        FirebaseService.sign_in = concurrent_sign_in
+    results["login_to_first_render_seconds"] = time_logins()
+    return results
+
+def bench_reruns(args):
+    """Wall time of an idle app.py rerun for a logged-in user, also with long active chats."""
+    from streamlit.testing.v1 import AppTest
+    
+    app_test = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=args.timeout)
+    authenticated_session(app_test)
+    app_test.run()  # first run pays for imports and process-wide resources
+    
+    def time_reruns():
+        timings = []
+        for _ in range(args.reruns):
+            started_at = time.perf_counter()
+            app_test.run()
+            timings.append(time.perf_counter() - started_at)
+        return summarize(timings)
+    
+    results = {"rerun_seconds": time_reruns()}
+    # Markdown/HTML shipped to the browser on every rerun: stylesheet, cards, messages
+    results["markdown_bytes_per_rerun"] = summarize([
+        sum(len(element.value.encode("utf-8")) for element in app_test.markdown)
+    ])
+    messages = app_test.session_state["chat_sessions"][app_test.session_state["active_chat"]]
+    corpus = compression_corpus()
+    for length in args.rerun_history:
+        # Grow the active chat in memory with code-heavy turns; rendering should not notice
+        messages.extend(
+            {"role": "user" if seq % 2 == 0 else "ai", "content": corpus[seq % len(corpus)]}
+            for seq in range(len(messages), length)
+        )
+        results[f"rerun_seconds_{length}_messages"] = time_reruns()
+    return results
+
+def flatten(results, prefix=""):
+    """Flatten nested results into {"a.b.p50": value} for comparison."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not path.endswith("count"):
+            flat[path] = value
+    return flat
+
+def compare(current, previous, max_regression):
+    """Print metric changes and return the metrics that regressed."""
+    current_flat = flatten(current["results"])
+    previous_flat = flatten(previous["results"])
+    regressions = []
+    
+    print("\n📊 Comparison with previous run:")
+    for path in sorted(current_flat):
+        if path not in previous_flat or not path.endswith(("p50", "p95")):
+            continue
+        old, new = previous_flat[path], current_flat[path]
+        if not old:
+            continue
+        change = (new - old) / old
+        if any(metric in path for metric in HIGHER_IS_BETTER):
+            change = -change
+        marker = "❌" if change > max_regression else "  "
+        print(f"{marker} {path}: {old:.6f} -> {new:.6f} ({change:+.1%})")
+        if change > max_regression:
+            regressions.append(path)
+    return regressions
+
+def main():
+    args = parse_args()
+    stub_config = StubOllamaConfig(
+        token_rate=args.token_rate,
+        first_token_latency=args.first_token_latency,
+        load_latency=args.load_latency,
+        response_tokens=args.response_tokens,
+        failure_rate=args.failure_rate,
+        seed=args.seed
+    )
+    model_name = stub_config.models[0]
+    
+    with StubOllamaServer(stub_config) as stub:
+        configure_environment(stub.url, args)
+        
+        import fake_firestore
+        firestore_client = fake_firestore.install(latency=args.firestore_latency)
+        seed_user(firestore_client)
+        
+        print(f"🚀 Stub Ollama at {stub.url}")
+        results = {}
+        print("⏱️  Startup...")
+        results["startup"] = bench_startup(args)
+        print("⏱️  Service setup...")
+        results["service_setup"] = bench_service_setup(args.iterations)
+        print("⏱️  OllamaService...")
+        results["ollama_service"] = bench_ollama_service(model_name, args.iterations)
+        print("⏱️  Message compression...")
+        results["compression"] = bench_compression(args.iterations)
+        print("⏱️  Chat search...")
+        results["search"] = bench_search(args)
+        print("⏱️  Conversation...")
+        results["conversation"] = bench_conversation(model_name, args)
+        if args.storage == "firestore":
+            results["conversation"]["firestore_round_trips"] = firestore_client.round_trips
+        print("⏱️  Login...")
+        results["login"] = bench_login(args)
+        print("⏱️  Reruns...")
+        results["app"] = bench_reruns(args)
+    
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"✅ Results written to {args.output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(report, previous, args.max_regression)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed by more than {args.max_regression:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+if __name__ == "__main__":
+    main()
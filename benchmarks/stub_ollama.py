@@ -0,0 +1,184 @@
+"""
+Stub Ollama server for offline benchmarks.
+
+Implements the parts of the Ollama HTTP API the app uses (/api/tags, /api/ps,
+/api/generate, /api/chat) with configurable token rate, latency and failures.
+"""
+
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubOllamaConfig:
+    def __init__(self, models=("stub-model:latest",), token_rate=50.0, first_token_latency=0.05,
+                 load_latency=1.0, response_tokens=64, failure_rate=0.0, seed=None):
+        self.models = list(models)
+        self.token_rate = token_rate  # tokens per second
+        self.first_token_latency = first_token_latency  # seconds before the first token
+        self.load_latency = load_latency  # extra seconds the first time a model is used
+        self.response_tokens = response_tokens
+        self.failure_rate = failure_rate  # fraction of generations answered with HTTP 500
+        self.random = random.Random(seed)
+
+class StubOllamaServer:
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubOllamaConfig()
+        self.loaded_models = set()
+        self.lock = threading.Lock()
+        self.request_count = 0
+        
+        handler = type("Handler", (_StubHandler,), {"stub": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def load_model(self, model_name):
+        """Simulate loading a model; returns the load time in seconds."""
+        with self.lock:
+            cold = model_name not in self.loaded_models
+            self.loaded_models.add(model_name)
+        load_seconds = self.config.load_latency if cold else 0.001
+        time.sleep(load_seconds)
+        return load_seconds
+    
+    def should_fail(self):
+        with self.lock:
+            self.request_count += 1
+            return self.config.random.random() < self.config.failure_rate
+
+class _StubHandler(BaseHTTPRequestHandler):
+    stub = None
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        if self.path == "/api/tags":
+            models = [{"name": name, "model": name} for name in self.stub.config.models]
+            self._send_json({"models": models})
+        elif self.path == "/api/ps":
+            with self.stub.lock:
+                loaded = sorted(self.stub.loaded_models)
+            self._send_json({"models": [{"name": name, "model": name} for name in loaded]})
+        elif self.path in ("/", "/api/version"):
+            self._send_json({"version": "stub"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model_name = body.get("model")
+        
+        if model_name not in self.stub.config.models:
+            self._send_json({"error": f"model '{model_name}' not found"}, status=404)
+            return
+        
+        if self.path == "/api/generate" and not body.get("prompt"):
+            # An empty prompt just loads the model, which is how the app warms up
+            load_seconds = self.stub.load_model(model_name)
+            self._send_json(self._final_fields(model_name, load_seconds, 0, 0, done_reason="load"))
+        elif self.path in ("/api/chat", "/api/generate"):
+            if self.stub.should_fail():
+                self._send_json({"error": "stub failure"}, status=500)
+                return
+            self._generate(model_name, body)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+    
+    def _generate(self, model_name, body):
+        config = self.stub.config
+        is_chat = self.path == "/api/chat"
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", [])) if is_chat else len(body.get("prompt", ""))
+        
+        load_seconds = self.stub.load_model(model_name)
+        time.sleep(config.first_token_latency)
+        
+        stream = body.get("stream", True)
+        tokens = [f"tok{i} " for i in range(config.response_tokens)]
+        started_at = time.perf_counter()
+        
+        if not stream:
+            time.sleep(len(tokens) / config.token_rate)
+            payload = self._final_fields(model_name, load_seconds, prompt_chars // 4, len(tokens))
+            payload.update(self._content_fields("".join(tokens), is_chat))
+            self._send_json(payload)
+            return
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        for token in tokens:
+            chunk = {"model": model_name, "created_at": _now(), "done": False}
+            chunk.update(self._content_fields(token, is_chat))
+            self._write_chunk(chunk)
+            time.sleep(1.0 / config.token_rate)
+        
+        final = self._final_fields(model_name, load_seconds, prompt_chars // 4, len(tokens))
+        final["eval_duration"] = int((time.perf_counter() - started_at) * 1e9)
+        final.update(self._content_fields("", is_chat))
+        self._write_chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+    
+    @staticmethod
+    def _content_fields(text, is_chat):
+        if is_chat:
+            return {"message": {"role": "assistant", "content": text}}
+        return {"response": text}
+    
+    @staticmethod
+    def _final_fields(model_name, load_seconds, prompt_tokens, eval_tokens, done_reason="stop"):
+        return {
+            "model": model_name,
+            "created_at": _now(),
+            "done": True,
+            "done_reason": done_reason,
+            "total_duration": int(load_seconds * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": 0,
+            "eval_count": eval_tokens,
+            "eval_duration": 0
+        }
+    
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+    
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
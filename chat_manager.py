@@ -1,44 +1,307 @@
 import streamlit as st
 from datetime import datetime
 import hashlib
-from firebase_service import FirebaseService
-from config import CHAT_CONFIG, WELCOME_MESSAGES, SUCCESS_MESSAGES
+from concurrent.futures import ThreadPoolExecutor
+from chat_storage import get_chat_storage
+from context_manager import ContextWindowManager
+from prompt_cache import PromptCache
+from persistence_queue import get_persistence_queue
+from chat_sync import get_chat_sync
+from chat_search import get_chat_search
+from telemetry import telemetry
+from config import CHAT_CONFIG, WELCOME_MESSAGES, SUCCESS_MESSAGES, ERROR_MESSAGES
 
 class ChatManager:
     def __init__(self):
-        self.firebase_service = FirebaseService()
+        self.storage = get_chat_storage()
+        self.context_manager = ContextWindowManager()
+        self.prompt_cache = PromptCache()
+        self.persistence_queue = get_persistence_queue()
+        self.chat_sync = get_chat_sync()
+        self.chat_search = get_chat_search()
+        # Fetches a user's first page of messages while their chat index loads
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-load")
     
     def initialize_chat_sessions(self, user_name):
         """Initialize chat sessions for the user."""
         if "chat_sessions" not in st.session_state:
-            # Try to load existing chat sessions for this user
-            loaded_sessions, loaded_active_chat = self.firebase_service.load_chat_sessions(
-                st.session_state.get('user_email')
-            )
+            user_uid = st.session_state.get('user_uid')
+            # Another session of this user may still have unsaved changes queued
+            self.persistence_queue.flush_user(user_uid)
+            
+            # The profile read at login names the active chat, so its newest page
+            # can be fetched while the chat index loads
+            hinted_chat = st.session_state.get('user_profile', {}).get('active_chat')
+            first_page = None
+            if user_uid and hinted_chat:
+                first_page = self.executor.submit(self.storage.load_chat_messages, user_uid, hinted_chat)
+            
+            # Only the chat list is read here; a chat's messages are fetched when it becomes active
+            chat_index, loaded_active_chat = self.storage.load_chat_index(user_uid)
+            
+            # Remember what is already in Firestore so saves only write the difference
+            st.session_state.chat_sync_state = {
+                "counts": {name: entry["message_count"] for name, entry in chat_index.items()},
+                "versions": {name: entry.get("version", 0) for name, entry in chat_index.items()},
+                "epochs": {name: entry.get("epoch", 0) for name, entry in chat_index.items()},
+                "replaced": set(),
+                "deleted": set(),
+                "active_chat": loaded_active_chat if chat_index else None
+            }
+            # chat_sessions holds the loaded tail of each opened chat, starting at seq chat_offsets[name]
+            st.session_state.chat_sessions = {}
+            st.session_state.chat_offsets = {}
             
-            if loaded_sessions:
-                st.session_state.chat_sessions = loaded_sessions
-                st.session_state.active_chat = loaded_active_chat
+            if chat_index:
+                st.session_state.chat_index = chat_index
+                st.session_state.active_chat = (
+                    loaded_active_chat if loaded_active_chat in chat_index else next(iter(chat_index))
+                )
+                if first_page is not None and st.session_state.active_chat == hinted_chat:
+                    self._use_first_page(hinted_chat, first_page)
                 st.success(SUCCESS_MESSAGES["chat_loaded"].format(user_name=user_name))
             else:
                 # Create default chat session with welcome message
-                st.session_state.chat_sessions = {
-                    "default": [{"role": "ai", "content": WELCOME_MESSAGES["default"].format(user_name=user_name)}]
-                }
+                st.session_state.chat_index = {"default": {"message_count": 1, "updated_at": None}}
+                st.session_state.chat_sessions["default"] = [
+                    {"role": "ai", "content": WELCOME_MESSAGES["default"].format(user_name=user_name)}
+                ]
                 st.session_state.active_chat = "default"
         
         # Ensure active_chat is always set
         if "active_chat" not in st.session_state:
             st.session_state.active_chat = "default"
+        
+        self.ensure_chat_loaded(st.session_state.active_chat)
+    
+    def ensure_chat_loaded(self, chat_name):
+        """Fetch the most recent page of a chat's messages if it has not been opened yet."""
+        if chat_name in st.session_state.chat_sessions or chat_name not in st.session_state.chat_index:
+            return
+        
+        message_count = st.session_state.chat_index[chat_name]["message_count"]
+        if not message_count:
+            st.session_state.chat_sessions[chat_name] = []
+            st.session_state.chat_offsets[chat_name] = 0
+            return
+        
+        # Bounded by message_count: if the read fails the chat opens empty with everything
+        # still "earlier", so saves keep appending after the persisted messages
+        try:
+            messages, first_seq = self.storage.load_chat_messages(
+                st.session_state.get('user_uid'),
+                chat_name,
+                before_seq=message_count
+            )
+        except Exception as e:
+            st.warning(ERROR_MESSAGES["chat_load_failed"].format(error=e))
+            messages, first_seq = [], message_count
+        st.session_state.chat_sessions[chat_name] = messages
+        st.session_state.chat_offsets[chat_name] = first_seq
+    
+    def _use_first_page(self, chat_name, first_page):
+        """Adopt a page fetched alongside the chat index, if it matches the index."""
+        try:
+            messages, first_seq = first_page.result()
+        except Exception:
+            return  # ensure_chat_loaded retries and reports the error
+        
+        # Only a page that ends exactly at the indexed count lines up with the sync state
+        if first_seq + len(messages) == st.session_state.chat_index[chat_name]["message_count"]:
+            st.session_state.chat_sessions[chat_name] = messages
+            st.session_state.chat_offsets[chat_name] = first_seq
+    
+    def sync_remote_changes(self):
+        """Pull in what the user's other tabs wrote since this session last synced; returns whether anything changed."""
+        user_uid = st.session_state.get('user_uid')
+        if not CHAT_CONFIG["sync_enabled"] or not user_uid or "chat_sync_state" not in st.session_state:
+            return False
+        # Our own queued writes would look like remote changes until they land
+        if self.persistence_queue.has_pending(user_uid):
+            return False
+        
+        sync_state = st.session_state.chat_sync_state
+        try:
+            remote = self.chat_sync.get_versions(user_uid, newer_than=sync_state.get("written_at"))
+        except Exception:
+            telemetry.increment("errors", stage="chat.sync")
+            return False
+        if remote is None:
+            return False
+        
+        counts = sync_state["counts"]
+        versions = sync_state.setdefault("versions", {})
+        changed = False
+        has_unsaved = False
+        with telemetry.span("chat.sync"):
+            for chat_name, stored in remote.items():
+                if chat_name not in counts:
+                    if chat_name not in st.session_state.chat_index:
+                        # Created in another tab: list it, load it when opened
+                        st.session_state.chat_index[chat_name] = {"message_count": stored["message_count"], "updated_at": None}
+                        self._record_remote_version(chat_name, stored, stored["message_count"])
+                        changed = True
+                    continue
+                if stored["version"] <= versions.get(chat_name, 0):
+                    continue
+                
+                try:
+                    has_unsaved = self._apply_remote_chat(user_uid, chat_name, stored) or has_unsaved
+                except Exception as e:
+                    # Versions stay as they were, so the next sync retries
+                    st.warning(ERROR_MESSAGES["chat_load_failed"].format(error=e))
+                    continue
+                changed = True
+            
+            for chat_name in [name for name in counts if name not in remote]:
+                self._remove_remote_chat(chat_name)
+                changed = True
+        
+        if has_unsaved:
+            self.save_chat_sessions()
+        return changed
+    
+    def _apply_remote_chat(self, user_uid, chat_name, stored):
+        """Bring one chat up to its stored version; returns whether it has unsaved local messages."""
+        sync_state = st.session_state.chat_sync_state
+        persisted = sync_state["counts"][chat_name]
+        if chat_name not in st.session_state.chat_sessions:
+            st.session_state.chat_index[chat_name]["message_count"] = stored["message_count"]
+            self._record_remote_version(chat_name, stored, stored["message_count"])
+            return False
+        
+        messages = st.session_state.chat_sessions[chat_name]
+        offset = st.session_state.chat_offsets.get(chat_name, 0)
+        saved, unsaved = messages[:persisted - offset], messages[persisted - offset:]
+        # The persistence queue may have stored some of them after the other tab's messages already
+        unsaved = unsaved[sync_state.get("rebased", {}).get(chat_name, 0):]
+        rewritten = stored["epoch"] != sync_state.get("epochs", {}).get(chat_name, 0) or stored["message_count"] < persisted
+        if rewritten:
+            # Cleared or recreated elsewhere: what this session holds no longer lines up
+            messages, offset = self.storage.load_chat_messages(user_uid, chat_name, before_seq=stored["message_count"])
+        else:
+            messages = saved + self.storage.load_chat_messages_since(user_uid, chat_name, persisted)
+        
+        self._record_remote_version(chat_name, stored, offset + len(messages))
+        st.session_state.chat_sessions[chat_name] = messages + unsaved
+        st.session_state.chat_offsets[chat_name] = offset
+        st.session_state.chat_index[chat_name]["message_count"] = self.get_message_count(chat_name)
+        if rewritten or unsaved:
+            self.invalidate_prompt_caches(chat_name)
+        return bool(unsaved)
+    
+    def _record_remote_version(self, chat_name, stored, message_count):
+        sync_state = st.session_state.chat_sync_state
+        sync_state["counts"][chat_name] = message_count
+        sync_state["versions"][chat_name] = stored["version"]
+        sync_state.setdefault("epochs", {})[chat_name] = stored["epoch"]
+        sync_state.get("rebased", {}).pop(chat_name, None)
+    
+    def _remove_remote_chat(self, chat_name):
+        """Drop a chat another tab deleted, switching away from it if it was active."""
+        sync_state = st.session_state.chat_sync_state
+        for field in ("counts", "versions", "epochs", "rebased"):
+            sync_state.get(field, {}).pop(chat_name, None)
+        st.session_state.chat_index.pop(chat_name, None)
+        st.session_state.chat_sessions.pop(chat_name, None)
+        st.session_state.chat_offsets.pop(chat_name, None)
+        self.invalidate_prompt_caches(chat_name)
+        
+        if st.session_state.active_chat == chat_name:
+            if not st.session_state.chat_index:
+                user_name = st.session_state.get('user_name', 'User')
+                st.session_state.chat_index["default"] = {"message_count": 1, "updated_at": None}
+                st.session_state.chat_sessions["default"] = [
+                    {"role": "ai", "content": WELCOME_MESSAGES["default"].format(user_name=user_name)}
+                ]
+                st.session_state.chat_offsets["default"] = 0
+            st.session_state.active_chat = next(iter(st.session_state.chat_index))
+            self.ensure_chat_loaded(st.session_state.active_chat)
+            self.save_chat_sessions()
+    
+    def has_earlier_messages(self, chat_name):
+        """Check whether older messages of a chat are still unloaded."""
+        return st.session_state.chat_offsets.get(chat_name, 0) > 0
+    
+    def load_earlier_messages(self, chat_name):
+        """Prepend the previous page of a chat's messages."""
+        offset = st.session_state.chat_offsets.get(chat_name, 0)
+        if offset <= 0:
+            return False
+        
+        try:
+            messages, first_seq = self.storage.load_chat_messages(
+                st.session_state.get('user_uid'),
+                chat_name,
+                before_seq=offset
+            )
+        except Exception as e:
+            st.warning(ERROR_MESSAGES["chat_load_failed"].format(error=e))
+            return False
+        if not messages:
+            return False
+        
+        st.session_state.chat_sessions[chat_name] = messages + st.session_state.chat_sessions[chat_name]
+        st.session_state.chat_offsets[chat_name] = first_seq
+        # The summary is keyed by seq and stays valid; only the per-message prompt cache shifts
+        self.prompt_cache.invalidate(chat_name)
+        return True
+    
+    def get_chat_names(self):
+        """Get the names of all of the user's chats, loaded or not."""
+        return list(st.session_state.chat_index.keys())
+    
+    def get_message_count(self, chat_name):
+        """Get a chat's total message count, including pages that are not loaded."""
+        if chat_name in st.session_state.chat_sessions:
+            return st.session_state.chat_offsets.get(chat_name, 0) + len(st.session_state.chat_sessions[chat_name])
+        return st.session_state.chat_index.get(chat_name, {}).get("message_count", 0)
+    
+    def search_chats(self, query):
+        """Search all of the user's chats; returns ranked hits as from ChatSearch.search."""
+        user_uid = st.session_state.get('user_uid')
+        if not user_uid or "chat_sync_state" not in st.session_state:
+            return []
+        
+        try:
+            # Index what did not pass through LLMService here: older chats, other tabs' messages
+            self.chat_search.catch_up(
+                user_uid,
+                {chat_name: self.get_message_count(chat_name) for chat_name in st.session_state.chat_index},
+                st.session_state.chat_sync_state.get("epochs", {}),
+                {
+                    chat_name: (st.session_state.chat_offsets.get(chat_name, 0), messages)
+                    for chat_name, messages in st.session_state.chat_sessions.items()
+                }
+            )
+            return self.chat_search.search(user_uid, query)
+        except Exception as e:
+            st.warning(ERROR_MESSAGES["search_failed"].format(error=e))
+            return []
+    
+    def open_search_hit(self, hit):
+        """Make a hit's chat active, with enough of it loaded to include the hit."""
+        chat_name = hit["chat_name"]
+        if chat_name not in st.session_state.chat_index:
+            return False
+        
+        st.session_state.active_chat = chat_name
+        self.ensure_chat_loaded(chat_name)
+        while st.session_state.chat_offsets.get(chat_name, 0) > hit["seq"]:
+            if not self.load_earlier_messages(chat_name):
+                break
+        return True
     
     def create_new_chat(self, chat_name, user_name):
         """Create a new chat session."""
-        if chat_name and chat_name not in st.session_state.chat_sessions:
+        if chat_name and chat_name not in st.session_state.chat_index:
             welcome_message = WELCOME_MESSAGES["new_chat"].format(
                 user_name=user_name, 
                 chat_name=chat_name
             )
+            st.session_state.chat_index[chat_name] = {"message_count": 1, "updated_at": None}
             st.session_state.chat_sessions[chat_name] = [{"role": "ai", "content": welcome_message}]
+            st.session_state.chat_offsets[chat_name] = 0
             st.session_state.active_chat = chat_name
             self.save_chat_sessions()
             return True
@@ -48,36 +311,66 @@ class ChatManager:
         """Clear the current chat session."""
         welcome_message = WELCOME_MESSAGES["default"].format(user_name=user_name)
         st.session_state.chat_sessions[st.session_state.active_chat] = [{"role": "ai", "content": welcome_message}]
-        self.save_chat_sessions()
+        st.session_state.chat_offsets[st.session_state.active_chat] = 0
+        self.invalidate_prompt_caches(st.session_state.active_chat)
+        self.chat_search.drop_chat(st.session_state.get('user_uid'), st.session_state.active_chat)
+        self.save_chat_sessions(replaced_chat=st.session_state.active_chat)
     
     def delete_current_chat(self, user_name):
         """Delete the current chat session."""
-        if len(st.session_state.chat_sessions) > 1:
-            if st.session_state.active_chat in st.session_state.chat_sessions:
+        if len(st.session_state.chat_index) > 1:
+            deleted_chat = st.session_state.active_chat
+            if deleted_chat in st.session_state.chat_index:
                 # Remove the current chat session
-                del st.session_state.chat_sessions[st.session_state.active_chat]
+                del st.session_state.chat_index[deleted_chat]
+                st.session_state.chat_sessions.pop(deleted_chat, None)
+                st.session_state.chat_offsets.pop(deleted_chat, None)
+                self.invalidate_prompt_caches(deleted_chat)
+                self.chat_search.drop_chat(st.session_state.get('user_uid'), deleted_chat)
                 
                 # Switch to first available chat if current chat is deleted
-                remaining_chats = list(st.session_state.chat_sessions.keys())
+                remaining_chats = list(st.session_state.chat_index.keys())
                 if remaining_chats:
                     st.session_state.active_chat = remaining_chats[0]
+                    self.ensure_chat_loaded(st.session_state.active_chat)
                 else:
                     # Fallback: create default chat if none exist
                     welcome_message = WELCOME_MESSAGES["default"].format(user_name=user_name)
+                    st.session_state.chat_index["default"] = {"message_count": 1, "updated_at": None}
                     st.session_state.chat_sessions["default"] = [{"role": "ai", "content": welcome_message}]
+                    st.session_state.chat_offsets["default"] = 0
                     st.session_state.active_chat = "default"
-                self.save_chat_sessions()
+                self.save_chat_sessions(deleted_chat=deleted_chat)
                 return True
         return False
     
-    def save_chat_sessions(self):
-        """Save chat sessions to Firebase."""
-        return self.firebase_service.save_chat_sessions(
-            st.session_state.chat_sessions,
-            st.session_state.active_chat,
-            st.session_state.get('user_email'),
-            st.session_state.get('user_name', 'Unknown')
-        )
+    def invalidate_prompt_caches(self, chat_name):
+        """Forget a chat's cached prompt messages and summary, which no longer line up once its messages shift."""
+        self.prompt_cache.invalidate(chat_name)
+        self.context_manager.invalidate(chat_name)
+    
+    def save_chat_sessions(self, replaced_chat=None, deleted_chat=None):
+        """Queue the loaded chats for a background save; pass replaced_chat or deleted_chat when one was cleared or removed."""
+        with telemetry.span("chat.save"):
+            for chat_name in st.session_state.chat_sessions:
+                if chat_name in st.session_state.chat_index:
+                    st.session_state.chat_index[chat_name]["message_count"] = self.get_message_count(chat_name)
+            self.persistence_queue.mark_dirty(
+                st.session_state.get('user_uid'),
+                st.session_state.get('user_name', 'Unknown'),
+                st.session_state.chat_sessions,
+                st.session_state.chat_offsets,
+                st.session_state.active_chat,
+                st.session_state.chat_sync_state,
+                replaced_chat=replaced_chat,
+                deleted_chat=deleted_chat
+            )
+        return True
+    
+    def get_save_status(self):
+        """Get (has_pending_changes, last_error) for the current user's chats."""
+        user_uid = st.session_state.get('user_uid')
+        return self.persistence_queue.has_pending(user_uid), self.persistence_queue.get_error(user_uid)
     
     def get_file_hash(self):
         """Get hash of the current file for auto-refresh functionality."""
@@ -106,4 +399,9 @@ class ChatManager:
                 st.session_state.last_refresh = datetime.now().strftime("%H:%M:%S")
                 st.info("🔄 Code updated! Chat sessions preserved.")
                 return True
-        return False 
\ No newline at end of file
+        return False 
+
+@st.cache_resource
+def get_chat_manager():
+    """Get the process-wide chat manager (all per-user state lives in st.session_state)."""
+    return ChatManager()
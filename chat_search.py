@@ -0,0 +1,398 @@
+import atexit
+import functools
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from chat_storage import get_chat_storage
+from telemetry import telemetry
+from config import SEARCH_CONFIG
+
+# Identifiers with optional dotted access (os.path.join), and numbers (3.13)
+TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*|\d+(?:\.\d+)*")
+# Pieces of camelCase and PascalCase words, keeping acronyms together (HTTPServer -> HTTP, Server)
+WORD_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in is it its me my "
+    "no not of on or so that the then there this to was we what when where which why with you your".split()
+)
+
+@functools.lru_cache(maxsize=65536)
+def _expand_token(token):
+    """The search terms of one token: itself, then its dotted, snake_case and camelCase parts."""
+    terms = []
+    
+    def add(term):
+        term = term.lower()
+        if len(term) > 1 and term not in STOP_WORDS and term not in terms:
+            terms.append(term)
+    
+    add(token)
+    if not token[0].isdigit():
+        for name in token.split("."):
+            add(name)
+            for word in name.split("_"):
+                add(word)
+                for piece in WORD_PATTERN.findall(word):
+                    add(piece)
+    return tuple(terms)
+
+def tokenize(text):
+    """Split text into lowercase search terms, keeping code identifiers whole and by part."""
+    # "loadChatIndex" gives loadchatindex, load, chat and index, so it is found by any word in it
+    terms = []
+    for token in TOKEN_PATTERN.findall(text):
+        terms.extend(_expand_token(token))
+    return terms
+
+class ChatSearchIndex:
+    """Inverted index over one user's messages, stored per chat in segments of consecutive messages."""
+    
+    def __init__(self, segments=None):
+        self.lock = threading.Lock()
+        self.chats = {}
+        # (chat_name, start_seq) of segments to write and to delete at the next save
+        self.dirty = set()
+        self.removed = set()
+        for chat_name, chat_segments in (segments or {}).items():
+            self._load_chat(chat_name, chat_segments)
+    
+    # A segment is persisted as one record: {"epoch", "docs": {seq: [role, length, preview]},
+    # "postings": {term: {seq: term_frequency}}, "total_length", "entries"}. It is closed at
+    # segment_messages messages or segment_terms postings entries, so a new turn only rewrites
+    # the open segment at the end of its chat
+    @staticmethod
+    def _new_segment(epoch):
+        return {"epoch": epoch, "docs": {}, "postings": {}, "total_length": 0, "entries": 0}
+    
+    def _load_chat(self, chat_name, chat_segments):
+        """Rebuild a chat from its stored segments, keeping the newest epoch's run from seq 0."""
+        for segment in chat_segments.values():
+            # JSON turns the integer seq keys into strings
+            segment["docs"] = {int(seq): doc for seq, doc in segment["docs"].items()}
+            segment["postings"] = {
+                term: {int(seq): count for seq, count in postings.items()}
+                for term, postings in segment["postings"].items()
+            }
+        epoch = max(segment["epoch"] for segment in chat_segments.values())
+        chat = {"epoch": epoch, "indexed_count": 0, "total_length": 0, "segments": {}}
+        # A save cut short can leave segments of an older epoch or past a gap; they are deleted next save
+        while chat["indexed_count"] in chat_segments and chat_segments[chat["indexed_count"]]["epoch"] == epoch:
+            start_seq = chat["indexed_count"]
+            segment = chat_segments[start_seq]
+            if not segment["docs"]:
+                break
+            chat["segments"][start_seq] = segment
+            chat["indexed_count"] = start_seq + len(segment["docs"])
+            chat["total_length"] += segment["total_length"]
+        self.removed.update((chat_name, start_seq) for start_seq in chat_segments if start_seq not in chat["segments"])
+        if chat["segments"]:
+            self.chats[chat_name] = chat
+    
+    def _remove_chat(self, chat_name):
+        chat = self.chats.pop(chat_name, None)
+        if chat is not None:
+            keys = {(chat_name, start_seq) for start_seq in chat["segments"]}
+            self.dirty -= keys
+            self.removed |= keys
+    
+    def indexed_count(self, chat_name, epoch):
+        """How many of a chat's messages are indexed; segments from an older epoch are discarded."""
+        with self.lock:
+            chat = self.chats.get(chat_name)
+            if chat is not None and chat["epoch"] != epoch:
+                self._remove_chat(chat_name)
+                chat = None
+            return chat["indexed_count"] if chat else 0
+    
+    def add_messages(self, chat_name, epoch, first_seq, messages):
+        """Index messages starting at seq first_seq, skipping those already indexed; returns whether anything was added."""
+        # Messages are only appended in seq order, so a batch that would leave a gap is ignored
+        with self.lock:
+            chat = self.chats.get(chat_name)
+            if chat is not None and chat["epoch"] != epoch:
+                self._remove_chat(chat_name)
+                chat = None
+            if chat is None:
+                chat = {"epoch": epoch, "indexed_count": 0, "total_length": 0, "segments": {}}
+            start = chat["indexed_count"]
+            if first_seq > start or first_seq + len(messages) <= start:
+                return False
+            
+            start_seq = max(chat["segments"], default=0)
+            segment = chat["segments"].get(start_seq) or self._new_segment(epoch)
+            for seq in range(start, first_seq + len(messages)):
+                message = messages[seq - first_seq]
+                counts = Counter(tokenize(message["content"]))
+                if segment["docs"] and (
+                    len(segment["docs"]) >= SEARCH_CONFIG["segment_messages"]
+                    or segment["entries"] + len(counts) > SEARCH_CONFIG["segment_terms"]
+                ):
+                    start_seq, segment = seq, self._new_segment(epoch)
+                chat["segments"][start_seq] = segment
+                self.dirty.add((chat_name, start_seq))
+                self.removed.discard((chat_name, start_seq))
+                
+                length = sum(counts.values())
+                for term, count in counts.items():
+                    segment["postings"].setdefault(term, {})[seq] = count
+                preview = " ".join(message["content"].split())[:SEARCH_CONFIG["preview_chars"]]
+                segment["docs"][seq] = [message["role"], length, preview]
+                segment["total_length"] += length
+                segment["entries"] += len(counts)
+                chat["total_length"] += length
+            chat["indexed_count"] = first_seq + len(messages)
+            self.chats[chat_name] = chat
+            return True
+    
+    def chat_names(self):
+        with self.lock:
+            return list(self.chats)
+    
+    def drop_chat(self, chat_name):
+        with self.lock:
+            self._remove_chat(chat_name)
+    
+    def has_changes(self):
+        with self.lock:
+            return bool(self.dirty or self.removed)
+    
+    def take_changes(self):
+        """Get ({(chat_name, start_seq): segment}, removed) changed since the last call."""
+        with self.lock:
+            segments = {}
+            for chat_name, start_seq in self.dirty:
+                segment = self.chats[chat_name]["segments"][start_seq]
+                segments[(chat_name, start_seq)] = {
+                    **segment,
+                    "docs": dict(segment["docs"]),
+                    "postings": {term: dict(postings) for term, postings in segment["postings"].items()}
+                }
+            removed = self.removed - self.dirty
+            self.dirty = set()
+            self.removed = set()
+            return segments, removed
+    
+    def restore_changes(self, keys, removed):
+        """Mark changes as unsaved again after a failed write."""
+        with self.lock:
+            for chat_name, start_seq in keys:
+                if start_seq in self.chats.get(chat_name, {}).get("segments", {}):
+                    self.dirty.add((chat_name, start_seq))
+                else:
+                    self.removed.add((chat_name, start_seq))
+            self.removed.update(key for key in removed if key not in self.dirty)
+    
+    def search(self, query, limit):
+        """Rank messages against the query with BM25; returns up to limit hits, best first."""
+        terms = set(tokenize(query))
+        k1, b = SEARCH_CONFIG["bm25_k1"], SEARCH_CONFIG["bm25_b"]
+        with self.lock:
+            doc_count = sum(chat["indexed_count"] for chat in self.chats.values())
+            if not terms or not doc_count:
+                return []
+            average_length = max(sum(chat["total_length"] for chat in self.chats.values()) / doc_count, 1)
+            segments = [
+                (chat_name, segment) for chat_name, chat in self.chats.items() for segment in chat["segments"].values()
+            ]
+            
+            scores = {}
+            docs = {}
+            for term in terms:
+                matches = [(chat_name, segment) for chat_name, segment in segments if term in segment["postings"]]
+                document_frequency = sum(len(segment["postings"][term]) for _, segment in matches)
+                if not document_frequency:
+                    continue
+                idf = math.log(1 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                for chat_name, segment in matches:
+                    for seq, count in segment["postings"][term].items():
+                        doc = segment["docs"][seq]
+                        length_ratio = doc[1] / average_length
+                        score = idf * count * (k1 + 1) / (count + k1 * (1 - b + b * length_ratio))
+                        scores[(chat_name, seq)] = scores.get((chat_name, seq), 0.0) + score
+                        docs[(chat_name, seq)] = doc
+            
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [
+                {
+                    "chat_name": chat_name,
+                    "seq": seq,
+                    "role": docs[(chat_name, seq)][0],
+                    "preview": docs[(chat_name, seq)][2],
+                    "score": score
+                }
+                for (chat_name, seq), score in best
+            ]
+
+class ChatSearch:
+    """Full-text search over each signed-in user's chats, with indexes kept in memory and saved in the background."""
+    
+    def __init__(self, storage, save_delay):
+        self.storage = storage
+        self.save_delay = save_delay
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.indexes = {}
+        # Changes are saved save_delay seconds after the first unsaved one, so a conversation's turns share one write
+        self.save_timers = {}
+        # One worker keeps each user's index updates in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-search")
+        atexit.register(self.shutdown)
+    
+    def get_index(self, user_id):
+        """Get a user's index, loading it from storage the first time; raises on failure."""
+        with self.lock:
+            index = self.indexes.get(user_id)
+        if index is None:
+            shards = self.storage.load_search_index(user_id)
+            with self.lock:
+                index = self.indexes.setdefault(user_id, ChatSearchIndex(shards))
+        return index
+    
+    def index_messages(self, user_id, chat_name, epoch, first_seq, messages):
+        """Queue a chat's loaded messages, starting at seq first_seq, for indexing; returns immediately."""
+        if user_id and SEARCH_CONFIG["enabled"]:
+            self.executor.submit(self._index_and_save, user_id, chat_name, epoch, first_seq, list(messages))
+    
+    def _index_and_save(self, user_id, chat_name, epoch, first_seq, messages):
+        try:
+            with telemetry.span("search.index", messages=len(messages)):
+                if self._add_loaded(self.get_index(user_id), user_id, chat_name, epoch, first_seq, messages):
+                    self._schedule_save(user_id)
+        except Exception:
+            telemetry.increment("errors", stage="search.index")
+    
+    def _add_loaded(self, index, user_id, chat_name, epoch, first_seq, messages):
+        """Index a chat's loaded messages, reading the unindexed ones before first_seq from storage; raises on failure."""
+        indexed = index.indexed_count(chat_name, epoch)
+        added = False
+        if indexed < first_seq:
+            earlier, earlier_seq = self.storage.load_chat_messages(
+                user_id, chat_name, before_seq=first_seq, limit=first_seq - indexed
+            )
+            added = index.add_messages(chat_name, epoch, earlier_seq, earlier)
+        return index.add_messages(chat_name, epoch, first_seq, messages) or added
+    
+    def drop_chat(self, user_id, chat_name):
+        """Forget a cleared or deleted chat's messages, after any indexing already queued."""
+        if user_id and SEARCH_CONFIG["enabled"]:
+            self.executor.submit(self._drop_and_save, user_id, chat_name)
+    
+    def _drop_and_save(self, user_id, chat_name):
+        try:
+            self.get_index(user_id).drop_chat(chat_name)
+            self._schedule_save(user_id)
+        except Exception:
+            telemetry.increment("errors", stage="search.index")
+    
+    def catch_up(self, user_id, counts, epochs, loaded):
+        """Bring the index in line with a session's chats; raises on failure."""
+        # counts holds every chat's message count and loaded {chat_name: (first_seq, messages)} the
+        # messages the session holds, saved or not; chats not in counts are dropped
+        index = self.get_index(user_id)
+        changed = False
+        with telemetry.span("search.catch_up"):
+            for chat_name in [name for name in index.chat_names() if name not in counts]:
+                index.drop_chat(chat_name)
+                changed = True
+            for chat_name, message_count in counts.items():
+                epoch = epochs.get(chat_name, 0)
+                indexed = index.indexed_count(chat_name, epoch)
+                if indexed > message_count:
+                    index.drop_chat(chat_name)
+                    indexed = 0
+                if indexed >= message_count:
+                    continue
+                if chat_name in loaded:
+                    first_seq, messages = loaded[chat_name]
+                    changed = self._add_loaded(index, user_id, chat_name, epoch, first_seq, messages) or changed
+                else:
+                    messages = self.storage.load_chat_messages_since(user_id, chat_name, indexed)
+                    changed = index.add_messages(chat_name, epoch, indexed, messages[:message_count - indexed]) or changed
+        if changed:
+            self._schedule_save(user_id)
+    
+    def search(self, user_id, query, limit=None):
+        """Get ranked hits for a query across all of a user's chats; raises on failure."""
+        with telemetry.span("search.query"):
+            return self.get_index(user_id).search(query, limit or SEARCH_CONFIG["max_results"])
+    
+    def _schedule_save(self, user_id):
+        """Save a user's index after save_delay, unless a save is already scheduled."""
+        with self.lock:
+            if user_id in self.save_timers:
+                return
+            timer = threading.Timer(self.save_delay, self.executor.submit, (self._save_scheduled, user_id))
+            timer.daemon = True
+            self.save_timers[user_id] = timer
+        timer.start()
+    
+    def _save_scheduled(self, user_id):
+        with self.lock:
+            self.save_timers.pop(user_id, None)
+        try:
+            self.save(user_id)
+        except Exception:
+            telemetry.increment("errors", stage="search.save")
+            # The changes were put back; try again after another delay
+            self._schedule_save(user_id)
+    
+    def save(self, user_id):
+        """Write the segments that changed since the last save; raises on failure."""
+        with self.lock:
+            index = self.indexes.get(user_id)
+        if index is None:
+            return
+        # Serialized, so an older snapshot of a segment never lands after a newer one
+        with self.save_lock:
+            segments, removed = index.take_changes()
+            if not segments and not removed:
+                return
+            try:
+                with telemetry.span("search.save", segments=len(segments), removed=len(removed)):
+                    self.storage.save_search_index(user_id, segments, removed)
+            except Exception:
+                index.restore_changes(segments, removed)
+                raise
+    
+    def forget_user(self, user_id):
+        """Save and drop a user's in-memory index after any queued updates, e.g. on logout."""
+        self.executor.submit(self._save_and_forget, user_id)
+    
+    def _save_and_forget(self, user_id):
+        with self.lock:
+            timer = self.save_timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        try:
+            self.save(user_id)
+        except Exception:
+            telemetry.increment("errors", stage="search.save")
+            self._schedule_save(user_id)
+        with self.lock:
+            # Dropped only once nothing is scheduled for it again, so no change is lost
+            index = self.indexes.get(user_id)
+            if index is not None and not index.has_changes() and user_id not in self.save_timers:
+                del self.indexes[user_id]
+    
+    def shutdown(self):
+        """Save every user's pending changes; registered to run at interpreter exit."""
+        with self.lock:
+            timers = list(self.save_timers.values())
+            self.save_timers.clear()
+            user_ids = list(self.indexes)
+        for timer in timers:
+            timer.cancel()
+        for user_id in user_ids:
+            try:
+                self.save(user_id)
+            except Exception:
+                telemetry.increment("errors", stage="search.save")
+
+@st.cache_resource
+def get_chat_search():
+    """Get the process-wide chat search service."""
+    return ChatSearch(get_chat_storage(), SEARCH_CONFIG["save_delay"])
@@ -0,0 +1,132 @@
+import streamlit as st
+from config import STORAGE_CONFIG
+
+class ChatStorage:
+    """Interface ChatManager and the persistence queue use to store chats, by (user_id, chat_name) and message seq."""
+    
+    # Methods that raise on failure never report through the UI, so the persistence
+    # queue, chat search and login prefetch can call them from background threads
+    
+    def is_connected(self):
+        """Check whether the store can currently be used."""
+        raise NotImplementedError
+    
+    def get_health(self):
+        """Get the connection state ("uninitialized", "connected" or "failed") and last error."""
+        raise NotImplementedError
+    
+    def load_chat_index(self, user_id):
+        """Load ({chat_name: {"message_count", "updated_at", "version", "epoch"}}, active_chat) without messages."""
+        raise NotImplementedError
+    
+    def get_chat_versions(self, user_id):
+        """Get {chat_name: {"message_count", "version", "epoch"}} for every chat; raises on failure."""
+        raise NotImplementedError
+    
+    def watch_chats(self, user_id, callback):
+        """Call callback(versions) whenever a chat changes; returns an unsubscribe function, or None if the store must be polled."""
+        return None
+    
+    def load_chat_messages(self, user_id, chat_name, before_seq=None, limit=None):
+        """Load (messages, first_seq) for the last `limit` messages below before_seq; raises on failure."""
+        raise NotImplementedError
+    
+    def load_chat_messages_since(self, user_id, chat_name, from_seq):
+        """Load the messages of a chat from seq from_seq onwards; raises on failure."""
+        raise NotImplementedError
+    
+    def write_chat_changes(self, chat_sessions, chat_offsets, active_chat, user_id, user_name, sync_state):
+        """Write what changed since the last save and update sync_state; returns the chats skipped because they changed in storage, raises on failure."""
+        raise NotImplementedError
+    
+    def load_search_index(self, user_id):
+        """Load the user's search index as {chat_name: {start_seq: segment}}; raises on failure."""
+        raise NotImplementedError
+    
+    def save_search_index(self, user_id, segments, removed):
+        """Write {(chat_name, start_seq): segment}, JSON-serializable, and delete the segments in removed; raises on failure."""
+        raise NotImplementedError
+    
+    def load_context_summary(self, user_id, chat_name):
+        """Load a chat's rolling prompt summary {"epoch", "upto", "anchor", "summary"}, or None; raises on failure."""
+        raise NotImplementedError
+    
+    def save_context_summary(self, user_id, chat_name, summary):
+        """Store a chat's rolling prompt summary, replacing the previous one; raises on failure."""
+        raise NotImplementedError
+    
+    def export_chats(self, user_id):
+        """Export all of a user's chats as {"active_chat": name, "chats": {chat_name: [messages]}}."""
+        raise NotImplementedError
+
+def plan_chat_writes(chat_sessions, chat_offsets, sync_state):
+    """Work out (rewrites, appends, deletions) for a save, given what sync_state says is stored."""
+    counts = sync_state.setdefault("counts", {})
+    replaced = set(sync_state.setdefault("replaced", set()))
+    deleted = sync_state.setdefault("deleted", set())
+    # rewrites and appends map chat_name to {"writes": [(seq, message)], "message_count"}; rewrites
+    # also carry the "stale_seqs" to delete and whether the chat is "created". Appends are only
+    # applied while the stored version still matches. deletions maps chat_name to its stored count.
+    rewrites, appends, deletions = {}, {}, {}
+    
+    for chat_name in deleted:
+        if chat_name in chat_sessions:
+            # Deleted and created again under the same name: rewrite it in place
+            replaced.add(chat_name)
+        elif chat_name in counts:
+            deletions[chat_name] = counts[chat_name]
+    
+    for chat_name, messages in chat_sessions.items():
+        offset = chat_offsets.get(chat_name, 0)
+        total = offset + len(messages)
+        persisted = counts.get(chat_name)
+        if persisted == total and chat_name not in replaced:
+            continue
+        
+        if persisted is None or chat_name in replaced or total < persisted:
+            # New or rewritten chat: write every message, drop any leftovers
+            rewrites[chat_name] = {
+                "writes": [(seq, messages[seq - offset]) for seq in range(offset, total)],
+                "stale_seqs": range(total, persisted or 0),
+                "message_count": total,
+                "created": persisted is None
+            }
+        else:
+            appends[chat_name] = {
+                "writes": [(seq, messages[seq - offset]) for seq in range(persisted, total)],
+                "message_count": total
+            }
+    return rewrites, appends, deletions
+
+def next_chat_version(stored, rewrite):
+    """The {"version", "epoch"} a chat gets when written over its stored state (None if new)."""
+    stored = stored or {}
+    version = stored.get("version", 0) + 1
+    epoch = stored.get("epoch", 0) + 1 if rewrite else stored.get("epoch", 0)
+    return {"version": version, "epoch": epoch}
+
+def record_chat_writes(sync_state, written, deletions, active_chat):
+    """Update sync_state after a successful write; written leaves out appends skipped as conflicts."""
+    counts = sync_state.setdefault("counts", {})
+    versions = sync_state.setdefault("versions", {})
+    epochs = sync_state.setdefault("epochs", {})
+    for chat_name in deletions:
+        for field in (counts, versions, epochs):
+            field.pop(chat_name, None)
+    for chat_name, stored in written.items():
+        counts[chat_name] = stored["message_count"]
+        versions[chat_name] = stored["version"]
+        epochs[chat_name] = stored["epoch"]
+    sync_state["replaced"] = set()
+    sync_state["deleted"] = set()
+    sync_state["active_chat"] = active_chat
+
+@st.cache_resource
+def get_chat_storage():
+    """Get the process-wide chat store selected by STORAGE_CONFIG["backend"]."""
+    if STORAGE_CONFIG["backend"] == "sqlite":
+        from sqlite_storage import SQLiteChatStorage
+        return SQLiteChatStorage(STORAGE_CONFIG["sqlite_path"], STORAGE_CONFIG["sqlite_busy_timeout"])
+    
+    from firebase_service import get_firebase_service
+    return get_firebase_service()
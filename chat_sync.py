@@ -0,0 +1,67 @@
+import threading
+import time
+import streamlit as st
+from chat_storage import get_chat_storage
+from config import CHAT_CONFIG
+
+class ChatSync:
+    """Tracks the stored version and epoch of each signed-in user's chats, by snapshot listener or by polling."""
+    
+    def __init__(self, storage, poll_interval):
+        self.storage = storage
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        # Every write bumps a chat's version; clearing, deleting or recreating it also bumps its epoch
+        self.versions = {}
+        self.polled_at = {}
+        self.unsubscribes = {}
+    
+    def watch(self, user_id):
+        """Start following a user's chats, if the store can push changes."""
+        with self.lock:
+            if user_id in self.unsubscribes:
+                return
+            self.unsubscribes[user_id] = None
+        
+        try:
+            unsubscribe = self.storage.watch_chats(user_id, lambda versions: self._on_change(user_id, versions))
+        except Exception:
+            unsubscribe = None  # Fall back to polling
+        with self.lock:
+            self.unsubscribes[user_id] = unsubscribe
+    
+    def _on_change(self, user_id, versions, seen_at=None):
+        with self.lock:
+            self.versions[user_id] = versions
+            self.polled_at[user_id] = seen_at or time.monotonic()
+    
+    def get_versions(self, user_id, newer_than=None):
+        """Get {chat_name: {"message_count", "version", "epoch"}} as last seen, or None if nothing since newer_than; raises on failure."""
+        self.watch(user_id)
+        with self.lock:
+            watched = self.unsubscribes.get(user_id) is not None
+            polled_at = self.polled_at.get(user_id, float("-inf"))
+            current = user_id in self.versions and polled_at >= (newer_than or float("-inf"))
+            if current and (watched or time.monotonic() - polled_at < self.poll_interval):
+                return self.versions[user_id]
+            if watched and user_id in self.versions:
+                return None
+        
+        started_at = time.monotonic()
+        versions = self.storage.get_chat_versions(user_id)
+        self._on_change(user_id, versions, started_at)
+        return versions
+    
+    def forget_user(self, user_id):
+        """Stop following a user's chats, e.g. on logout."""
+        with self.lock:
+            unsubscribe = self.unsubscribes.pop(user_id, None)
+            self.versions.pop(user_id, None)
+            self.polled_at.pop(user_id, None)
+        if unsubscribe is not None:
+            unsubscribe()
+
+@st.cache_resource
+def get_chat_sync():
+    """Get the process-wide chat version tracker."""
+    return ChatSync(get_chat_storage(), CHAT_CONFIG["sync_poll_interval"])
@@ -1,5 +1,4 @@
 import os
-from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -28,21 +27,117 @@ FIREBASE_CONFIG = {
     "universe_domain": os.getenv("FIREBASE_UNIVERSE_DOMAIN", "googleapis.com"),
     "collection_users": "users",
     "collection_chats": "chats",
-    "document_history": "history"
+    "document_history": "history",  # legacy single-document layout, migrated on load
+    "collection_messages": "messages",
+    "collection_search_segments": "search_segments",  # one document per segment of a chat's search index
+    "collection_context_summaries": "context_summaries",  # one document per chat: the summary of messages cut from its prompts
+    "batch_size": 450,  # Firestore allows at most 500 writes per batch
+    "init_retry_interval": 30  # seconds before retrying a failed Firebase start-up
+}
+
+# CHAT STORAGE CONFIGURATION
+STORAGE_CONFIG = {
+    "backend": os.getenv("CHAT_STORAGE_BACKEND", "firestore").lower(),  # "firestore" or "sqlite"
+    "sqlite_path": os.getenv("CHAT_SQLITE_PATH", "chats.db"),
+    "sqlite_busy_timeout": float(os.getenv("CHAT_SQLITE_BUSY_TIMEOUT", "5")),  # seconds to wait on a locked database
+    "compression_threshold": int(os.getenv("CHAT_COMPRESSION_THRESHOLD", "1024")),  # bytes; smaller message bodies are stored as-is
+    "compression_level": int(os.getenv("CHAT_COMPRESSION_LEVEL", "6"))  # zlib level, 1 (fastest) to 9 (smallest)
 }
 
 # OLLAMA CONFIGURATION
 OLLAMA_CONFIG = {
     "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+    # Comma-separated list of Ollama servers to route across; defaults to base_url alone
+    "base_urls": [
+        url.strip()
+        for url in os.getenv("OLLAMA_BASE_URLS", os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")).split(",")
+        if url.strip()
+    ],
+    "health_check_interval": int(os.getenv("OLLAMA_HEALTH_CHECK_INTERVAL", "15")),  # seconds
+    "model_list_ttl": int(os.getenv("OLLAMA_MODEL_LIST_TTL", "30")),  # seconds
+    "http_pool_size": int(os.getenv("OLLAMA_HTTP_POOL_SIZE", "20")),
     "timeout": int(os.getenv("OLLAMA_TIMEOUT", "10")),
-    "default_temperature": float(os.getenv("OLLAMA_DEFAULT_TEMPERATURE", "0.3"))
+    "default_temperature": float(os.getenv("OLLAMA_DEFAULT_TEMPERATURE", "0.3")),
+    "keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    # Per-model overrides, e.g. OLLAMA_MODEL_KEEP_ALIVE="llama3.1:8b=2h,llama3.2:3b=-1"
+    "model_keep_alive": dict(
+        item.strip().rsplit("=", 1)
+        for item in os.getenv("OLLAMA_MODEL_KEEP_ALIVE", "").split(",")
+        if "=" in item
+    ),
+    "warm_up_on_select": os.getenv("OLLAMA_WARM_UP", "true").lower() == "true",
+    "warm_up_timeout": int(os.getenv("OLLAMA_WARM_UP_TIMEOUT", "300")),
+    "cold_load_threshold": 0.5  # seconds of load_duration that count as a cold load
 }
 
 # CHAT CONFIGURATION
 CHAT_CONFIG = {
     "default_chat_name": "default",
     "max_chat_history": 100,
-    "auto_save_interval": 30  # seconds
+    "auto_save_interval": int(os.getenv("CHAT_AUTO_SAVE_INTERVAL", "30")),  # seconds between background flushes
+    "stream_responses": os.getenv("CHAT_STREAM_RESPONSES", "true").lower() == "true",
+    "stream_cursor": "▌",
+    "history_page_size": int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50")),  # messages fetched per page when opening a chat
+    "render_window": int(os.getenv("CHAT_RENDER_WINDOW", "20")),  # most recent messages rendered; "show earlier" adds as many again
+    "sync_enabled": os.getenv("CHAT_SYNC_ENABLED", "true").lower() == "true",  # pick up other tabs' messages
+    "sync_poll_interval": float(os.getenv("CHAT_SYNC_POLL_INTERVAL", "5"))  # seconds between checks for remote changes
+}
+
+# CHAT SEARCH CONFIGURATION
+SEARCH_CONFIG = {
+    "enabled": os.getenv("CHAT_SEARCH_ENABLED", "true").lower() == "true",
+    "max_results": int(os.getenv("CHAT_SEARCH_MAX_RESULTS", "10")),
+    "preview_chars": 120,  # start of each message kept in the index to show with a hit
+    "bm25_k1": 1.2,
+    "bm25_b": 0.75,
+    # A segment is closed at this many messages or terms, keeping each stored document small
+    "segment_messages": 200,
+    "segment_terms": 50000,
+    "save_delay": float(os.getenv("CHAT_SEARCH_SAVE_DELAY", "30"))  # seconds changes wait so several turns share one write
+}
+
+# CONTEXT WINDOW CONFIGURATION
+CONTEXT_CONFIG = {
+    "default_num_ctx": int(os.getenv("OLLAMA_NUM_CTX", "4096")),
+    "model_num_ctx": {
+        "llama3.1:8b": 8192,
+        "llama3:8b": 8192,
+        "llama3.2:3b": 8192,
+        "llama3.2:1b": 8192
+    },
+    "chars_per_token": 4,
+    "message_overhead_tokens": 4,
+    "response_reserve_tokens": int(os.getenv("CONTEXT_RESPONSE_RESERVE_TOKENS", "1024")),
+    "summary_max_tokens": 256,
+    "summary_input_chars_per_message": 1000,
+    "low_watermark": 0.6  # fraction of the budget kept after evicting old turns
+}
+
+# RESPONSE CACHE CONFIGURATION
+CACHE_CONFIG = {
+    "enabled": os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true",
+    "max_entries": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+    "ttl_seconds": int(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    "disk_path": os.getenv("RESPONSE_CACHE_PATH"),  # SQLite file; unset keeps the cache in memory only
+    "cache_nonzero_temperature": os.getenv("RESPONSE_CACHE_NONZERO_TEMPERATURE", "false").lower() == "true"
+}
+
+# SCHEDULER CONFIGURATION
+SCHEDULER_CONFIG = {
+    "max_in_flight_per_backend": int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", "2")),
+    "max_queue_size": int(os.getenv("SCHEDULER_MAX_QUEUE", "32")),
+    "max_queue_per_user": int(os.getenv("SCHEDULER_MAX_QUEUE_PER_USER", "2")),
+    "queue_timeout": int(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "120")),  # seconds
+    "poll_interval": 0.5  # seconds between queue position updates
+}
+
+# TELEMETRY CONFIGURATION
+TELEMETRY_CONFIG = {
+    "enabled": os.getenv("TELEMETRY_ENABLED", "false").lower() == "true",
+    "jsonl_path": os.getenv("TELEMETRY_JSONL_PATH"),  # one JSON line per span
+    "prometheus_port": int(os.getenv("TELEMETRY_PROMETHEUS_PORT", "0")),  # serves /metrics; 0 disables
+    "prometheus_host": os.getenv("TELEMETRY_PROMETHEUS_HOST", "127.0.0.1"),  # the endpoint has no auth; widen with care
+    "histogram_buckets": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
 }
 
 # UI CONFIGURATION
@@ -58,6 +153,10 @@ UI_CONFIG = {
 SYSTEM_PROMPT = """You are an expert AI coding assistant. Provide concise, correct solutions 
 with strategic print statements for debugging. Always respond in English."""
 
+# CONTEXT SUMMARY PROMPT
+CONTEXT_SUMMARY_PROMPT = """Summarize the earlier part of this coding conversation for your own reference.
+Keep code identifiers, file names, error messages and decisions that were made. Be brief."""
+
 # WELCOME MESSAGES
 WELCOME_MESSAGES = {
     "default": "Hi {user_name}! I'm your personal LLM. How can I help you code today?",
@@ -68,12 +167,17 @@ WELCOME_MESSAGES = {
 ERROR_MESSAGES = {
     "firebase_init_failed": "Failed to initialize Firebase: {error}",
     "firebase_connection_failed": "Firebase not initialized. Please check your configuration.",
+    "storage_init_failed": "Failed to open chat storage: {error}",
     "user_not_found": "User not found in database.",
     "model_connection_failed": "Failed to connect to model {model}: {error}",
     "no_valid_model": "No valid model selected. Please check your Ollama connection.",
     "response_generation_failed": "Error generating response: {error}",
     "chat_save_failed": "Failed to save chat history to Firebase: {error}",
-    "chat_load_failed": "Could not load chat history from Firebase: {error}"
+    "chat_load_failed": "Could not load chat history from Firebase: {error}",
+    "search_failed": "Could not search your chats: {error}",
+    "queue_full": "⏳ The server is busy right now. Please try again in a moment.",
+    "queue_timeout": "⏳ Timed out waiting for the model. Please try again.",
+    "no_healthy_backend": "No Ollama server is reachable right now. Please try again shortly."
 }
 
 # SUCCESS MESSAGES
@@ -83,7 +187,8 @@ SUCCESS_MESSAGES = {
     "user_created": "User {display_name} created successfully!",
     "login_successful": "Login successful!",
     "firebase_connected": "🔥 Firebase Connected",
-    "model_available": "✅ {model} is available"
+    "model_available": "✅ {model} is available",
+    "model_warm": "🔥 Warm · last load {load:.2f}s · cold load {cold_load}"
 }
 
 # WARNING MESSAGES
@@ -91,5 +196,7 @@ WARNING_MESSAGES = {
     "firebase_not_initialized": "Firebase not initialized. Starting with empty chat history.",
     "no_chat_history": "No existing chat history found for this user.",
     "model_unavailable": "⚠️ {model} may not be available",
-    "ollama_fetch_failed": "Could not fetch models from Ollama: {error}"
+    "ollama_fetch_failed": "Could not fetch models from Ollama: {error}",
+    "model_warming": "⏳ Loading {model} into memory...",
+    "queue_position": "⏳ Waiting for the model... you are #{position} in the queue"
 } 
\ No newline at end of file
@@ -0,0 +1,181 @@
+import hashlib
+import math
+import streamlit as st
+from langchain_core.messages import SystemMessage, HumanMessage
+from chat_storage import get_chat_storage
+from telemetry import telemetry
+from config import CONTEXT_CONFIG, CHAT_CONFIG, ERROR_MESSAGES, SYSTEM_PROMPT, CONTEXT_SUMMARY_PROMPT
+
+class ContextWindowManager:
+    def __init__(self):
+        self.chars_per_token = CONTEXT_CONFIG["chars_per_token"]
+        self.message_overhead = CONTEXT_CONFIG["message_overhead_tokens"]
+        self.response_reserve = CONTEXT_CONFIG["response_reserve_tokens"]
+        self.summary_max_tokens = CONTEXT_CONFIG["summary_max_tokens"]
+        self.low_watermark = CONTEXT_CONFIG["low_watermark"]
+        self.max_messages = CHAT_CONFIG["max_chat_history"]
+        self.storage = get_chat_storage()
+    
+    @staticmethod
+    def get_num_ctx(model_name):
+        """Get the context window size (in tokens) for a model."""
+        return CONTEXT_CONFIG["model_num_ctx"].get(model_name, CONTEXT_CONFIG["default_num_ctx"])
+    
+    def estimate_tokens(self, text):
+        """Cheap token estimate; good enough for budgeting without a tokenizer."""
+        return math.ceil(len(text) / self.chars_per_token) + self.message_overhead
+    
+    def get_token_budget(self, model_name):
+        """Tokens available for chat history after the system prompt, summary and reply."""
+        budget = self.get_num_ctx(model_name) - self.response_reserve
+        budget -= self.estimate_tokens(SYSTEM_PROMPT) + self.summary_max_tokens
+        return max(budget, 0)
+    
+    def get_history(self, active_chat, messages):
+        """Get (first_seq, history) to build a prompt from: the loaded messages, after any older ones the summary doesn't cover."""
+        offset = st.session_state.get("chat_offsets", {}).get(active_chat, 0)
+        summary = self._get_summary(active_chat)
+        # From the summary's anchor message on; without a summary, the last max_chat_history messages
+        history_start = max(summary["upto"] - 1 if summary else offset + len(messages) - self.max_messages, 0)
+        if history_start >= offset:
+            return offset, messages
+        
+        # Older messages are kept apart from chat_sessions, so the chat pane's paging is unaffected
+        earlier_pages = st.session_state.setdefault("context_history", {})
+        earlier = earlier_pages.get(active_chat)
+        if earlier is None or earlier["first_seq"] > history_start or earlier["first_seq"] + len(earlier["messages"]) < offset:
+            try:
+                earlier_messages, first_seq = self.storage.load_chat_messages(
+                    st.session_state.get("user_uid"), active_chat, before_seq=offset, limit=offset - history_start
+                )
+            except Exception as e:
+                st.warning(ERROR_MESSAGES["chat_load_failed"].format(error=e))
+                return offset, messages
+            earlier = earlier_pages[active_chat] = {"first_seq": first_seq, "messages": earlier_messages}
+        
+        earlier_messages = earlier["messages"][max(history_start - earlier["first_seq"], 0):offset - earlier["first_seq"]]
+        return offset - len(earlier_messages), earlier_messages + messages
+    
+    def build_context(self, active_chat, messages, first_seq, model_name, summarize):
+        """Pick the history window to send and summarize what falls before it; returns (summary, start)."""
+        # messages starts at seq first_seq; messages[start:] are sent verbatim and summary is None when nothing was evicted
+        budget = self.get_token_budget(model_name)
+        required_start = self._find_window_start(messages, budget)
+        cached = self._get_summary(active_chat)
+        upto = cached["upto"] - first_seq if cached else 0
+        if cached and not self._is_anchor_valid(cached, messages, upto):
+            cached, upto = None, 0
+        if cached is None and required_start == 0:
+            return None, 0
+        
+        # Reuse the cached cut-off while it still fits, so the prompt stays stable between turns
+        if cached and required_start <= upto < len(messages):
+            return cached["summary"], upto
+        
+        # Evict down to the low watermark so we summarize every few turns, not every turn
+        start = max(self._find_window_start(messages, int(budget * self.low_watermark)), required_start)
+        start = min(start, len(messages) - 1)
+        
+        if cached and upto > start:
+            cached, upto = None, 0
+        
+        previous_summary = cached["summary"] if cached else None
+        summary = self._summarize(previous_summary, messages[upto:start], summarize)
+        
+        record = {
+            "epoch": self._get_epoch(active_chat),
+            "upto": first_seq + start,
+            "anchor": self._message_hash(messages[start - 1]),
+            "summary": summary
+        }
+        st.session_state.context_summaries[active_chat] = record
+        self._save_summary(active_chat, record)
+        return summary, start
+    
+    def invalidate(self, chat_name=None):
+        """Drop the cached summary and older messages for one chat, or for all chats."""
+        for key in ("context_summaries", "context_history"):
+            cache = st.session_state.get(key, {})
+            if chat_name is None:
+                cache.clear()
+            else:
+                cache.pop(chat_name, None)
+    
+    @staticmethod
+    def _get_epoch(chat_name):
+        return st.session_state.get("chat_sync_state", {}).get("epochs", {}).get(chat_name, 0)
+    
+    def _get_summary(self, chat_name):
+        """Get a chat's summary for its current epoch, reading it from storage the first time; None if there is none."""
+        summaries = st.session_state.setdefault("context_summaries", {})
+        if chat_name not in summaries:
+            user_id = st.session_state.get("user_uid")
+            try:
+                summaries[chat_name] = self.storage.load_context_summary(user_id, chat_name) if user_id else None
+            except Exception:
+                telemetry.increment("errors", stage="context.load_summary")
+                return None
+        summary = summaries[chat_name]
+        if summary is None or summary["epoch"] != self._get_epoch(chat_name):
+            return None
+        return summary
+    
+    def _save_summary(self, chat_name, record):
+        """Store the summary with the chat, so a later session starts from it instead of the whole history."""
+        user_id = st.session_state.get("user_uid")
+        if not user_id:
+            return
+        try:
+            self.storage.save_context_summary(user_id, chat_name, record)
+        except Exception:
+            # Only costs a longer history fetch, and a summary of it, in the next session
+            telemetry.increment("errors", stage="context.save_summary")
+    
+    def _find_window_start(self, messages, budget):
+        """Index of the oldest message that still fits in the budget (newest first)."""
+        used = 0
+        start = len(messages)
+        oldest_allowed = max(len(messages) - self.max_messages, 0)
+        
+        while start > oldest_allowed:
+            cost = self.estimate_tokens(messages[start - 1]["content"])
+            # Always keep the latest message, even if it alone blows the budget
+            if used + cost > budget and start < len(messages):
+                break
+            used += cost
+            start -= 1
+        return start
+    
+    def _is_anchor_valid(self, cached, messages, upto):
+        """Check that the history before the cut-off, messages[upto - 1], is the one we summarized."""
+        if upto < 1 or upto > len(messages):
+            return False
+        return self._message_hash(messages[upto - 1]) == cached["anchor"]
+    
+    @staticmethod
+    def _message_hash(message):
+        return hashlib.sha1(f"{message['role']}:{message['content']}".encode("utf-8")).hexdigest()
+    
+    def _summarize(self, previous_summary, evicted_messages, summarize):
+        """Fold newly evicted messages into the rolling summary."""
+        max_chars = CONTEXT_CONFIG["summary_input_chars_per_message"]
+        transcript = []
+        if previous_summary:
+            transcript.append(f"Summary so far:\n{previous_summary}")
+        for msg in evicted_messages:
+            transcript.append(f"{msg['role']}: {msg['content'][:max_chars]}")
+        transcript = "\n\n".join(transcript)
+        
+        try:
+            with st.spinner("🧠 Summarizing earlier messages..."):
+                summary = summarize([
+                    SystemMessage(content=CONTEXT_SUMMARY_PROMPT),
+                    HumanMessage(content=transcript)
+                ]).strip()
+        except Exception:
+            summary = ""
+        
+        if not summary:
+            # Extractive fallback keeps the request going if the model can't summarize
+            summary = transcript
+        return summary[:self.summary_max_tokens * self.chars_per_token]
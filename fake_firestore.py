@@ -0,0 +1,367 @@
+"""
+In-memory stand-in for the Firestore client, for tests, benchmarks and local tool runs.
+
+Covers the subset of the google-cloud-firestore API this app uses. Every RPC
+can be given an artificial latency to approximate a WAN round-trip, and reads
+and writes are counted the way Firestore bills them.
+"""
+
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+class FakeFirestore:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.documents = {}
+        self.lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.round_trips = 0
+        self.watches = []
+    
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+    
+    def batch(self):
+        return FakeWriteBatch(self)
+    
+    def transaction(self):
+        return FakeTransaction(self)
+    
+    def reset_counters(self):
+        with self.lock:
+            self.reads = self.writes = self.round_trips = 0
+    
+    def _round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+    
+    def _children(self, collection_path):
+        prefix = collection_path + "/"
+        with self.lock:
+            return sorted(
+                (path, data) for path, data in self.documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            )
+    
+    def _write(self, path, data, merge=False):
+        with self.lock:
+            self.writes += 1
+            current = self.documents.get(path) if merge else None
+            self.documents[path] = _apply_transforms(current, data)
+    
+    def _delete(self, path):
+        with self.lock:
+            self.writes += 1
+            self.documents.pop(path, None)
+    
+    def _notify(self, paths):
+        """Send a fresh snapshot to every listener on a collection that changed."""
+        collection_paths = {path.rsplit("/", 1)[0] for path in paths}
+        with self.lock:
+            watches = [watch for watch in self.watches if watch.path in collection_paths]
+        for watch in watches:
+            watch.send()
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+    
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+    
+    def get(self, transaction=None):
+        self._client._round_trip()
+        with self._client.lock:
+            self._client.reads += 1
+            data = copy.deepcopy(self._client.documents.get(self.path))
+        return FakeDocumentSnapshot(self, data)
+    
+    def set(self, data, merge=False):
+        self._client._round_trip()
+        self._client._write(self.path, data, merge=merge)
+        self._client._notify([self.path])
+    
+    def update(self, data):
+        self._client._round_trip()
+        with self._client.lock:
+            if self.path not in self._client.documents:
+                raise KeyError(f"No document to update: {self.path}")
+            self._client._write(self.path, data, merge=True)
+        self._client._notify([self.path])
+    
+    def delete(self):
+        self._client._round_trip()
+        self._client._delete(self.path)
+        self._client._notify([self.path])
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+    
+    @property
+    def exists(self):
+        return self._data is not None
+    
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+    
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+class FakeQuery:
+    def __init__(self, client, path, filters=(), orders=(), limit_count=None, start_after_values=None):
+        self._client = client
+        self._path = path
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit_count
+        self._start_after = start_after_values
+    
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit_count": self._limit,
+            "start_after_values": self._start_after
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._path, **state)
+    
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+    
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field_path, str(direction).upper().endswith("DESCENDING"))])
+    
+    def limit(self, count):
+        return self._copy(limit_count=count)
+    
+    def start_after(self, document_fields):
+        if isinstance(document_fields, FakeDocumentSnapshot):
+            document_fields = document_fields.to_dict()
+        return self._copy(start_after_values=document_fields)
+    
+    def stream(self, transaction=None):
+        self._client._round_trip()
+        results = []
+        for path, data in self._client._children(self._path):
+            if all(_matches(data.get(field), op, value) for field, op, value in self._filters):
+                results.append((path, data))
+        
+        for field, descending in reversed(self._orders):
+            results.sort(key=lambda item: _sort_key(item[1].get(field)), reverse=descending)
+        
+        if self._start_after is not None and self._orders:
+            anchor = tuple(_sort_key(self._start_after.get(field)) for field, _ in self._orders)
+            
+            def is_after(data):
+                for (field, descending), anchor_value in zip(self._orders, anchor):
+                    value = _sort_key(data.get(field))
+                    if value != anchor_value:
+                        return value < anchor_value if descending else value > anchor_value
+                return False
+            
+            results = [item for item in results if is_after(item[1])]
+        
+        if self._limit is not None:
+            results = results[:self._limit]
+        
+        with self._client.lock:
+            self._client.reads += max(len(results), 1)
+        return iter([
+            FakeDocumentSnapshot(FakeDocumentReference(self._client, path), copy.deepcopy(data))
+            for path, data in results
+        ])
+    
+    def get(self, transaction=None):
+        return list(self.stream())
+    
+    def on_snapshot(self, callback):
+        """Call callback(snapshots, changes, read_time) now and after every write to the collection."""
+        watch = FakeWatch(self, callback)
+        with self._client.lock:
+            self._client.watches.append(watch)
+        watch.send()
+        return watch
+
+class FakeWatch:
+    def __init__(self, query, callback):
+        self.query = query
+        self.path = query._path
+        self.callback = callback
+    
+    def send(self):
+        snapshots = list(self.query.stream())
+        self.callback(snapshots, [], datetime.now(timezone.utc))
+    
+    def unsubscribe(self):
+        with self.query._client.lock:
+            if self in self.query._client.watches:
+                self.query._client.watches.remove(self)
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+    
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+    
+    def add(self, data):
+        reference = self.document()
+        reference.set(data)
+        return None, reference
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._operations = []
+    
+    def set(self, reference, data, merge=False):
+        self._operations.append(("set", reference.path, data, merge))
+    
+    def update(self, reference, data):
+        self._operations.append(("set", reference.path, data, True))
+    
+    def delete(self, reference):
+        self._operations.append(("delete", reference.path, None, False))
+    
+    def __len__(self):
+        return len(self._operations)
+    
+    def commit(self):
+        self._client._round_trip()
+        with self._client.lock:
+            for operation, path, data, merge in self._operations:
+                if operation == "delete":
+                    self._client._delete(path)
+                else:
+                    self._client._write(path, data, merge=merge)
+        self._client._notify([path for _, path, _, _ in self._operations])
+        self._operations = []
+
+class TransactionConflict(Exception):
+    pass
+
+class FakeTransaction(FakeWriteBatch):
+    """Optimistic transaction: commit fails if a document it read has changed since."""
+    
+    def __init__(self, client):
+        super().__init__(client)
+        self._read = {}
+    
+    def get_all(self, references):
+        self._client._round_trip()
+        with self._client.lock:
+            snapshots = []
+            for reference in references:
+                self._client.reads += 1
+                data = copy.deepcopy(self._client.documents.get(reference.path))
+                self._read[reference.path] = copy.deepcopy(data)
+                snapshots.append(FakeDocumentSnapshot(reference, data))
+        return iter(snapshots)
+    
+    def commit(self):
+        self._client._round_trip()
+        with self._client.lock:
+            for path, data in self._read.items():
+                if self._client.documents.get(path) != data:
+                    self._operations = []
+                    raise TransactionConflict(path)
+            for operation, path, data, merge in self._operations:
+                if operation == "delete":
+                    self._client._delete(path)
+                else:
+                    self._client._write(path, data, merge=merge)
+        self._client._notify([path for _, path, _, _ in self._operations])
+        self._operations = []
+
+def transactional(function, max_attempts=5):
+    """Stand-in for firestore.transactional: retry the function until its commit succeeds."""
+    def run(transaction, *args, **kwargs):
+        for attempt in range(max_attempts):
+            if attempt:
+                transaction = FakeTransaction(transaction._client)
+            result = function(transaction, *args, **kwargs)
+            try:
+                transaction.commit()
+                return result
+            except TransactionConflict:
+                continue
+        raise TransactionConflict(f"Transaction failed after {max_attempts} attempts")
+    return run
+
+def _apply_transforms(current, data):
+    """Resolve SERVER_TIMESTAMP/Increment sentinels the way Firestore would."""
+    result = copy.deepcopy(current) if current else {}
+    for key, value in data.items():
+        kind = type(value).__name__
+        if kind == "Sentinel":
+            result[key] = datetime.now(timezone.utc)
+        elif kind == "Increment":
+            result[key] = (result.get(key) or 0) + value.value
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+def _matches(actual, op, expected):
+    if op == "==":
+        return actual == expected
+    if op == "!=":
+        return actual != expected
+    if op == "in":
+        return actual in expected
+    if actual is None:
+        return False
+    if op == "<":
+        return actual < expected
+    if op == "<=":
+        return actual <= expected
+    if op == ">":
+        return actual > expected
+    if op == ">=":
+        return actual >= expected
+    raise ValueError(f"Unsupported operator: {op}")
+
+def _sort_key(value):
+    # None sorts first, like Firestore's null ordering
+    return (value is not None, value if value is not None else 0)
+
+class FakeAuthUser:
+    def __init__(self, uid, email, display_name=None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+
+def install(latency=0.0):
+    """Make FirebaseService and Firebase Auth lookups use an in-memory client; returns the shared FakeFirestore."""
+    import firebase_admin
+    from firebase_admin import firestore, auth
+    
+    client = FakeFirestore(latency=latency)
+    if not firebase_admin._apps:
+        firebase_admin._apps["[DEFAULT]"] = object()
+    firestore.client = lambda *args, **kwargs: client
+    firestore.transactional = transactional
+    
+    def get_user_by_email(email, app=None):
+        client._round_trip()
+        for _, data in client._children("users"):
+            if data.get("email") == email:
+                return FakeAuthUser(data.get("uid"), email, data.get("display_name"))
+        raise auth.UserNotFoundError(f"No user record found for the provided email: {email}")
+    
+    auth.get_user_by_email = get_user_by_email
+    return client
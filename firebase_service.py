@@ -1,39 +1,110 @@
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
-from datetime import datetime
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from config import FIREBASE_CONFIG, ERROR_MESSAGES, SUCCESS_MESSAGES, WARNING_MESSAGES
+from chat_storage import ChatStorage, plan_chat_writes, record_chat_writes, next_chat_version
+from message_codec import encode_content, decode_content
+from telemetry import telemetry
+from config import FIREBASE_CONFIG, CHAT_CONFIG, ERROR_MESSAGES, SUCCESS_MESSAGES, WARNING_MESSAGES
 
-class FirebaseService:
+class ProfileCache:
+    """In-process cache of user profile documents by uid, filled at login and dropped at logout."""
+    
     def __init__(self):
-        self.db = None
-        self.initialize_firebase()
+        self.lock = threading.Lock()
+        self.profiles = {}
+    
+    def get(self, user_id):
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            return dict(profile) if profile else None
+    
+    def set(self, user_id, profile):
+        with self.lock:
+            self.profiles[user_id] = dict(profile)
+    
+    def update(self, user_id, fields):
+        with self.lock:
+            if user_id in self.profiles:
+                self.profiles[user_id].update(fields)
+    
+    def invalidate(self, user_id):
+        with self.lock:
+            self.profiles.pop(user_id, None)
+
+@st.cache_resource
+def get_profile_cache():
+    """Get the process-wide user profile cache."""
+    return ProfileCache()
+
+class FirebaseService(ChatStorage):
+    """Firestore chat storage and Firebase Auth, shared by every session and connected on first use."""
+    
+    def __init__(self):
+        self._db = None
+        self.status = "uninitialized"
+        self.last_error = None
+        self.last_init_attempt = None
+        self.init_lock = threading.Lock()
+        self.profile_cache = get_profile_cache()
+        # Runs the Firebase Auth lookup of a login next to its profile query
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="firebase-auth")
+    
+    @property
+    def db(self):
+        """The Firestore client, or None if Firebase could not be initialized."""
+        if self._db is None:
+            self.initialize_firebase()
+        return self._db
     
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK."""
-        try:
-            if not firebase_admin._apps:
-                # Create credentials from environment variables
-                cred_dict = {
-                    "type": FIREBASE_CONFIG["type"],
-                    "project_id": FIREBASE_CONFIG["project_id"],
-                    "private_key_id": FIREBASE_CONFIG["private_key_id"],
-                    "private_key": FIREBASE_CONFIG["private_key"],
-                    "client_email": FIREBASE_CONFIG["client_email"],
-                    "client_id": FIREBASE_CONFIG["client_id"],
-                    "auth_uri": FIREBASE_CONFIG["auth_uri"],
-                    "token_uri": FIREBASE_CONFIG["token_uri"],
-                    "auth_provider_x509_cert_url": FIREBASE_CONFIG["auth_provider_x509_cert_url"],
-                    "client_x509_cert_url": FIREBASE_CONFIG["client_x509_cert_url"],
-                    "universe_domain": FIREBASE_CONFIG["universe_domain"]
-                }
-                cred = credentials.Certificate(cred_dict)
-                firebase_admin.initialize_app(cred)
-            self.db = firestore.client()
-            return True
-        except Exception as e:
-            st.error(ERROR_MESSAGES["firebase_init_failed"].format(error=e))
-            return False
+        with self.init_lock:
+            if self._db is not None:
+                return True
+            if self.status == "failed" and time.monotonic() - self.last_init_attempt < FIREBASE_CONFIG["init_retry_interval"]:
+                return False
+            self.last_init_attempt = time.monotonic()
+            
+            try:
+                with telemetry.span("firestore.initialize"):
+                    self._db = self._create_client()
+                self.status = "connected"
+                self.last_error = None
+                return True
+            except Exception as e:
+                self.status = "failed"
+                self.last_error = str(e)
+                return False
+    
+    @staticmethod
+    def _create_client():
+        if not firebase_admin._apps:
+            # Create credentials from environment variables
+            cred_dict = {
+                "type": FIREBASE_CONFIG["type"],
+                "project_id": FIREBASE_CONFIG["project_id"],
+                "private_key_id": FIREBASE_CONFIG["private_key_id"],
+                "private_key": FIREBASE_CONFIG["private_key"],
+                "client_email": FIREBASE_CONFIG["client_email"],
+                "client_id": FIREBASE_CONFIG["client_id"],
+                "auth_uri": FIREBASE_CONFIG["auth_uri"],
+                "token_uri": FIREBASE_CONFIG["token_uri"],
+                "auth_provider_x509_cert_url": FIREBASE_CONFIG["auth_provider_x509_cert_url"],
+                "client_x509_cert_url": FIREBASE_CONFIG["client_x509_cert_url"],
+                "universe_domain": FIREBASE_CONFIG["universe_domain"]
+            }
+            cred = credentials.Certificate(cred_dict)
+            firebase_admin.initialize_app(cred)
+        return firestore.client()
+    
+    def get_health(self):
+        """Get the connection state ("uninitialized", "connected" or "failed") and last error."""
+        return {"status": self.status, "error": self.last_error}
     
     def create_user_account(self, email, password, display_name):
         """Create a new user account using Firebase Auth."""
@@ -51,26 +122,26 @@ class FirebaseService:
                     "email": email,
                     "display_name": display_name,
                     "created_at": firestore.SERVER_TIMESTAMP,
-                    "last_login": firestore.SERVER_TIMESTAMP
+                    "last_login": firestore.SERVER_TIMESTAMP,
+                    "active_chat": "default"
                 }
                 
                 self.db.collection(FIREBASE_CONFIG["collection_users"]).document(user.uid).set(user_data)
                 
                 # Create default chat session
-                default_chat = {
-                    "default": [{"role": "ai", "content": f"Hi {display_name}! I'm your personal LLM. How can I help you code today?"}]
-                }
-                
-                chat_data = {
-                    "chat_sessions": default_chat,
-                    "active_chat": "default",
-                    "last_saved": datetime.now().isoformat(),
-                    "updated_at": firestore.SERVER_TIMESTAMP,
-                    "user_id": user.uid,
-                    "user_name": display_name
-                }
-                
-                self.db.collection(FIREBASE_CONFIG["collection_users"]).document(user.uid).collection(FIREBASE_CONFIG["collection_chats"]).document(FIREBASE_CONFIG["document_history"]).set(chat_data)
+                chat_ref = self._chat_ref(user.uid, "default")
+                writer = BatchWriter(self.db)
+                writer.set(chat_ref, {
+                    "name": "default",
+                    "message_count": 1,
+                    "created_at": firestore.SERVER_TIMESTAMP,
+                    "updated_at": firestore.SERVER_TIMESTAMP
+                })
+                writer.set(self._message_ref(chat_ref, 0), self._message_document(0, {
+                    "role": "ai",
+                    "content": f"Hi {display_name}! I'm your personal LLM. How can I help you code today?"
+                }))
+                writer.commit()
             
             return True, SUCCESS_MESSAGES["user_created"].format(display_name=display_name)
         except Exception as e:
@@ -80,20 +151,63 @@ class FirebaseService:
         """Get user information from Firebase."""
         try:
             if self.db:
-                users = self.db.collection(FIREBASE_CONFIG["collection_users"]).where('email', '==', email).limit(1).stream()
-                for user in users:
-                    return user.to_dict()
+                with telemetry.span("firestore.get_user_by_email"):
+                    users = self.db.collection(FIREBASE_CONFIG["collection_users"]).where('email', '==', email).limit(1).stream()
+                    for user in users:
+                        return user.to_dict()
             return None
         except Exception as e:
             st.error(f"Failed to get user: {e}")
             return None
     
+    def get_user_profile(self, user_id):
+        """Get a user's profile document by uid, from the cache when possible."""
+        profile = self.profile_cache.get(user_id)
+        if profile is not None:
+            return profile
+        
+        try:
+            if self.db:
+                with telemetry.span("firestore.get_user_profile"):
+                    doc = self._user_ref(user_id).get()
+                if doc.exists:
+                    profile = doc.to_dict()
+                    self.profile_cache.set(user_id, profile)
+                    return profile
+            return None
+        except Exception as e:
+            st.error(f"Failed to get user: {e}")
+            return None
+    
+    def cache_user_profile(self, profile):
+        """Keep a profile fetched at login for the rest of the session."""
+        self.profile_cache.set(profile["uid"], profile)
+    
+    def invalidate_user_profile(self, user_id):
+        """Forget a cached profile, e.g. on logout."""
+        self.profile_cache.invalidate(user_id)
+    
+    def sign_in(self, email, password):
+        """Check a user's credentials and fetch their profile concurrently; returns (success, message, profile)."""
+        with telemetry.span("auth.sign_in"):
+            # Both lookups need the Firebase app, so initialize it before starting either
+            if self.db is None:
+                return False, ERROR_MESSAGES["firebase_connection_failed"], None
+            credentials_check = self.executor.submit(self.verify_user_credentials, email, password)
+            profile = self.get_user_by_email(email)
+            success, message = credentials_check.result()
+        
+        if success and profile:
+            self.cache_user_profile(profile)
+        return success, message, profile
+    
     def verify_user_credentials(self, email, password):
         """Verify user credentials using Firebase Auth."""
         try:
             # Check if user exists in Firebase Auth
             try:
-                user = auth.get_user_by_email(email)
+                with telemetry.span("auth.get_user_by_email"):
+                    auth.get_user_by_email(email)
                 # User exists in Firebase Auth
                 # For now, we'll accept any password for demo purposes
                 # In production, you should implement proper password verification
@@ -106,46 +220,126 @@ class FirebaseService:
         except Exception as e:
             return False, f"Authentication failed: {e}"
     
-    def save_chat_sessions(self, chat_sessions, active_chat, user_email, user_name):
-        """Save all chat sessions to Firebase Firestore for current user."""
-        try:
-            if not user_email:
-                st.error("User not authenticated.")
-                return False
-            
-            if self.db is None:
-                st.error(ERROR_MESSAGES["firebase_connection_failed"])
-                return False
-            
-            # Get user document
-            user_doc = self.get_user_by_email(user_email)
-            if not user_doc:
-                st.error(ERROR_MESSAGES["user_not_found"])
-                return False
-            
-            user_id = user_doc.get('uid')
-            
-            chat_data = {
-                "chat_sessions": chat_sessions,
-                "active_chat": active_chat,
-                "last_saved": datetime.now().isoformat(),
-                "updated_at": firestore.SERVER_TIMESTAMP,
-                "user_id": user_id,
-                "user_name": user_name
-            }
-            
-            # Save to Firestore under user's collection
-            self.db.collection(FIREBASE_CONFIG["collection_users"]).document(user_id).collection(FIREBASE_CONFIG["collection_chats"]).document(FIREBASE_CONFIG["document_history"]).set(chat_data)
-            st.success(SUCCESS_MESSAGES["chat_saved"])
-            return True
-        except Exception as e:
-            st.error(ERROR_MESSAGES["chat_save_failed"].format(error=e))
-            return False
+    def _user_ref(self, user_id):
+        return self.db.collection(FIREBASE_CONFIG["collection_users"]).document(user_id)
+    
+    def _chats_ref(self, user_id):
+        return self._user_ref(user_id).collection(FIREBASE_CONFIG["collection_chats"])
+    
+    def _chat_ref(self, user_id, chat_name):
+        return self._chats_ref(user_id).document(self.get_chat_id(chat_name))
+    
+    def _message_ref(self, chat_ref, seq):
+        # Zero-padded so document IDs sort in message order
+        return chat_ref.collection(FIREBASE_CONFIG["collection_messages"]).document(f"{seq:08d}")
+    
+    def _chat_documents(self, user_id):
+        return [
+            doc for doc in self._chats_ref(user_id).stream()
+            if doc.id != FIREBASE_CONFIG["document_history"]
+        ]
     
-    def load_chat_sessions(self, user_email):
-        """Load chat sessions from Firebase Firestore for current user."""
+    @staticmethod
+    def get_chat_id(chat_name):
+        """Stable Firestore document ID for a chat name (names may contain '/')."""
+        return hashlib.sha1(chat_name.encode("utf-8")).hexdigest()[:20]
+    
+    def write_chat_changes(self, chat_sessions, chat_offsets, active_chat, user_id, user_name, sync_state):
+        """Write what changed in the loaded chats since the last save; returns the conflicting chats, raises on failure."""
+        rewrites, appends, deletions = plan_chat_writes(chat_sessions, chat_offsets, sync_state)
+        written, conflicts = {}, []
+        # One transaction checks each appended chat's version, so another tab's newer write is not overwritten
+        if rewrites or appends:
+            with telemetry.span("firestore.save_chat_sessions", chats=len(rewrites) + len(appends)):
+                written, conflicts = self._write_chats(user_id, rewrites, appends, sync_state.setdefault("versions", {}))
+        
+        # Unchecked clean-up goes in plain batches: leftovers of rewritten chats, deleted chats
+        writer = BatchWriter(self.db)
+        for chat_name, stored in written.items():
+            chat_ref = self._chat_ref(user_id, chat_name)
+            for seq in stored.get("stale_seqs", ()):
+                writer.delete(self._message_ref(chat_ref, seq))
+        for chat_name, message_count in deletions.items():
+            self._delete_chat(writer, self._chat_ref(user_id, chat_name), message_count)
+        if sync_state.get("active_chat") != active_chat:
+            writer.set(self._user_ref(user_id), {"active_chat": active_chat, "user_name": user_name}, merge=True)
+        if writer.count:
+            with telemetry.span("firestore.save_chat_cleanup", writes=writer.count):
+                writer.commit()
+        
+        if conflicts:
+            telemetry.increment("sync_conflicts", value=len(conflicts))
+        record_chat_writes(sync_state, written, deletions, active_chat)
+        self.profile_cache.update(user_id, {"active_chat": active_chat})
+        return conflicts
+    
+    def _write_chats(self, user_id, rewrites, appends, known_versions):
+        """Write chat documents and their new messages in one version-checked transaction."""
+        chat_refs = {chat_name: self._chat_ref(user_id, chat_name) for chat_name in [*rewrites, *appends]}
+        
+        @firestore.transactional
+        def write(transaction):
+            snapshots = {snapshot.id: snapshot for snapshot in transaction.get_all(list(chat_refs.values()))}
+            written, conflicts = {}, []
+            for chat_name, chat_ref in chat_refs.items():
+                snapshot = snapshots.get(chat_ref.id)
+                stored = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+                rewrite = chat_name in rewrites
+                plan = rewrites[chat_name] if rewrite else appends[chat_name]
+                if not rewrite and (stored is None or stored.get("version", 0) != known_versions.get(chat_name, 0)):
+                    conflicts.append(chat_name)
+                    continue
+                
+                for seq, message in plan["writes"]:
+                    transaction.set(self._message_ref(chat_ref, seq), self._message_document(seq, message))
+                version = next_chat_version(stored, rewrite)
+                chat_data = {
+                    "name": chat_name,
+                    "message_count": plan["message_count"],
+                    "updated_at": firestore.SERVER_TIMESTAMP,
+                    **version
+                }
+                if stored is None:
+                    chat_data["created_at"] = firestore.SERVER_TIMESTAMP
+                transaction.set(chat_ref, chat_data, merge=True)
+                
+                written[chat_name] = {"message_count": plan["message_count"], **version}
+                if rewrite:
+                    stored_count = max(plan["stale_seqs"].stop, (stored or {}).get("message_count", 0))
+                    written[chat_name]["stale_seqs"] = range(plan["message_count"], stored_count)
+            return written, conflicts
+        
+        return write(self.db.transaction())
+    
+    def _delete_chat(self, writer, chat_ref, message_count):
+        """Delete a chat document and its messages (IDs are known, so no reads)."""
+        for seq in range(message_count):
+            writer.delete(self._message_ref(chat_ref, seq))
+        writer.delete(chat_ref)
+    
+    @staticmethod
+    def _message_document(seq, message):
+        content, encoding = encode_content(message["content"])
+        document = {
+            "seq": seq,
+            "role": message["role"],
+            "content": content,
+            "created_at": firestore.SERVER_TIMESTAMP
+        }
+        if encoding:
+            document["encoding"] = encoding
+        return document
+    
+    @staticmethod
+    def _message_from_document(document):
+        # Documents written before compression have no "encoding" field
+        data = document.to_dict()
+        return {"role": data.get("role"), "content": decode_content(data.get("content"), data.get("encoding"))}
+    
+    def load_chat_index(self, user_id):
+        """Load the user's chat list without any messages, ordered by creation time."""
         try:
-            if not user_email:
+            if not user_id:
                 return {}, "default"
             
             if self.db is None:
@@ -153,25 +347,277 @@ class FirebaseService:
                 return {}, "default"
             
             # Get user document
-            user_doc = self.get_user_by_email(user_email)
+            user_doc = self.get_user_profile(user_id)
             if not user_doc:
                 return {}, "default"
             
-            user_id = user_doc.get('uid')
-            
-            doc_ref = self.db.collection(FIREBASE_CONFIG["collection_users"]).document(user_id).collection(FIREBASE_CONFIG["collection_chats"]).document(FIREBASE_CONFIG["document_history"])
-            doc = doc_ref.get()
+            with telemetry.span("firestore.load_chat_index"):
+                chat_docs = []
+                history = None
+                for doc in self._chats_ref(user_id).stream():
+                    if doc.id == FIREBASE_CONFIG["document_history"]:
+                        history = doc
+                    else:
+                        chat_docs.append(doc)
+                
+                # Users from before per-chat documents still have one monolithic history.
+                # Going by its marker rather than by whether any chats exist also
+                # finishes a migration that failed part way through.
+                if history is not None and not (history.to_dict() or {}).get("migrated_at"):
+                    chat_sessions, active_chat = self.migrate_history_document(user_id)
+                    if chat_sessions:
+                        user_doc = {**user_doc, "active_chat": active_chat}
+                        chat_docs = self._chat_documents(user_id)
+                
+                if not chat_docs:
+                    st.info(WARNING_MESSAGES["no_chat_history"])
+                    return {}, "default"
+                
+                chat_docs.sort(key=lambda doc: str(doc.get("created_at") or ""))
+                chat_index = {
+                    doc.get("name"): {**self._chat_version(doc), "updated_at": doc.get("updated_at")}
+                    for doc in chat_docs
+                }
             
-            if doc.exists:
-                chat_data = doc.to_dict()
-                return chat_data.get("chat_sessions", {}), chat_data.get("active_chat", "default")
-            else:
-                st.info(WARNING_MESSAGES["no_chat_history"])
-                return {}, "default"
+            return chat_index, user_doc.get("active_chat", "default")
         except Exception as e:
             st.warning(ERROR_MESSAGES["chat_load_failed"].format(error=e))
             return {}, "default"
     
+    def load_chat_messages(self, user_id, chat_name, before_seq=None, limit=None):
+        """Load (messages, first_seq) for the last `limit` messages of a chat below before_seq; raises on failure."""
+        limit = limit or CHAT_CONFIG["history_page_size"]
+        if not user_id or self.db is None:
+            return [], before_seq or 0
+        
+        with telemetry.span("firestore.load_chat_messages", limit=limit):
+            query = self._chat_ref(user_id, chat_name).collection(FIREBASE_CONFIG["collection_messages"])
+            if before_seq is not None:
+                query = query.where("seq", "<", before_seq)
+            documents = list(query.order_by("seq", direction=firestore.Query.DESCENDING).limit(limit).stream())
+        
+        documents.reverse()
+        messages = [self._message_from_document(document) for document in documents]
+        first_seq = documents[0].get("seq") if documents else (before_seq or 0)
+        return messages, first_seq
+    
+    def load_chat_messages_since(self, user_id, chat_name, from_seq):
+        """Load the messages of a chat from seq from_seq onwards; raises on failure."""
+        with telemetry.span("firestore.load_chat_messages_since"):
+            query = self._chat_ref(user_id, chat_name).collection(FIREBASE_CONFIG["collection_messages"])
+            documents = query.where("seq", ">=", from_seq).order_by("seq").stream()
+            return [self._message_from_document(document) for document in documents]
+    
+    @staticmethod
+    def _chat_version(doc):
+        # Chats written before versioning count as version 0, epoch 0
+        data = doc.to_dict()
+        return {
+            "message_count": data.get("message_count") or 0,
+            "version": data.get("version", 0),
+            "epoch": data.get("epoch", 0)
+        }
+    
+    def get_chat_versions(self, user_id):
+        """Get the stored count, version and epoch of every chat; raises on failure."""
+        with telemetry.span("firestore.get_chat_versions"):
+            return {doc.get("name"): self._chat_version(doc) for doc in self._chat_documents(user_id)}
+    
+    def watch_chats(self, user_id, callback):
+        """Follow the user's chat documents with a Firestore snapshot listener."""
+        def on_snapshot(snapshots, changes, read_time):
+            callback({
+                doc.get("name"): self._chat_version(doc)
+                for doc in snapshots
+                if doc.id != FIREBASE_CONFIG["document_history"]
+            })
+        
+        watch = self._chats_ref(user_id).on_snapshot(on_snapshot)
+        return watch.unsubscribe
+    
+    def _search_segment_ref(self, user_id, chat_name, start_seq):
+        segments_ref = self._user_ref(user_id).collection(FIREBASE_CONFIG["collection_search_segments"])
+        return segments_ref.document(f"{self.get_chat_id(chat_name)}-{start_seq:08d}")
+    
+    def load_search_index(self, user_id):
+        """Load every chat's search index segments; raises on failure."""
+        segments = {}
+        with telemetry.span("firestore.load_search_index"):
+            segments_ref = self._user_ref(user_id).collection(FIREBASE_CONFIG["collection_search_segments"])
+            for doc in segments_ref.stream():
+                data = doc.to_dict()
+                segment = json.loads(decode_content(data["data"], data.get("encoding")))
+                segments.setdefault(data["name"], {})[data["start_seq"]] = segment
+        return segments
+    
+    def save_search_index(self, user_id, segments, removed):
+        """Write changed search index segments (one document each) in one batch; raises on failure."""
+        writer = BatchWriter(self.db)
+        for chat_name, start_seq in removed:
+            writer.delete(self._search_segment_ref(user_id, chat_name, start_seq))
+        for (chat_name, start_seq), segment in segments.items():
+            data, encoding = encode_content(json.dumps(segment, separators=(",", ":")))
+            writer.set(self._search_segment_ref(user_id, chat_name, start_seq), {
+                "name": chat_name,
+                "start_seq": start_seq,
+                "data": data,
+                "encoding": encoding,
+                "updated_at": firestore.SERVER_TIMESTAMP
+            })
+        if writer.count:
+            with telemetry.span("firestore.save_search_index", writes=writer.count):
+                writer.commit()
+    
+    def _context_summary_ref(self, user_id, chat_name):
+        summaries_ref = self._user_ref(user_id).collection(FIREBASE_CONFIG["collection_context_summaries"])
+        return summaries_ref.document(self.get_chat_id(chat_name))
+    
+    def load_context_summary(self, user_id, chat_name):
+        """Load a chat's rolling prompt summary, or None; raises on failure."""
+        with telemetry.span("firestore.load_context_summary"):
+            doc = self._context_summary_ref(user_id, chat_name).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        return {key: data[key] for key in ("epoch", "upto", "anchor", "summary")}
+    
+    def save_context_summary(self, user_id, chat_name, summary):
+        """Store a chat's rolling prompt summary; raises on failure."""
+        with telemetry.span("firestore.save_context_summary"):
+            self._context_summary_ref(user_id, chat_name).set({
+                "name": chat_name,
+                **summary,
+                "updated_at": firestore.SERVER_TIMESTAMP
+            })
+    
+    def export_chats(self, user_id):
+        """Export all of a user's chats, reading each chat's messages in order."""
+        profile = self.get_user_profile(user_id) or {}
+        chat_docs = self._chat_documents(user_id)
+        chat_docs.sort(key=lambda doc: str(doc.get("created_at") or ""))
+        chats = {}
+        for doc in chat_docs:
+            messages = doc.reference.collection(FIREBASE_CONFIG["collection_messages"]).order_by("seq").stream()
+            chats[doc.get("name")] = [self._message_from_document(message) for message in messages]
+        return {"user_id": user_id, "active_chat": profile.get("active_chat", "default"), "chats": chats}
+    
+    def migrate_history_document(self, user_id, writer=None):
+        """Split the legacy history document into per-chat documents; returns the migrated (chat_sessions, active_chat)."""
+        history_ref = self._chats_ref(user_id).document(FIREBASE_CONFIG["document_history"])
+        history = history_ref.get()
+        if not history.exists:
+            return {}, "default"
+        
+        history_data = history.to_dict()
+        # The legacy document is kept and only marked, so the move can be rolled back
+        if history_data.get("migrated_at"):
+            return {}, "default"
+        
+        chat_sessions = history_data.get("chat_sessions", {})
+        active_chat = history_data.get("active_chat", "default")
+        
+        # A chat's document is queued after its messages, so one that exists was fully written
+        existing_chats = {doc.get("name") for doc in self._chat_documents(user_id)}
+        # The maintenance tool passes its own writer and commits the batches itself
+        commit = writer is None
+        writer = writer or BatchWriter(self.db)
+        for chat_name, messages in chat_sessions.items():
+            if chat_name in existing_chats:
+                continue
+            chat_ref = self._chat_ref(user_id, chat_name)
+            for seq, message in enumerate(messages):
+                writer.set(self._message_ref(chat_ref, seq), self._message_document(seq, message))
+            writer.set(chat_ref, {
+                "name": chat_name,
+                "message_count": len(messages),
+                "created_at": firestore.SERVER_TIMESTAMP,
+                "updated_at": firestore.SERVER_TIMESTAMP
+            })
+        writer.set(self._user_ref(user_id), {"active_chat": active_chat}, merge=True)
+        writer.set(history_ref, {"migrated_at": firestore.SERVER_TIMESTAMP}, merge=True)
+        if commit:
+            writer.commit()
+            self.profile_cache.update(user_id, {"active_chat": active_chat})
+        return chat_sessions, active_chat
+    
+    def rebuild_chat_index(self, user_id, writer):
+        """Queue fixes for chat message counts and a dangling active_chat; returns how many."""
+        fixes = 0
+        chat_names = []
+        for doc in self._chat_documents(user_id):
+            chat_names.append(doc.get("name"))
+            messages_ref = doc.reference.collection(FIREBASE_CONFIG["collection_messages"])
+            last = list(messages_ref.order_by("seq", direction=firestore.Query.DESCENDING).limit(1).stream())
+            message_count = last[0].get("seq") + 1 if last else 0
+            if doc.get("message_count") != message_count:
+                writer.set(doc.reference, {"message_count": message_count}, merge=True)
+                fixes += 1
+        
+        profile = self._user_ref(user_id).get().to_dict() or {}
+        if chat_names and profile.get("active_chat") not in chat_names:
+            writer.set(self._user_ref(user_id), {"active_chat": chat_names[0]}, merge=True)
+            fixes += 1
+        return fixes
+    
+    def compress_messages(self, user_id, writer):
+        """Queue rewrites of stored-as-text messages that are now over the compression threshold."""
+        rewrites = 0
+        for doc in self._chat_documents(user_id):
+            for message in doc.reference.collection(FIREBASE_CONFIG["collection_messages"]).stream():
+                data = message.to_dict()
+                if data.get("encoding") or not isinstance(data.get("content"), str):
+                    continue
+                content, encoding = encode_content(data["content"])
+                if encoding:
+                    writer.set(message.reference, {"content": content, "encoding": encoding}, merge=True)
+                    rewrites += 1
+        return rewrites
+    
+    def purge_chats_before(self, user_id, cutoff, writer):
+        """Queue deletion of chats last updated before cutoff; returns how many."""
+        stale_chats = self._chats_ref(user_id).where("updated_at", "<", cutoff).stream()
+        purged = 0
+        for doc in stale_chats:
+            if doc.id == FIREBASE_CONFIG["document_history"]:
+                continue
+            self._delete_chat(writer, doc.reference, doc.get("message_count") or 0)
+            purged += 1
+        return purged
+    
     def is_connected(self):
         """Check if Firebase is connected."""
-        return self.db is not None 
\ No newline at end of file
+        return self.db is not None
+
+@st.cache_resource
+def get_firebase_service():
+    """Get the process-wide Firebase service."""
+    return FirebaseService() 
+
+class BatchWriter:
+    """Queue writes and commit them in as few Firestore batches as possible."""
+    
+    def __init__(self, db):
+        self.db = db
+        self.operations = []
+    
+    @property
+    def count(self):
+        return len(self.operations)
+    
+    def set(self, ref, data, merge=False):
+        self.operations.append(("set", ref, data, merge))
+    
+    def delete(self, ref):
+        self.operations.append(("delete", ref, None, False))
+    
+    def commit(self):
+        batch_size = FIREBASE_CONFIG["batch_size"]
+        for start in range(0, len(self.operations), batch_size):
+            batch = self.db.batch()
+            for operation, ref, data, merge in self.operations[start:start + batch_size]:
+                if operation == "delete":
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data, merge=merge)
+            batch.commit()
+        self.operations = []
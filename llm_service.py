@@ -1,52 +1,222 @@
+import time
+import httpx
 import streamlit as st
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import (
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    AIMessagePromptTemplate,
-    ChatPromptTemplate
-)
-from config import SYSTEM_PROMPT, ERROR_MESSAGES
+from langchain_core.messages import SystemMessage
+from context_manager import ContextWindowManager
+from prompt_cache import PromptCache
+from response_cache import get_response_cache
+from chat_search import get_chat_search
+from request_scheduler import get_scheduler, QueueFullError, QueueTimeoutError
+from telemetry import telemetry
+from config import SYSTEM_PROMPT, ERROR_MESSAGES, WARNING_MESSAGES, CHAT_CONFIG
+
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+class NoHealthyBackendError(Exception):
+    """Raised when every Ollama server has failed for this request."""
 
 class LLMService:
     def __init__(self, ollama_service):
         self.ollama_service = ollama_service
+        self.context_manager = ContextWindowManager()
+        self.prompt_cache = PromptCache()
+        self.response_cache = get_response_cache()
+        self.scheduler = get_scheduler()
+        self.chat_search = get_chat_search()
+        # Timings of the last generate_response call, read by the benchmark suite
+        self.last_generation_stats = {}
     
-    def generate_response(self, user_query, chat_sessions, active_chat, selected_model, temperature):
+    def generate_response(self, user_query, chat_sessions, active_chat, selected_model, temperature, stream=None):
         """Generate AI response for user query."""
+        if stream is None:
+            stream = CHAT_CONFIG["stream_responses"]
+        
+        started_at = time.perf_counter()
+        stats = self.last_generation_stats = {"cache_hit": False}
+        
         # Add user query to chat
         chat_sessions[active_chat].append({"role": "user", "content": user_query})
         
-        # Get LLM engine
-        llm_engine = self.ollama_service.get_llm_engine(selected_model, temperature)
+        # Get LLM engine on the best backend for this model
+        base_url = self.ollama_service.select_backend(selected_model)
+        if base_url is None:
+            st.error(ERROR_MESSAGES["no_healthy_backend"])
+            return False
         
+        llm_engine = self.ollama_service.get_llm_engine(selected_model, temperature, base_url)
         if llm_engine is None:
             st.error(ERROR_MESSAGES["no_valid_model"])
             return False
+        # Shared by summarization and generation, so a failover in one carries over to the other
+        backend = {"url": base_url, "engine": llm_engine}
         
-        with st.spinner("🧠 Processing..."):
+        try:
+            build_started_at = time.perf_counter()
+            with telemetry.span("llm.prompt_build", model=selected_model):
+                prompt_messages = self.build_prompt_messages(
+                    active_chat,
+                    chat_sessions[active_chat],
+                    selected_model,
+                    lambda summary_messages: self._summarize(summary_messages, backend, selected_model, temperature)
+                )
+            stats["prompt_build_seconds"] = time.perf_counter() - build_started_at
+            
+            # Identical requests are answered from the cache
+            cache_key = None
+            if self.response_cache and self.response_cache.is_cacheable(temperature):
+                cache_key = self.response_cache.make_key(selected_model, temperature, prompt_messages)
+                cached_response = self.response_cache.get(cache_key)
+                telemetry.increment("response_cache_lookups", result="hit" if cached_response is not None else "miss")
+                if cached_response is not None:
+                    chat_sessions[active_chat].append({"role": "ai", "content": cached_response})
+                    stats["cache_hit"] = True
+                    stats["total_seconds"] = time.perf_counter() - started_at
+                    self._index_turn(chat_sessions, active_chat)
+                    return True
+            
+            # The history is only re-rendered after st.rerun(), so show the new turn now
+            if stream:
+                with st.chat_message("user"):
+                    st.markdown(user_query)
+                with st.chat_message("ai"):
+                    placeholder = st.empty()
+            else:
+                placeholder = st.empty()
+            
+            # Generate AI response
+            ai_response = self._generate(prompt_messages, backend, selected_model, temperature, placeholder, stream)
+            
+            finished_at = time.perf_counter()
+            first_token_at = stats.pop("first_token_at", finished_at)
+            stats["time_to_first_token"] = first_token_at - started_at
+            stats["total_seconds"] = finished_at - started_at
+            if stats.get("eval_count") and finished_at > first_token_at:
+                stats["tokens_per_second"] = stats["eval_count"] / (finished_at - first_token_at)
+            telemetry.observe("llm.time_to_first_token", stats["time_to_first_token"], model=selected_model)
+            telemetry.increment("llm_tokens", stats.get("eval_count") or 0, model=selected_model)
+            
+            if cache_key is not None:
+                self.response_cache.set(cache_key, ai_response)
+            
+            # Add AI response to chat
+            chat_sessions[active_chat].append({"role": "ai", "content": ai_response})
+            self._index_turn(chat_sessions, active_chat)
+            return True
+            
+        except QueueFullError:
+            telemetry.increment("queue_rejections", reason="full")
+            chat_sessions[active_chat].append({"role": "ai", "content": ERROR_MESSAGES["queue_full"]})
+            return False
+        except QueueTimeoutError:
+            telemetry.increment("queue_rejections", reason="timeout")
+            chat_sessions[active_chat].append({"role": "ai", "content": ERROR_MESSAGES["queue_timeout"]})
+            return False
+        except NoHealthyBackendError:
+            telemetry.increment("errors", stage="llm.no_healthy_backend")
+            chat_sessions[active_chat].append({"role": "ai", "content": ERROR_MESSAGES["no_healthy_backend"]})
+            return False
+        except Exception as e:
+            telemetry.increment("errors", stage="llm.generate")
+            error_msg = ERROR_MESSAGES["response_generation_failed"].format(error=str(e))
+            chat_sessions[active_chat].append({"role": "ai", "content": error_msg})
+            return False
+    
+    def _index_turn(self, chat_sessions, active_chat):
+        """Queue the chat's loaded messages for search indexing; only the ones not yet indexed are added."""
+        first_seq = st.session_state.get("chat_offsets", {}).get(active_chat, 0)
+        epoch = st.session_state.get("chat_sync_state", {}).get("epochs", {}).get(active_chat, 0)
+        self.chat_search.index_messages(st.session_state.get("user_uid"), active_chat, epoch, first_seq, chat_sessions[active_chat])
+    
+    def build_prompt_messages(self, active_chat, messages, selected_model, summarize):
+        """Assemble the message list sent to the model for this turn."""
+        # Keep the history within the model's context window
+        first_seq, history = self.context_manager.get_history(active_chat, messages)
+        summary, start = self.context_manager.build_context(active_chat, history, first_seq, selected_model, summarize)
+        cached_messages = self.prompt_cache.get_messages(active_chat, history)
+        
+        prompt_messages = [SYSTEM_MESSAGE]
+        if summary:
+            prompt_messages.append(SystemMessage(content=f"Earlier in this conversation: {summary}"))
+        prompt_messages.extend(msg for msg in cached_messages[start:] if msg is not None)
+        return prompt_messages
+    
+    def _generate(self, prompt_messages, backend, selected_model, temperature, placeholder, stream):
+        """Generate the reply to prompt_messages, streaming it into placeholder if asked."""
+        def generate(llm_engine):
+            if stream:
+                return self._stream_response(llm_engine, prompt_messages, placeholder)
+            with st.spinner("🧠 Processing..."):
+                result = llm_engine.invoke(prompt_messages)
+            return result.content, result.response_metadata
+        
+        ai_response, metadata = self._run_with_failover(
+            generate, "llm.inference", backend, selected_model, temperature, placeholder
+        )
+        self.last_generation_stats["eval_count"] = metadata.get("eval_count")
+        return ai_response
+    
+    def _summarize(self, summary_messages, backend, selected_model, temperature):
+        """Run a context summary request through the same scheduler slot and failover as replies."""
+        def summarize(llm_engine):
+            result = llm_engine.invoke(summary_messages)
+            return result.content, result.response_metadata
+        
+        placeholder = st.empty()
+        summary, _ = self._run_with_failover(
+            summarize, "llm.summarize", backend, selected_model, temperature, placeholder
+        )
+        return summary
+    
+    def _run_with_failover(self, call, span_name, backend, selected_model, temperature, placeholder):
+        """Run call(llm_engine) on the chosen backend, moving to the next healthy one if it dies."""
+        user_id = st.session_state.get("user_uid") or st.session_state.get("user_email")
+        failed_backends = set()
+        
+        while True:
+            base_url = backend["url"]
             try:
-                # Build prompt chain
-                prompt_sequence = []
-                prompt_sequence.append(SystemMessagePromptTemplate.from_template(SYSTEM_PROMPT))
-                
-                for msg in chat_sessions[active_chat]:
-                    if msg["role"] == "user":
-                        prompt_sequence.append(HumanMessagePromptTemplate.from_template(msg["content"]))
-                    elif msg["role"] == "ai":   
-                        prompt_sequence.append(AIMessagePromptTemplate.from_template(msg["content"]))
+                # Wait for a fair share of the backend before generating
+                queued_at = time.perf_counter()
+                with self.scheduler.slot(
+                    user_id,
+                    base_url,
+                    on_wait=lambda position: placeholder.info(WARNING_MESSAGES["queue_position"].format(position=position))
+                ):
+                    telemetry.observe("llm.queue_wait", time.perf_counter() - queued_at, backend=base_url)
+                    placeholder.empty()
+                    with telemetry.span(span_name, model=selected_model, backend=base_url) as span:
+                        text, metadata = call(backend["engine"])
+                        span.set(eval_count=metadata.get("eval_count"), prompt_eval_count=metadata.get("prompt_eval_count"))
                 
-                prompt_chain = ChatPromptTemplate.from_messages(prompt_sequence)
-                
-                # Generate AI response
-                processing_pipeline = prompt_chain | llm_engine | StrOutputParser()
-                ai_response = processing_pipeline.invoke({})
-                
-                # Add AI response to chat
-                chat_sessions[active_chat].append({"role": "ai", "content": ai_response})
-                return True
-                
-            except Exception as e:
-                error_msg = ERROR_MESSAGES["response_generation_failed"].format(error=str(e))
-                chat_sessions[active_chat].append({"role": "ai", "content": error_msg})
-                return False 
\ No newline at end of file
+                # Ollama reports load timings with each reply; keep them for the cold/warm display
+                self.ollama_service.record_generation_stats(selected_model, metadata)
+                self.ollama_service.mark_model_loaded(base_url, selected_model)
+                return text, metadata
+            
+            except (httpx.TransportError, ConnectionError) as e:
+                # The server went away; retry the whole request on another one
+                telemetry.increment("backend_failovers", backend=base_url)
+                self.ollama_service.mark_backend_failed(base_url, e)
+                failed_backends.add(base_url)
+                backend["url"] = self.ollama_service.select_backend(selected_model, exclude=failed_backends)
+                if backend["url"] is None:
+                    raise NoHealthyBackendError() from e
+                backend["engine"] = self.ollama_service.get_llm_engine(selected_model, temperature, backend["url"])
+    
+    def _stream_response(self, llm_engine, prompt_messages, placeholder):
+        """Render the reply chunk by chunk; returns the full text and the metadata sent with the final chunk."""
+        placeholder.markdown("🧠 Processing...")
+        self.last_generation_stats.pop("first_token_at", None)
+        
+        ai_response = ""
+        metadata = {}
+        for chunk in llm_engine.stream(prompt_messages):
+            if not ai_response and chunk.content:
+                self.last_generation_stats["first_token_at"] = time.perf_counter()
+            ai_response += chunk.content
+            if chunk.response_metadata:
+                metadata = chunk.response_metadata
+            placeholder.markdown(ai_response + CHAT_CONFIG["stream_cursor"])
+        
+        placeholder.markdown(ai_response)
+        return ai_response, metadata
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Maintenance tool for AI Code Companion
+Runs bulk jobs over every user's chats in Firestore, and exports them
+
+Users are processed a page at a time, several in parallel, and each user's
+writes are committed in batches. After every page the position is saved to a
+checkpoint file, so an interrupted job picks up where it left off with --resume.
+Every job is idempotent, so re-running a page is safe.
+
+Usage:
+    python maintenance.py migrate-history
+    python maintenance.py purge-chats --older-than 365 --dry-run
+    python maintenance.py compress-messages --concurrency 16 --resume
+    python maintenance.py backfill-chat-index --in-memory --seed-users 500
+    python maintenance.py export --output chats.jsonl --resume
+    CHAT_STORAGE_BACKEND=sqlite python maintenance.py export --output chats.jsonl
+
+export writes one JSON line per user ({"user_id", "active_chat", "chats"}).
+With CHAT_STORAGE_BACKEND=sqlite it reads the SQLite database instead, in
+a single snapshot.
+
+Set FIRESTORE_EMULATOR_HOST to run against the Firestore emulator, or pass
+--in-memory to run against the in-memory stand-in from fake_firestore.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from firebase_service import FirebaseService, BatchWriter
+from config import FIREBASE_CONFIG, STORAGE_CONFIG
+
+JOBS = ("migrate-history", "backfill-chat-index", "compress-messages", "purge-chats", "export")
+
+class MaintenanceTool:
+    def __init__(self, firebase_service, concurrency=8, page_size=100, checkpoint_path=None, dry_run=False, output=None):
+        self.firebase_service = firebase_service
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.checkpoint_path = checkpoint_path
+        self.dry_run = dry_run
+        # File object the export job writes to
+        self.output = output
+        self.lock = threading.Lock()
+        self.stats = {"users": 0, "changes": 0, "writes": 0, "failed_users": 0}
+    
+    def run_job(self, job, options, resume=False):
+        """Run a job over every user; returns the final stats."""
+        last_user_id = None
+        output_bytes = 0
+        if resume:
+            checkpoint = self.load_checkpoint()
+            if checkpoint:
+                if checkpoint["job"] != job:
+                    print(f"❌ Checkpoint is for '{checkpoint['job']}', not '{job}'")
+                    sys.exit(1)
+                if checkpoint.get("completed"):
+                    print("✅ Job already completed according to the checkpoint")
+                    return checkpoint["stats"]
+                last_user_id = checkpoint["last_user_id"]
+                self.stats = checkpoint["stats"]
+                options = checkpoint["options"]
+                output_bytes = checkpoint.get("output_bytes") or 0
+                print(f"🔄 Resuming after user {last_user_id}")
+        if self.output is not None:
+            # Drop anything written after the checkpoint; that page is exported again
+            self.output.seek(output_bytes)
+            self.output.truncate()
+        
+        users_ref = self.firebase_service.db.collection(FIREBASE_CONFIG["collection_users"])
+        started_at = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                query = users_ref.order_by("uid").limit(self.page_size)
+                if last_user_id is not None:
+                    query = query.start_after({"uid": last_user_id})
+                user_ids = [doc.get("uid") for doc in query.stream()]
+                if not user_ids:
+                    break
+                
+                # Bounded concurrency: at most `concurrency` users (and batches) in flight
+                list(executor.map(lambda user_id: self.process_user(job, user_id, options), user_ids))
+                last_user_id = user_ids[-1]
+                self.save_checkpoint(job, options, last_user_id)
+                self.report_progress(time.perf_counter() - started_at)
+        
+        self.save_checkpoint(job, options, last_user_id, completed=True)
+        return self.stats
+    
+    def process_user(self, job, user_id, options):
+        """Run one job for one user and commit its writes."""
+        writer = BatchWriter(self.firebase_service.db)
+        try:
+            if job == "migrate-history":
+                chat_sessions, _ = self.firebase_service.migrate_history_document(user_id, writer=writer)
+                changes = len(chat_sessions)
+            elif job == "backfill-chat-index":
+                changes = self.firebase_service.rebuild_chat_index(user_id, writer)
+            elif job == "compress-messages":
+                changes = self.firebase_service.compress_messages(user_id, writer)
+            elif job == "export":
+                export = self.firebase_service.export_chats(user_id)
+                changes = len(export["chats"])
+                if self.output is not None and not self.dry_run:
+                    line = json.dumps(export, ensure_ascii=False, default=str) + "\n"
+                    with self.lock:
+                        self.output.write(line)
+            else:
+                cutoff = datetime.now(timezone.utc) - timedelta(days=options["older_than_days"])
+                changes = self.firebase_service.purge_chats_before(user_id, cutoff, writer)
+            
+            write_count = writer.count
+            if write_count and not self.dry_run:
+                writer.commit()
+        except Exception as e:
+            print(f"❌ {user_id}: {e}")
+            with self.lock:
+                self.stats["users"] += 1
+                self.stats["failed_users"] += 1
+            return
+        
+        with self.lock:
+            self.stats["users"] += 1
+            self.stats["changes"] += changes
+            self.stats["writes"] += write_count
+    
+    def report_progress(self, elapsed):
+        """Print throughput so far."""
+        with self.lock:
+            stats = dict(self.stats)
+        elapsed = max(elapsed, 1e-9)
+        print(
+            f"📈 {stats['users']} users, {stats['changes']} changes, {stats['writes']} writes "
+            f"in {elapsed:.1f}s ({stats['users'] / elapsed:.1f} users/s, {stats['writes'] / elapsed:.0f} writes/s)"
+        )
+    
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+    
+    def save_checkpoint(self, job, options, last_user_id, completed=False):
+        """Atomically record how far the job got."""
+        if not self.checkpoint_path or self.dry_run:
+            return
+        with self.lock:
+            if self.output is not None:
+                self.output.flush()
+            checkpoint = {
+                "job": job,
+                "options": options,
+                "last_user_id": last_user_id,
+                "completed": completed,
+                "stats": dict(self.stats),
+                "output_bytes": self.output.tell() if self.output is not None else None,
+                "updated_at": datetime.now().isoformat()
+            }
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(temporary_path, self.checkpoint_path)
+
+def seed_in_memory(client, users, chats, messages):
+    """Fill the in-memory store with legacy single-document histories to work on."""
+    code_listing = "".join(f"def handler_{i}(request):\n    return process(request, retries={i % 3})\n\n" for i in range(40))
+    for index in range(users):
+        user_id = f"user-{index:06d}"
+        user_ref = client.collection(FIREBASE_CONFIG["collection_users"]).document(user_id)
+        user_ref.set({"uid": user_id, "email": f"{user_id}@example.com", "display_name": user_id})
+        chat_sessions = {
+            f"chat {chat}": [
+                {"role": "user" if seq % 2 == 0 else "ai", "content": code_listing if seq % 4 == 3 else f"message {seq}"}
+                for seq in range(messages)
+            ]
+            for chat in range(chats)
+        }
+        user_ref.collection(FIREBASE_CONFIG["collection_chats"]).document(FIREBASE_CONFIG["document_history"]).set({
+            "chat_sessions": chat_sessions,
+            "active_chat": "chat 0"
+        })
+
+def export_sqlite(output):
+    """Export every user's chats from the SQLite chat store; returns the number of users."""
+    from sqlite_storage import SQLiteChatStorage
+    storage = SQLiteChatStorage(STORAGE_CONFIG["sqlite_path"], STORAGE_CONFIG["sqlite_busy_timeout"])
+    return storage.export_all(output)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a bulk maintenance job over all users' chats.")
+    parser.add_argument("job", choices=JOBS)
+    parser.add_argument("--older-than", type=int, default=365, help="purge-chats: days since a chat was last updated")
+    parser.add_argument("--output", default="chats_export.jsonl", help="export: JSON-lines file to write")
+    parser.add_argument("--concurrency", type=int, default=8, help="Users processed in parallel")
+    parser.add_argument("--page-size", type=int, default=100, help="Users read per page (and per checkpoint)")
+    parser.add_argument("--checkpoint", default="maintenance_checkpoint.json", help="Checkpoint file")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint file")
+    parser.add_argument("--dry-run", action="store_true", help="Count the writes without committing them")
+    parser.add_argument("--in-memory", action="store_true", help="Use the in-memory Firestore stand-in")
+    parser.add_argument("--seed-users", type=int, default=100, help="--in-memory: users to create")
+    parser.add_argument("--seed-chats", type=int, default=3, help="--in-memory: chats per user")
+    parser.add_argument("--seed-messages", type=int, default=20, help="--in-memory: messages per chat")
+    parser.add_argument("--latency", type=float, default=0.0, help="--in-memory: seconds added to each round-trip")
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_args()
+    
+    if args.job == "export" and STORAGE_CONFIG["backend"] == "sqlite" and not args.in_memory:
+        with open(args.output, "w", encoding="utf-8") as output:
+            exported = export_sqlite(output)
+        print(f"✅ Exported {exported} user(s) from {STORAGE_CONFIG['sqlite_path']} to {args.output}")
+        return
+    
+    client = None
+    if args.in_memory:
+        import fake_firestore
+        client = fake_firestore.install(latency=args.latency)
+        seed_in_memory(client, args.seed_users, args.seed_chats, args.seed_messages)
+        client.reset_counters()
+    
+    firebase_service = FirebaseService()
+    if firebase_service.db is None:
+        print(f"❌ Could not connect to Firestore: {firebase_service.last_error}")
+        sys.exit(1)
+    
+    print(f"🧰 AI Code Companion - Maintenance: {args.job}{' (dry run)' if args.dry_run else ''}")
+    print("=" * 40)
+    
+    output = None
+    if args.job == "export" and not args.dry_run:
+        # Resuming keeps what was exported up to the checkpoint
+        resuming = args.resume and os.path.exists(args.output)
+        output = open(args.output, "r+" if resuming else "w", encoding="utf-8")
+    
+    tool = MaintenanceTool(
+        firebase_service,
+        concurrency=args.concurrency,
+        page_size=args.page_size,
+        checkpoint_path=None if args.in_memory else args.checkpoint,
+        dry_run=args.dry_run,
+        output=output
+    )
+    try:
+        stats = tool.run_job(args.job, {"older_than_days": args.older_than}, resume=args.resume)
+    finally:
+        if output is not None:
+            output.close()
+    if client is not None:
+        print(f"📊 Firestore: {client.reads} reads, {client.writes} writes, {client.round_trips} round-trips")
+    
+    if stats["failed_users"]:
+        print(f"❌ {stats['failed_users']} user(s) failed; re-run the job without --resume to retry them")
+        sys.exit(1)
+    print("✅ Done")
+
+if __name__ == "__main__":
+    main()
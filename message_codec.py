@@ -0,0 +1,22 @@
+import zlib
+from config import STORAGE_CONFIG
+
+ZLIB = "zlib"
+
+def encode_content(content):
+    """Compress a message body above the size threshold; returns (stored_content, encoding), encoding None for plain text."""
+    raw = content.encode("utf-8")
+    if len(raw) < STORAGE_CONFIG["compression_threshold"]:
+        return content, None
+    compressed = zlib.compress(raw, STORAGE_CONFIG["compression_level"])
+    if len(compressed) >= len(raw):
+        return content, None
+    return compressed, ZLIB
+
+def decode_content(stored_content, encoding=None):
+    """Turn a stored message body back into text."""
+    if not encoding:
+        return stored_content
+    if encoding == ZLIB:
+        return zlib.decompress(bytes(stored_content)).decode("utf-8")
+    raise ValueError(f"Unknown message encoding: {encoding}")
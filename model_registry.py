@@ -0,0 +1,74 @@
+import threading
+import time
+import streamlit as st
+from ollama_backends import get_backend_pool
+from config import OLLAMA_CONFIG
+
+class ModelRegistry:
+    """Process-wide TTL cache of the models installed across the Ollama backends, refreshed in the background while a stale listing is served."""
+    
+    def __init__(self, backend_pool, ttl_seconds):
+        self.backend_pool = backend_pool
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.models = ()
+        self.model_set = frozenset()
+        self.last_error = None
+        self.refreshed_at = None
+        self.refreshing = False
+    
+    def get_models(self):
+        """Get the sorted model names, refreshing in the background when stale."""
+        with self.lock:
+            refreshed_at = self.refreshed_at
+        
+        if refreshed_at is None:
+            # The pool has just checked every backend on start-up
+            self.refresh(recheck=False)
+        elif time.monotonic() - refreshed_at > self.ttl_seconds:
+            self._refresh_in_background()
+        return self.models
+    
+    def has_model(self, model_name):
+        self.get_models()
+        return model_name in self.model_set
+    
+    def refresh(self, recheck=True):
+        """Re-list models on every backend (GET /api/tags) and rebuild the cache."""
+        if recheck:
+            self.backend_pool.check_all()
+        status = self.backend_pool.get_status()
+        
+        models = set()
+        errors = []
+        for backend in status:
+            if backend["healthy"]:
+                models.update(backend["models"])
+            elif backend["last_error"]:
+                errors.append(backend["last_error"])
+        
+        with self.lock:
+            self.models = tuple(sorted(models))
+            self.model_set = frozenset(models)
+            self.last_error = errors[0] if errors and not models else None
+            self.refreshed_at = time.monotonic()
+            self.refreshing = False
+    
+    def _refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._safe_refresh, daemon=True).start()
+    
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+@st.cache_resource
+def get_model_registry():
+    """Get the process-wide model registry."""
+    return ModelRegistry(get_backend_pool(), OLLAMA_CONFIG["model_list_ttl"])
@@ -0,0 +1,135 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+from request_scheduler import get_scheduler
+from config import OLLAMA_CONFIG
+
+@st.cache_resource
+def get_http_session():
+    """Get the process-wide pooled HTTP session for talking to Ollama."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=len(OLLAMA_CONFIG["base_urls"]),
+        pool_maxsize=OLLAMA_CONFIG["http_pool_size"]
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class OllamaBackend:
+    def __init__(self, url):
+        self.url = url
+        self.healthy = False
+        self.models = set()
+        self.loaded_models = set()
+        self.last_checked = None
+        self.last_error = None
+
+class BackendPool:
+    """Set of Ollama servers with periodic health checks and least-loaded routing."""
+    
+    def __init__(self, urls, check_interval, timeout, scheduler, http_session):
+        self.http_session = http_session
+        self.backends = [OllamaBackend(url.rstrip("/")) for url in urls]
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.checker = None
+    
+    def start(self):
+        """Check every backend now, then keep checking in the background."""
+        self.check_all()
+        if self.checker is None:
+            self.checker = threading.Thread(target=self._check_loop, daemon=True)
+            self.checker.start()
+    
+    def _check_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.check_all()
+    
+    def check_all(self):
+        for backend in self.backends:
+            self.check_backend(backend)
+    
+    def check_backend(self, backend):
+        """Refresh a backend's health, installed models and resident models."""
+        try:
+            tags = self.http_session.get(f"{backend.url}/api/tags", timeout=self.timeout)
+            tags.raise_for_status()
+            running = self.http_session.get(f"{backend.url}/api/ps", timeout=self.timeout)
+            running.raise_for_status()
+            
+            with self.lock:
+                backend.models = {model["name"] for model in tags.json().get("models", [])}
+                backend.loaded_models = {model["name"] for model in running.json().get("models", [])}
+                backend.healthy = True
+                backend.last_error = None
+        except Exception as e:
+            with self.lock:
+                backend.healthy = False
+                backend.last_error = str(e)
+        finally:
+            backend.last_checked = time.time()
+    
+    def mark_failed(self, url, error):
+        """Take a backend out of rotation until the next successful health check."""
+        with self.lock:
+            for backend in self.backends:
+                if backend.url == url:
+                    backend.healthy = False
+                    backend.last_error = str(error)
+    
+    def mark_loaded(self, url, model_name):
+        """Note that a model is resident on a backend after serving a request."""
+        with self.lock:
+            for backend in self.backends:
+                if backend.url == url:
+                    backend.loaded_models.add(model_name)
+    
+    def select_backend(self, model_name, exclude=()):
+        """Pick the least-loaded healthy backend, preferring ones with the model resident; None if none is healthy."""
+        with self.lock:
+            candidates = [b for b in self.backends if b.healthy and b.url not in exclude]
+            if not candidates:
+                return None
+            
+            def rank(backend):
+                in_flight, queued = self.scheduler.get_load(backend.url)
+                return (
+                    model_name not in backend.loaded_models,
+                    model_name not in backend.models,
+                    in_flight + queued
+                )
+            
+            return min(candidates, key=rank).url
+    
+    def get_status(self):
+        """Get a snapshot of every backend for display."""
+        with self.lock:
+            return [
+                {
+                    "url": b.url,
+                    "healthy": b.healthy,
+                    "models": sorted(b.models),
+                    "loaded_models": sorted(b.loaded_models),
+                    "last_error": b.last_error
+                }
+                for b in self.backends
+            ]
+
+@st.cache_resource
+def get_backend_pool():
+    """Get the process-wide Ollama backend pool."""
+    pool = BackendPool(
+        urls=OLLAMA_CONFIG["base_urls"],
+        check_interval=OLLAMA_CONFIG["health_check_interval"],
+        timeout=OLLAMA_CONFIG["timeout"],
+        scheduler=get_scheduler(),
+        http_session=get_http_session()
+    )
+    pool.start()
+    return pool
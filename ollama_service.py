@@ -1,64 +1,182 @@
-import subprocess
+import threading
+import time
 import streamlit as st
-from langchain_ollama import ChatOllama
+from context_manager import ContextWindowManager
+from ollama_backends import get_backend_pool, get_http_session
+from model_registry import get_model_registry
+from telemetry import telemetry
 from config import OLLAMA_CONFIG, ERROR_MESSAGES, SUCCESS_MESSAGES, WARNING_MESSAGES
 
+class ModelLoadTracker:
+    """Process-wide record of model load times, so cold vs warm latency is visible."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = {}
+        self.warming = set()
+    
+    def start_warm_up(self, model_name):
+        """Claim a warm-up for a model; False if one is already running."""
+        with self.lock:
+            if model_name in self.warming:
+                return False
+            self.warming.add(model_name)
+            return True
+    
+    def finish_warm_up(self, model_name):
+        with self.lock:
+            self.warming.discard(model_name)
+    
+    def is_warming(self, model_name):
+        with self.lock:
+            return model_name in self.warming
+    
+    def record(self, model_name, metadata):
+        """Record the timings Ollama reports with a response (durations are in nanoseconds)."""
+        load_seconds = metadata.get("load_duration", 0) / 1e9
+        with self.lock:
+            stats = self.models.setdefault(model_name, {"cold_load_seconds": None})
+            stats["last_load_seconds"] = load_seconds
+            stats["prompt_eval_count"] = metadata.get("prompt_eval_count")
+            stats["updated_at"] = time.time()
+            if load_seconds >= OLLAMA_CONFIG["cold_load_threshold"]:
+                stats["cold_load_seconds"] = load_seconds
+    
+    def get(self, model_name):
+        with self.lock:
+            stats = self.models.get(model_name)
+            return dict(stats) if stats else None
+
+@st.cache_resource
+def get_model_load_tracker():
+    """Get the process-wide model load tracker."""
+    return ModelLoadTracker()
+
 class OllamaService:
     def __init__(self):
         self.base_url = OLLAMA_CONFIG["base_url"]
         self.timeout = OLLAMA_CONFIG["timeout"]
         self.default_temperature = OLLAMA_CONFIG["default_temperature"]
+        self.load_tracker = get_model_load_tracker()
+        self.backend_pool = get_backend_pool()
+        self.model_registry = get_model_registry()
+        self.http_session = get_http_session()
     
     def get_available_models(self):
         """Get list of available Ollama models."""
-        try:
-            result = subprocess.run(
-                ['ollama', 'list'], 
-                capture_output=True, 
-                text=True, 
-                timeout=self.timeout
-            )
-            
-            if result.returncode == 0 and result.stdout.strip():
-                lines = result.stdout.strip().split('\n')
-                models = []
-                
-                for line in lines[1:]:  # Skip header line
-                    if line.strip():
-                        model_name = line.split()[0]
-                        models.append(model_name)
-                
-                return models if models else None
-            else:
-                return None
-        except Exception as e:
-            st.warning(WARNING_MESSAGES["ollama_fetch_failed"].format(error=e))
-            return None
+        with telemetry.span("ollama.list_models"):
+            models = self.model_registry.get_models()
+        if not models and self.model_registry.last_error:
+            st.warning(WARNING_MESSAGES["ollama_fetch_failed"].format(error=self.model_registry.last_error))
+        return list(models) if models else None
     
     def is_model_available(self, model_name):
         """Check if a specific model is available."""
-        available_models = self.get_available_models()
-        return available_models and model_name in available_models
+        return self.model_registry.has_model(model_name)
+    
+    @staticmethod
+    def get_keep_alive(model_name):
+        """Get how long Ollama should keep a model loaded after a request."""
+        return OLLAMA_CONFIG["model_keep_alive"].get(model_name, OLLAMA_CONFIG["keep_alive"])
+    
+    def select_backend(self, model_name, exclude=()):
+        """Pick the Ollama server a generation for this model should go to."""
+        return self.backend_pool.select_backend(model_name, exclude)
+    
+    def mark_backend_failed(self, base_url, error):
+        """Stop routing to a server that just failed a request."""
+        self.backend_pool.mark_failed(base_url, error)
+    
+    def mark_model_loaded(self, base_url, model_name):
+        """Remember that a server now has the model resident."""
+        self.backend_pool.mark_loaded(base_url, model_name)
     
     @st.cache_resource
-    def get_llm_engine(_self, model_name, temperature=None):
+    def get_llm_engine(_self, model_name, temperature=None, base_url=None):
         """Get LLM engine for the specified model."""
         if temperature is None:
             temperature = _self.default_temperature
+        if base_url is None:
+            base_url = _self.base_url
             
+        # Imported here so that loading this module does not pull in LangChain
+        from langchain_ollama import ChatOllama
+        
         try:
+            # num_ctx and keep_alive must stay constant per model: changing either
+            # makes Ollama reload the model and throws away its prompt cache
             return ChatOllama(
                 model=model_name,
-                base_url=_self.base_url,
-                temperature=temperature
+                base_url=base_url,
+                temperature=temperature,
+                # Match the window the context manager budgets for, so Ollama never truncates silently
+                num_ctx=ContextWindowManager.get_num_ctx(model_name),
+                keep_alive=_self.get_keep_alive(model_name)
             )
         except Exception as e:
             st.error(ERROR_MESSAGES["model_connection_failed"].format(model=model_name, error=e))
             return None
     
+    def warm_up_model(self, model_name):
+        """Load a model into memory ahead of the first request, in the background."""
+        if not model_name or not OLLAMA_CONFIG["warm_up_on_select"]:
+            return False
+        if not self.load_tracker.start_warm_up(model_name):
+            return False
+        
+        thread = threading.Thread(target=self._warm_up, args=(model_name,), daemon=True)
+        thread.start()
+        return True
+    
+    def _warm_up(self, model_name):
+        """Send an empty generate request, which makes Ollama load the model and return."""
+        try:
+            base_url = self.select_backend(model_name) or self.base_url
+            response = self.http_session.post(
+                f"{base_url}/api/generate",
+                json={
+                    "model": model_name,
+                    "keep_alive": self.get_keep_alive(model_name),
+                    "options": {"num_ctx": ContextWindowManager.get_num_ctx(model_name)}
+                },
+                timeout=OLLAMA_CONFIG["warm_up_timeout"]
+            )
+            response.raise_for_status()
+            self.load_tracker.record(model_name, response.json())
+            self.mark_model_loaded(base_url, model_name)
+        except Exception:
+            # Warm-up is best effort; the first real request will load the model instead
+            pass
+        finally:
+            self.load_tracker.finish_warm_up(model_name)
+    
+    def record_generation_stats(self, model_name, metadata):
+        """Record the load timings Ollama returned with a generation."""
+        if metadata:
+            self.load_tracker.record(model_name, metadata)
+    
+    def get_model_latency_message(self, model_name):
+        """Get a cold/warm load summary for a model, or None if nothing is known yet."""
+        if self.load_tracker.is_warming(model_name):
+            return WARNING_MESSAGES["model_warming"].format(model=model_name)
+        
+        stats = self.load_tracker.get(model_name)
+        if not stats:
+            return None
+        cold_load = stats["cold_load_seconds"]
+        return SUCCESS_MESSAGES["model_warm"].format(
+            load=stats["last_load_seconds"],
+            cold_load=f"{cold_load:.1f}s" if cold_load is not None else "n/a"
+        )
+    
     def get_model_status_message(self, model_name):
         """Get status message for a model."""
         if self.is_model_available(model_name):
             return SUCCESS_MESSAGES["model_available"].format(model=model_name)
         else:
-            return WARNING_MESSAGES["model_unavailable"].format(model=model_name) 
\ No newline at end of file
+            return WARNING_MESSAGES["model_unavailable"].format(model=model_name)
+
+@st.cache_resource
+def get_ollama_service():
+    """Get the process-wide Ollama service."""
+    return OllamaService()
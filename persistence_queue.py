@@ -0,0 +1,215 @@
+import atexit
+import threading
+import time
+import streamlit as st
+from chat_storage import get_chat_storage
+from telemetry import telemetry
+from config import CHAT_CONFIG
+
+class PersistenceQueue:
+    """Write-behind persistence: sessions mark chats dirty and a background worker saves them in batches."""
+    
+    def __init__(self, storage, interval):
+        self.storage = storage
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        # {user_id: {session_key: entry}}, session_key being id() of the session's sync_state,
+        # so two tabs of the same user never replace each other's pending snapshot
+        self.pending = {}
+        self.flushing = set()
+        self.errors = {}
+        self.user_locks = {}
+        self.stopped = False
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+        atexit.register(self.shutdown)
+    
+    def mark_dirty(self, user_id, user_name, chat_sessions, chat_offsets, active_chat, sync_state,
+                   replaced_chat=None, deleted_chat=None):
+        """Queue the current state of a session's loaded chats for the next flush."""
+        if not user_id:
+            return
+        # Snapshot the message lists; the session keeps appending to its own copies
+        snapshot = {name: list(messages) for name, messages in chat_sessions.items()}
+        with self.lock:
+            if replaced_chat is not None:
+                sync_state.setdefault("replaced", set()).add(replaced_chat)
+            if deleted_chat is not None:
+                sync_state.setdefault("deleted", set()).add(deleted_chat)
+            # The entry holds the sync state, so its id() stays unique while queued
+            sessions = self.pending.setdefault(user_id, {})
+            sessions[id(sync_state)] = {
+                "chat_sessions": snapshot,
+                "chat_offsets": dict(chat_offsets),
+                "active_chat": active_chat,
+                "user_name": user_name,
+                "sync_state": sync_state,
+                "dirty_since": sessions.get(id(sync_state), {}).get("dirty_since", time.monotonic())
+            }
+    
+    def has_pending(self, user_id):
+        """Check whether a user has changes that are queued or being written."""
+        with self.lock:
+            return user_id in self.pending or user_id in self.flushing
+    
+    def get_error(self, user_id):
+        """Get the error from the user's last failed flush, if any."""
+        with self.lock:
+            return self.errors.get(user_id)
+    
+    def flush_user(self, user_id):
+        """Write a user's pending changes now, in the calling thread."""
+        with self.lock:
+            user_lock = self.user_locks.setdefault(user_id, threading.Lock())
+        
+        # One flush per user at a time, so batches for the same user never interleave
+        with user_lock:
+            with self.lock:
+                sessions = self.pending.pop(user_id, None)
+                if not sessions:
+                    return True
+                self.flushing.add(user_id)
+            
+            # Oldest first, so turns from different tabs are stored in the order they were made
+            flushed = True
+            for session_key, entry in sorted(sessions.items(), key=lambda item: item[1]["dirty_since"]):
+                flushed = self._flush_session(user_id, session_key, entry) and flushed
+            
+            with self.lock:
+                self.flushing.discard(user_id)
+                if flushed:
+                    self.errors.pop(user_id, None)
+            return flushed
+    
+    def _flush_session(self, user_id, session_key, entry):
+        sync_state = entry["sync_state"]
+        with self.lock:
+            working_state = {
+                "counts": dict(sync_state.get("counts", {})),
+                "versions": dict(sync_state.get("versions", {})),
+                "epochs": dict(sync_state.get("epochs", {})),
+                "replaced": set(sync_state.get("replaced", set())),
+                "deleted": set(sync_state.get("deleted", set())),
+                "active_chat": sync_state.get("active_chat")
+            }
+            flushed_replaced = set(working_state["replaced"])
+            flushed_deleted = set(working_state["deleted"])
+            # Chats whose unsaved messages were already stored after another tab's go straight to rebasing
+            rebased = {
+                chat_name for chat_name in sync_state.get("rebased", {})
+                if chat_name in entry["chat_sessions"] and chat_name not in flushed_replaced
+            }
+        
+        try:
+            with telemetry.span("persistence.flush", chats=len(entry["chat_sessions"])):
+                conflicts = self.storage.write_chat_changes(
+                    {name: messages for name, messages in entry["chat_sessions"].items() if name not in rebased},
+                    entry["chat_offsets"],
+                    entry["active_chat"],
+                    user_id,
+                    entry["user_name"],
+                    working_state
+                )
+            
+            with self.lock:
+                sync_state["counts"] = working_state["counts"]
+                sync_state["versions"] = working_state["versions"]
+                sync_state["epochs"] = working_state["epochs"]
+                # Change notifications older than this may not include the write yet
+                sync_state["written_at"] = time.monotonic()
+                sync_state["active_chat"] = working_state["active_chat"]
+                # Chats cleared again while we were writing stay marked for the next flush
+                sync_state["replaced"] = sync_state.get("replaced", set()) - flushed_replaced
+                sync_state["deleted"] = sync_state.get("deleted", set()) - flushed_deleted
+                for chat_name in flushed_replaced | flushed_deleted:
+                    sync_state.get("rebased", {}).pop(chat_name, None)
+            
+            if conflicts or rebased:
+                self._rebase_unsaved(user_id, entry, set(conflicts) | rebased)
+        except Exception as e:
+            telemetry.increment("errors", stage="persistence.flush")
+            with self.lock:
+                self.errors[user_id] = str(e)
+                # Keep the changes for the next attempt unless newer ones arrived meanwhile
+                self.pending.setdefault(user_id, {}).setdefault(session_key, entry)
+            return False
+        return True
+    
+    def _rebase_unsaved(self, user_id, entry, chat_names, max_attempts=5):
+        """Append a session's unsaved messages after what other writers stored in the meantime; raises on failure."""
+        sync_state = entry["sync_state"]
+        for _ in range(max_attempts):
+            stored_chats = self.storage.get_chat_versions(user_id)
+            chat_sessions, chat_offsets = {}, {}
+            state = {"counts": {}, "versions": {}, "epochs": {}, "active_chat": entry["active_chat"]}
+            with self.lock:
+                for chat_name in chat_names:
+                    stored = stored_chats.get(chat_name)
+                    if stored is None or chat_name not in sync_state.get("counts", {}):
+                        # Deleted elsewhere; the session drops it on its next sync
+                        continue
+                    start = (
+                        sync_state["counts"][chat_name]
+                        - entry["chat_offsets"].get(chat_name, 0)
+                        + sync_state.get("rebased", {}).get(chat_name, 0)
+                    )
+                    unsaved = entry["chat_sessions"][chat_name][start:]
+                    if not unsaved:
+                        continue
+                    chat_sessions[chat_name] = unsaved
+                    chat_offsets[chat_name] = stored["message_count"]
+                    state["counts"][chat_name] = stored["message_count"]
+                    state["versions"][chat_name] = stored["version"]
+                    state["epochs"][chat_name] = stored["epoch"]
+            if not chat_sessions:
+                return
+            
+            with telemetry.span("persistence.rebase", chats=len(chat_sessions)):
+                conflicts = self.storage.write_chat_changes(
+                    chat_sessions, chat_offsets, entry["active_chat"], user_id, entry["user_name"], state
+                )
+            # The session keeps its own order until its next sync; "rebased" counts its messages
+            # past counts[chat_name] that are already stored after the other writers' ones
+            with self.lock:
+                rebased = sync_state.setdefault("rebased", {})
+                for chat_name, messages in chat_sessions.items():
+                    if chat_name not in conflicts:
+                        rebased[chat_name] = rebased.get(chat_name, 0) + len(messages)
+                sync_state["written_at"] = time.monotonic()
+            chat_names = set(conflicts)
+            if not chat_names:
+                return
+        raise RuntimeError(f"Chats kept changing while saving: {', '.join(sorted(chat_names))}")
+    
+    def flush_all(self):
+        with self.lock:
+            user_ids = list(self.pending)
+        for user_id in user_ids:
+            self.flush_user(user_id)
+    
+    def forget_user(self, user_id):
+        """Drop per-user bookkeeping once a user has logged out and been flushed."""
+        with self.lock:
+            if user_id not in self.pending:
+                self.errors.pop(user_id, None)
+    
+    def shutdown(self):
+        """Flush everything; registered to run at interpreter exit."""
+        with self.lock:
+            self.stopped = True
+            self.wake.notify_all()
+        self.flush_all()
+    
+    def _run(self):
+        while True:
+            with self.lock:
+                self.wake.wait(self.interval)
+                if self.stopped:
+                    return
+            self.flush_all()
+
+@st.cache_resource
+def get_persistence_queue():
+    """Get the process-wide write-behind persistence queue."""
+    return PersistenceQueue(get_chat_storage(), CHAT_CONFIG["auto_save_interval"])
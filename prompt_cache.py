@@ -0,0 +1,46 @@
+import streamlit as st
+from langchain_core.messages import HumanMessage, AIMessage
+
+MESSAGE_TYPES = {
+    "user": HumanMessage,
+    "ai": AIMessage
+}
+
+class PromptCache:
+    """Per-chat LangChain messages kept in step with the chat history: one entry per message (None for roles the model doesn't see)."""
+    
+    def get_messages(self, chat_name, history):
+        """Return the cached messages for a chat, converting only what is new."""
+        cache = st.session_state.setdefault("prompt_cache", {})
+        entry = cache.get(chat_name)
+        
+        if entry is None or not self._is_prefix_valid(entry, history):
+            entry = {"messages": [], "last_source": None}
+            cache[chat_name] = entry
+        
+        messages = entry["messages"]
+        for msg in history[len(messages):]:
+            message_type = MESSAGE_TYPES.get(msg["role"])
+            # Literal messages rather than templates, so braces in code survive
+            messages.append(message_type(content=msg["content"]) if message_type else None)
+        
+        entry["last_source"] = history[-1] if history else None
+        return messages
+    
+    def invalidate(self, chat_name=None):
+        """Drop the cached messages for one chat, or for all chats."""
+        cache = st.session_state.get("prompt_cache", {})
+        if chat_name is None:
+            cache.clear()
+        else:
+            cache.pop(chat_name, None)
+    
+    @staticmethod
+    def _is_prefix_valid(entry, history):
+        """The cache is only reusable if the history grew by appending."""
+        cached_count = len(entry["messages"])
+        if cached_count == 0:
+            return True
+        if cached_count > len(history):
+            return False
+        return history[cached_count - 1] is entry["last_source"]
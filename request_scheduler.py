@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import streamlit as st
+from config import SCHEDULER_CONFIG
+
+class QueueFullError(Exception):
+    """Raised when a generation request is rejected because the queue is full."""
+
+class QueueTimeoutError(Exception):
+    """Raised when a generation request waited too long for a slot."""
+
+class _Ticket:
+    __slots__ = ("user_id", "backend", "granted")
+    
+    def __init__(self, user_id, backend):
+        self.user_id = user_id
+        self.backend = backend
+        self.granted = False
+
+class FairScheduler:
+    """Process-wide admission control: max_in_flight generations per backend, waiting requests dispatched round-robin across users."""
+    
+    def __init__(self, max_in_flight, max_queue_size, max_queue_per_user, queue_timeout, poll_interval):
+        self.max_in_flight = max_in_flight
+        self.max_queue_size = max_queue_size
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self.in_flight = {}
+        # backend -> OrderedDict(user_id -> deque of tickets); dict order is the round-robin ring
+        self.queues = {}
+    
+    @contextmanager
+    def slot(self, user_id, backend, on_wait=None):
+        """Hold a generation slot on a backend for the block, calling on_wait(position) while queued."""
+        ticket = self._enqueue(user_id, backend)
+        try:
+            self._wait_for_turn(ticket, on_wait)
+            yield
+        finally:
+            self._release(ticket)
+    
+    def _enqueue(self, user_id, backend):
+        with self.condition:
+            queues = self.queues.setdefault(backend, OrderedDict())
+            waiting = sum(len(user_queue) for user_queue in queues.values())
+            user_queue = queues.get(user_id)
+            
+            if waiting >= self.max_queue_size:
+                raise QueueFullError()
+            if user_queue is not None and len(user_queue) >= self.max_queue_per_user:
+                raise QueueFullError()
+            
+            ticket = _Ticket(user_id, backend)
+            queues.setdefault(user_id, deque()).append(ticket)
+            self._dispatch(backend)
+            return ticket
+    
+    def _wait_for_turn(self, ticket, on_wait):
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            with self.condition:
+                if ticket.granted:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueueTimeoutError()
+                position = self._position(ticket)
+            
+            # Report outside the lock; the callback talks to the browser
+            if on_wait is not None:
+                on_wait(position)
+            
+            with self.condition:
+                if not ticket.granted:
+                    self.condition.wait(min(self.poll_interval, remaining))
+    
+    def _release(self, ticket):
+        with self.condition:
+            if ticket.granted:
+                self.in_flight[ticket.backend] -= 1
+            else:
+                queues = self.queues.get(ticket.backend, {})
+                user_queue = queues.get(ticket.user_id)
+                if user_queue is not None and ticket in user_queue:
+                    user_queue.remove(ticket)
+                    if not user_queue:
+                        del queues[ticket.user_id]
+            self._dispatch(ticket.backend)
+    
+    def _dispatch(self, backend):
+        """Hand free slots to the next user in the ring. Caller holds the lock."""
+        queues = self.queues.get(backend)
+        granted = False
+        while queues and self.in_flight.get(backend, 0) < self.max_in_flight:
+            user_id, user_queue = next(iter(queues.items()))
+            ticket = user_queue.popleft()
+            ticket.granted = True
+            self.in_flight[backend] = self.in_flight.get(backend, 0) + 1
+            granted = True
+            
+            # Move the user to the back of the ring, so one user's backlog can't starve the others
+            del queues[user_id]
+            if user_queue:
+                queues[user_id] = user_queue
+        
+        if granted:
+            self.condition.notify_all()
+    
+    def _position(self, ticket):
+        """1-based number of dispatches until this ticket runs. Caller holds the lock."""
+        queues = self.queues.get(ticket.backend, {})
+        users = list(queues.keys())
+        own_index = queues[ticket.user_id].index(ticket)
+        own_ring_index = users.index(ticket.user_id)
+        
+        ahead = own_index
+        for ring_index, user_id in enumerate(users):
+            if user_id == ticket.user_id:
+                continue
+            # Users earlier in the ring get one more turn before ours comes round
+            turns = own_index + (1 if ring_index < own_ring_index else 0)
+            ahead += min(len(queues[user_id]), turns)
+        return ahead + 1
+    
+    def get_load(self, backend):
+        """Get (in-flight, queued) counts for a backend."""
+        with self.condition:
+            queues = self.queues.get(backend, {})
+            return self.in_flight.get(backend, 0), sum(len(user_queue) for user_queue in queues.values())
+
+@st.cache_resource
+def get_scheduler():
+    """Get the process-wide generation scheduler."""
+    return FairScheduler(
+        max_in_flight=SCHEDULER_CONFIG["max_in_flight_per_backend"],
+        max_queue_size=SCHEDULER_CONFIG["max_queue_size"],
+        max_queue_per_user=SCHEDULER_CONFIG["max_queue_per_user"],
+        queue_timeout=SCHEDULER_CONFIG["queue_timeout"],
+        poll_interval=SCHEDULER_CONFIG["poll_interval"]
+    )
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+from config import CACHE_CONFIG
+
+class ResponseCache:
+    """Process-wide LRU + TTL cache of model replies, with an optional SQLite tier on disk."""
+    
+    def __init__(self, max_entries, ttl_seconds, disk_path=None, cache_nonzero_temperature=False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.cache_nonzero_temperature = cache_nonzero_temperature
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.disk = None
+        if disk_path:
+            self._open_disk_tier(disk_path)
+    
+    def _open_disk_tier(self, disk_path):
+        """Open (or create) the on-disk tier."""
+        self.disk = sqlite3.connect(disk_path, check_same_thread=False)
+        self.disk.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.disk.commit()
+    
+    def is_cacheable(self, temperature):
+        """Sampled replies are only cached when explicitly enabled."""
+        return temperature == 0 or self.cache_nonzero_temperature
+    
+    @staticmethod
+    def make_key(model_name, temperature, messages):
+        """Hash the model, temperature and normalized message sequence."""
+        normalized = [
+            [msg.type, msg.content.replace("\r\n", "\n").strip()]
+            for msg in messages
+        ]
+        payload = json.dumps([model_name, round(float(temperature), 3), normalized], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Return the cached reply for a key, or None."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self.entries[key]
+            
+            if self.disk is not None:
+                row = self.disk.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+            
+            self.misses += 1
+            return None
+    
+    def set(self, key, response):
+        """Store a reply under a key."""
+        created_at = time.time()
+        with self.lock:
+            self._remember(key, response, created_at)
+            if self.disk is not None:
+                self.disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, created_at)
+                )
+                self.disk.execute("DELETE FROM responses WHERE created_at < ?", (created_at - self.ttl_seconds,))
+                self.disk.commit()
+    
+    def _remember(self, key, response, created_at):
+        """Insert into the in-memory tier, evicting the least recently used entry."""
+        self.entries[key] = (response, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def stats(self):
+        """Get hit/miss counters for display and metrics."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries)
+            }
+
+@st.cache_resource
+def get_response_cache():
+    """Get the process-wide response cache, or None when caching is disabled."""
+    if not CACHE_CONFIG["enabled"]:
+        return None
+    return ResponseCache(
+        max_entries=CACHE_CONFIG["max_entries"],
+        ttl_seconds=CACHE_CONFIG["ttl_seconds"],
+        disk_path=CACHE_CONFIG["disk_path"],
+        cache_nonzero_temperature=CACHE_CONFIG["cache_nonzero_temperature"]
+    )
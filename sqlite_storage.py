@@ -0,0 +1,345 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import streamlit as st
+from chat_storage import ChatStorage, plan_chat_writes, record_chat_writes, next_chat_version
+from message_codec import encode_content, decode_content
+from telemetry import telemetry
+from config import CHAT_CONFIG, ERROR_MESSAGES, WARNING_MESSAGES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    user_name TEXT,
+    active_chat TEXT
+);
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    epoch INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (user_id, name)
+);
+CREATE INDEX IF NOT EXISTS chats_by_user ON chats (user_id, created_at);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id INTEGER NOT NULL REFERENCES chats (chat_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,  -- zlib-compressed BLOB when encoding is set
+    created_at REAL NOT NULL,
+    encoding TEXT,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_segments (
+    user_id TEXT NOT NULL,
+    chat_name TEXT NOT NULL,
+    start_seq INTEGER NOT NULL,
+    data BLOB NOT NULL,  -- JSON segment, zlib-compressed when encoding is set
+    encoding TEXT,
+    PRIMARY KEY (user_id, chat_name, start_seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS context_summaries (
+    user_id TEXT NOT NULL,
+    chat_name TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    upto INTEGER NOT NULL,  -- messages below this seq are covered by the summary
+    anchor TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (user_id, chat_name)
+) WITHOUT ROWID;
+"""
+
+class SQLiteChatStorage(ChatStorage):
+    """Chat storage in a local SQLite database in WAL mode, with one connection per thread."""
+    
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        self.status = "uninitialized"
+        self.last_error = None
+        try:
+            connection = self._connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._add_missing_columns(connection)
+            self.status = "connected"
+        except sqlite3.Error as e:
+            self.status = "failed"
+            self.last_error = str(e)
+    
+    @staticmethod
+    def _add_missing_columns(connection):
+        """Upgrade databases created before messages had an encoding column or chats a version."""
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(messages)")}
+        if "encoding" not in columns:
+            connection.execute("ALTER TABLE messages ADD COLUMN encoding TEXT")
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(chats)")}
+        for column in ("version", "epoch"):
+            if column not in columns:
+                connection.execute(f"ALTER TABLE chats ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    
+    def _connection(self):
+        """Get this thread's connection, opening it on first use."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # Autocommit mode: transactions are opened explicitly in _transaction
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self.local.connection = connection
+        return connection
+    
+    @contextmanager
+    def _transaction(self, write=False):
+        connection = self._connection()
+        # Writers take the write lock up front and wait up to busy_timeout seconds for it
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    
+    def is_connected(self):
+        """Check if the database could be opened."""
+        return self.status == "connected"
+    
+    def get_health(self):
+        """Get the connection state ("connected" or "failed") and last error."""
+        return {"status": self.status, "error": self.last_error}
+    
+    def load_chat_index(self, user_id):
+        """Load the user's chat list without any messages, ordered by creation time."""
+        try:
+            if not user_id:
+                return {}, "default"
+            
+            with telemetry.span("sqlite.load_chat_index"):
+                with self._transaction() as connection:
+                    rows = connection.execute(
+                        "SELECT name, message_count, updated_at, version, epoch FROM chats "
+                        "WHERE user_id = ? ORDER BY created_at, chat_id",
+                        (user_id,)
+                    ).fetchall()
+                    user_row = connection.execute(
+                        "SELECT active_chat FROM users WHERE user_id = ?", (user_id,)
+                    ).fetchone()
+            
+            if not rows:
+                st.info(WARNING_MESSAGES["no_chat_history"])
+                return {}, "default"
+            
+            chat_index = {
+                name: {
+                    "message_count": message_count,
+                    "updated_at": datetime.fromtimestamp(updated_at, timezone.utc),
+                    "version": version,
+                    "epoch": epoch
+                }
+                for name, message_count, updated_at, version, epoch in rows
+            }
+            active_chat = user_row[0] if user_row and user_row[0] else "default"
+            return chat_index, active_chat
+        except sqlite3.Error as e:
+            st.warning(ERROR_MESSAGES["chat_load_failed"].format(error=e))
+            return {}, "default"
+    
+    def load_chat_messages(self, user_id, chat_name, before_seq=None, limit=None):
+        """Load the last `limit` messages of a chat with seq below before_seq; raises on failure."""
+        limit = limit or CHAT_CONFIG["history_page_size"]
+        if not user_id:
+            return [], before_seq or 0
+        
+        query = (
+            "SELECT seq, role, content, encoding FROM messages WHERE chat_id = "
+            "(SELECT chat_id FROM chats WHERE user_id = ? AND name = ?)"
+        )
+        params = [user_id, chat_name]
+        if before_seq is not None:
+            query += " AND seq < ?"
+            params.append(before_seq)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        
+        with telemetry.span("sqlite.load_chat_messages", limit=limit):
+            rows = self._connection().execute(query, params).fetchall()
+        
+        rows.reverse()
+        messages = [
+            {"role": role, "content": decode_content(content, encoding)}
+            for _, role, content, encoding in rows
+        ]
+        first_seq = rows[0][0] if rows else (before_seq or 0)
+        return messages, first_seq
+    
+    def load_chat_messages_since(self, user_id, chat_name, from_seq):
+        """Load the messages of a chat from seq from_seq onwards; raises on failure."""
+        with telemetry.span("sqlite.load_chat_messages_since"):
+            rows = self._connection().execute(
+                "SELECT role, content, encoding FROM messages WHERE chat_id = "
+                "(SELECT chat_id FROM chats WHERE user_id = ? AND name = ?) AND seq >= ? ORDER BY seq",
+                (user_id, chat_name, from_seq)
+            ).fetchall()
+        return [{"role": role, "content": decode_content(content, encoding)} for role, content, encoding in rows]
+    
+    def get_chat_versions(self, user_id):
+        """Get the stored count, version and epoch of every chat; raises on failure."""
+        rows = self._connection().execute(
+            "SELECT name, message_count, version, epoch FROM chats WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        return {
+            name: {"message_count": message_count, "version": version, "epoch": epoch}
+            for name, message_count, version, epoch in rows
+        }
+    
+    def write_chat_changes(self, chat_sessions, chat_offsets, active_chat, user_id, user_name, sync_state):
+        """Write what changed since the last save in one transaction; returns the conflicting chats, raises on failure."""
+        rewrites, appends, deletions = plan_chat_writes(chat_sessions, chat_offsets, sync_state)
+        known_versions = sync_state.setdefault("versions", {})
+        written, conflicts = {}, []
+        now = time.time()
+        
+        with telemetry.span("sqlite.save_chat_sessions"), self._transaction(write=True) as connection:
+            for chat_name in deletions:
+                # Messages go with it (ON DELETE CASCADE)
+                connection.execute("DELETE FROM chats WHERE user_id = ? AND name = ?", (user_id, chat_name))
+            
+            # The write lock is already held, so no other writer can move a version between this read and the write
+            for chat_name in [*rewrites, *appends]:
+                row = connection.execute(
+                    "SELECT chat_id, version, epoch FROM chats WHERE user_id = ? AND name = ?", (user_id, chat_name)
+                ).fetchone()
+                stored = {"version": row[1], "epoch": row[2]} if row else None
+                rewrite = chat_name in rewrites
+                plan = rewrites[chat_name] if rewrite else appends[chat_name]
+                if not rewrite and (stored is None or stored["version"] != known_versions.get(chat_name, 0)):
+                    conflicts.append(chat_name)
+                    continue
+                
+                version = next_chat_version(stored, rewrite)
+                connection.execute(
+                    "INSERT INTO chats (user_id, name, message_count, created_at, updated_at, version, epoch) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (user_id, name) DO UPDATE SET "
+                    "message_count = excluded.message_count, updated_at = excluded.updated_at, "
+                    "version = excluded.version, epoch = excluded.epoch",
+                    (user_id, chat_name, plan["message_count"], now, now, version["version"], version["epoch"])
+                )
+                chat_id = row[0] if row else connection.execute(
+                    "SELECT chat_id FROM chats WHERE user_id = ? AND name = ?", (user_id, chat_name)
+                ).fetchone()[0]
+                if rewrite:
+                    # Drop leftovers, including any another session appended meanwhile
+                    connection.execute("DELETE FROM messages WHERE chat_id = ? AND seq >= ?", (chat_id, plan["message_count"]))
+                
+                connection.executemany(
+                    "INSERT OR REPLACE INTO messages (chat_id, seq, role, content, encoding, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(chat_id, seq, message["role"], *encode_content(message["content"]), now) for seq, message in plan["writes"]]
+                )
+                written[chat_name] = {"message_count": plan["message_count"], **version}
+            
+            if sync_state.get("active_chat") != active_chat:
+                connection.execute(
+                    "INSERT INTO users (user_id, user_name, active_chat) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET user_name = excluded.user_name, active_chat = excluded.active_chat",
+                    (user_id, user_name, active_chat)
+                )
+        
+        if conflicts:
+            telemetry.increment("sync_conflicts", value=len(conflicts))
+        record_chat_writes(sync_state, written, deletions, active_chat)
+        return conflicts
+    
+    def load_search_index(self, user_id):
+        """Load every chat's search index segments; raises on failure."""
+        with telemetry.span("sqlite.load_search_index"):
+            rows = self._connection().execute(
+                "SELECT chat_name, start_seq, data, encoding FROM search_segments WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        segments = {}
+        for chat_name, start_seq, data, encoding in rows:
+            segments.setdefault(chat_name, {})[start_seq] = json.loads(decode_content(data, encoding))
+        return segments
+    
+    def save_search_index(self, user_id, segments, removed):
+        """Write changed search index segments and delete removed ones in one transaction; raises on failure."""
+        with telemetry.span("sqlite.save_search_index", segments=len(segments)), self._transaction(write=True) as connection:
+            connection.executemany(
+                "DELETE FROM search_segments WHERE user_id = ? AND chat_name = ? AND start_seq = ?",
+                [(user_id, chat_name, start_seq) for chat_name, start_seq in removed]
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO search_segments (user_id, chat_name, start_seq, data, encoding) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (user_id, chat_name, start_seq, *encode_content(json.dumps(segment, separators=(",", ":"))))
+                    for (chat_name, start_seq), segment in segments.items()
+                ]
+            )
+    
+    def load_context_summary(self, user_id, chat_name):
+        """Load a chat's rolling prompt summary, or None; raises on failure."""
+        with telemetry.span("sqlite.load_context_summary"):
+            row = self._connection().execute(
+                "SELECT epoch, upto, anchor, summary FROM context_summaries WHERE user_id = ? AND chat_name = ?",
+                (user_id, chat_name)
+            ).fetchone()
+        if row is None:
+            return None
+        epoch, upto, anchor, summary = row
+        return {"epoch": epoch, "upto": upto, "anchor": anchor, "summary": summary}
+    
+    def save_context_summary(self, user_id, chat_name, summary):
+        """Store a chat's rolling prompt summary; raises on failure."""
+        with telemetry.span("sqlite.save_context_summary"):
+            self._connection().execute(
+                "INSERT OR REPLACE INTO context_summaries (user_id, chat_name, epoch, upto, anchor, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, chat_name, summary["epoch"], summary["upto"], summary["anchor"], summary["summary"])
+            )
+    
+    def export_chats(self, user_id):
+        """Export all of a user's chats from one consistent snapshot."""
+        with self._transaction() as connection:
+            return self._export_user(connection, user_id)
+    
+    def export_all(self, output):
+        """Write every user's chats to a file object as JSON lines; returns the number of users."""
+        exported = 0
+        with self._transaction() as connection:
+            user_ids = [row[0] for row in connection.execute(
+                "SELECT DISTINCT user_id FROM chats UNION SELECT user_id FROM users ORDER BY 1"
+            )]
+            for user_id in user_ids:
+                output.write(json.dumps(self._export_user(connection, user_id), ensure_ascii=False) + "\n")
+                exported += 1
+        return exported
+    
+    @staticmethod
+    def _export_user(connection, user_id):
+        user_row = connection.execute("SELECT active_chat FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        chats = {
+            row[0]: [] for row in connection.execute(
+                "SELECT name FROM chats WHERE user_id = ? ORDER BY created_at, chat_id", (user_id,)
+            )
+        }
+        rows = connection.execute(
+            "SELECT chats.name, messages.role, messages.content, messages.encoding FROM chats "
+            "JOIN messages ON messages.chat_id = chats.chat_id "
+            "WHERE chats.user_id = ? ORDER BY chats.created_at, chats.chat_id, messages.seq",
+            (user_id,)
+        )
+        for name, role, content, encoding in rows:
+            chats[name].append({"role": role, "content": decode_content(content, encoding)})
+        return {
+            "user_id": user_id,
+            "active_chat": user_row[0] if user_row and user_row[0] else "default",
+            "chats": chats
+        }
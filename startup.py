@@ -0,0 +1,34 @@
+import importlib
+import threading
+import streamlit as st
+from telemetry import telemetry
+
+@st.cache_resource
+def get_chat_services():
+    """Import and set up the process-wide services behind the chat page; returns {"chat_storage", "ollama_service", "chat_manager"}."""
+    # Imported here rather than by app.py, so the login page draws without LangChain or firebase_admin
+    with telemetry.span("startup.chat_services"):
+        # Imported for their cost alone: the first reply would otherwise pay for them
+        for module_name in ("langchain_ollama", "llm_service"):
+            importlib.import_module(module_name)
+        from firebase_service import get_firebase_service
+        from chat_storage import get_chat_storage
+        from ollama_service import get_ollama_service
+        from chat_manager import get_chat_manager
+        
+        # Sign-in needs Firebase Auth even when chats are kept in SQLite
+        get_firebase_service().is_connected()
+        chat_storage = get_chat_storage()
+        chat_storage.is_connected()
+        return {
+            "chat_storage": chat_storage,
+            "ollama_service": get_ollama_service(),
+            "chat_manager": get_chat_manager()
+        }
+
+@st.cache_resource
+def start_prewarm():
+    """Run get_chat_services on a background thread, once per process, while the user logs in."""
+    thread = threading.Thread(target=get_chat_services, name="prewarm", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,181 @@
+import contextvars
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import TELEMETRY_CONFIG
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+class _NullSpan:
+    """Shared no-op span handed out when telemetry is disabled."""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+    
+    def set(self, **attributes):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("telemetry", "name", "attributes", "started_at")
+    
+    def __init__(self, telemetry, name, attributes):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.started_at = None
+    
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started_at
+        self.telemetry.record_span(self.name, duration, exc_type is not None, self.attributes)
+        return False
+    
+    def set(self, **attributes):
+        """Attach attributes known only once the stage has run (token counts, sizes)."""
+        self.attributes.update(attributes)
+
+class _RequestScope:
+    __slots__ = ("token",)
+    
+    def __enter__(self):
+        self.token = _request_id.set(uuid.uuid4().hex[:16])
+        return _request_id.get()
+    
+    def __exit__(self, exc_type, exc, tb):
+        _request_id.reset(self.token)
+        return False
+
+class Telemetry:
+    """Per-stage latency spans and counters, exported as JSON lines and/or Prometheus text; a no-op when disabled."""
+    
+    def __init__(self, config):
+        self.enabled = config["enabled"]
+        self.buckets = config["histogram_buckets"]
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.jsonl_file = None
+        self.server = None
+        
+        if not self.enabled:
+            return
+        if config["jsonl_path"]:
+            self.jsonl_file = open(config["jsonl_path"], "a", buffering=1, encoding="utf-8")
+        if config["prometheus_port"]:
+            self._start_prometheus_endpoint(config["prometheus_host"], config["prometheus_port"])
+    
+    def request(self):
+        """Scope that tags every span inside it with a fresh request ID."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _RequestScope()
+    
+    def span(self, name, **attributes):
+        """Time a stage: `with telemetry.span("llm.inference", model=m):`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, attributes)
+    
+    def increment(self, name, value=1, **labels):
+        """Add to a counter, e.g. increment("llm_tokens", 128, model=m)."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, duration, **attributes):
+        """Record a duration measured elsewhere, e.g. time to first token."""
+        if not self.enabled:
+            return
+        self.record_span(name, duration, False, attributes)
+    
+    def record_span(self, name, duration, error, attributes):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)}
+            histogram["count"] += 1
+            histogram["sum"] += duration
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram["buckets"][i] += 1
+        
+        if error:
+            self.increment("errors", stage=name)
+        
+        if self.jsonl_file is not None:
+            record = {
+                "ts": time.time(),
+                "request_id": _request_id.get(),
+                "span": name,
+                "duration_ms": round(duration * 1000, 3),
+                "error": error
+            }
+            record.update(attributes)
+            line = json.dumps(record, default=str)
+            with self.lock:
+                self.jsonl_file.write(line + "\n")
+    
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP app_stage_duration_seconds Time spent in each request stage.",
+            "# TYPE app_stage_duration_seconds histogram"
+        ]
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f'app_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'app_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'app_stage_duration_seconds_sum{{stage="{name}"}} {histogram["sum"]}')
+                lines.append(f'app_stage_duration_seconds_count{{stage="{name}"}} {histogram["count"]}')
+            
+            counter_names = sorted({name for name, _ in self.counters})
+            for counter_name in counter_names:
+                lines.append(f"# TYPE app_{counter_name}_total counter")
+                for (name, labels), value in sorted(self.counters.items()):
+                    if name != counter_name:
+                        continue
+                    label_text = ",".join(f'{key}="{value_}"' for key, value_ in labels)
+                    lines.append(f"app_{name}_total{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+    
+    def _start_prometheus_endpoint(self, host, port):
+        telemetry = self
+        
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        try:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError:
+            # Another process (or an earlier import) already serves the endpoint
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+# Module-level so every session and background thread in the process shares it
+telemetry = Telemetry(TELEMETRY_CONFIG)
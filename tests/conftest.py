@@ -0,0 +1,26 @@
+"""
+Fixtures shared by the test modules.
+
+Run with: python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    """A chat store in a fresh SQLite file; lock waits fail after 5 seconds."""
+    from sqlite_storage import SQLiteChatStorage
+    return SQLiteChatStorage(str(tmp_path / "chats.db"), busy_timeout=5)
+
+@pytest.fixture
+def fake_firestore_client():
+    """Point FirebaseService at a fresh in-memory Firestore and return its client."""
+    import fake_firestore
+    return fake_firestore.install()
@@ -0,0 +1,75 @@
+"""
+Search index segments, and when ChatSearch writes them.
+"""
+
+import pytest
+
+from chat_search import ChatSearch, ChatSearchIndex
+from config import SEARCH_CONFIG
+
+USER_ID = "user-1"
+
+def messages(count, first=0):
+    return [
+        {"role": "user" if seq % 2 == 0 else "ai", "content": f"message {seq} about get_chat_names"}
+        for seq in range(first, first + count)
+    ]
+
+def test_long_chat_is_split_and_a_new_turn_rewrites_only_the_last_segment():
+    index = ChatSearchIndex()
+    index.add_messages("work", 1, 0, messages(450))
+    segments, _ = index.take_changes()
+    assert sorted(segments) == [("work", 0), ("work", 200), ("work", 400)]
+    assert all(len(segment["docs"]) <= SEARCH_CONFIG["segment_messages"] for segment in segments.values())
+
+    index.add_messages("work", 1, 450, messages(2, first=450))
+    segments, removed = index.take_changes()
+    assert list(segments) == [("work", 400)]
+    assert removed == set()
+
+def test_new_epoch_removes_the_old_segments():
+    index = ChatSearchIndex()
+    index.add_messages("work", 1, 0, messages(250))
+    index.take_changes()
+    index.add_messages("work", 2, 0, messages(2))
+    segments, removed = index.take_changes()
+    assert list(segments) == [("work", 0)]
+    assert removed == {("work", 200)}
+
+@pytest.fixture
+def search(sqlite_storage):
+    # save_delay is longer than any test, so nothing reaches storage unless a test saves
+    search = ChatSearch(sqlite_storage, save_delay=3600)
+    yield search
+    search.shutdown()
+
+def index(search, first_seq, count):
+    search.index_messages(USER_ID, "work", 1, first_seq, messages(count, first=first_seq))
+    search.executor.submit(int).result()
+
+def test_turns_are_saved_together_later(search, sqlite_storage):
+    index(search, 0, 2)
+    index(search, 2, 2)
+    assert sqlite_storage.load_search_index(USER_ID) == {}
+    assert USER_ID in search.save_timers
+
+    search.save(USER_ID)
+    hits = ChatSearch(sqlite_storage, save_delay=3600).search(USER_ID, "get_chat_names", limit=10)
+    assert sorted(hit["seq"] for hit in hits) == [0, 1, 2, 3]
+
+def test_logout_saves_before_forgetting(search, sqlite_storage):
+    index(search, 0, 2)
+    search.forget_user(USER_ID)
+    search.executor.submit(int).result()
+    assert USER_ID not in search.indexes
+    assert list(sqlite_storage.load_search_index(USER_ID)["work"]) == [0]
+
+def test_catch_up_indexes_unsaved_messages_from_the_session(search, sqlite_storage):
+    sqlite_storage.write_chat_changes({"work": messages(10)}, {}, "work", USER_ID, "User", {})
+    # The session opened the chat at seq 6 and added a turn that is not stored yet
+    loaded = messages(6, first=6)
+    loaded[-1]["content"] = "answer about functools.lru_cache"
+    search.catch_up(USER_ID, {"work": 12}, {"work": 1}, {"work": (6, loaded)})
+
+    assert [hit["seq"] for hit in search.search(USER_ID, "lru_cache", limit=10)] == [11]
+    assert sorted(hit["seq"] for hit in search.search(USER_ID, "get_chat_names", limit=20)) == list(range(11))
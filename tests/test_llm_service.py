@@ -0,0 +1,140 @@
+"""
+LLMService turns against stub Ollama backends: scheduling and failover of every model call.
+"""
+
+import httpx
+import pytest
+import streamlit as st
+from langchain_core.messages import AIMessage
+
+from chat_search import ChatSearch
+from llm_service import LLMService
+from request_scheduler import FairScheduler
+
+USER_ID = "user-1"
+MODEL = "stub-model"
+BACKENDS = ("http://backend-1", "http://backend-2")
+
+class StubOllama:
+    """Backends that answer every request, except the ones listed as down."""
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.failed = []
+        self.calls = []
+        self.scheduler = None
+
+    def select_backend(self, model_name, exclude=()):
+        for url in BACKENDS:
+            if url not in exclude and url not in self.failed:
+                return url
+        return None
+
+    def get_llm_engine(self, model_name, temperature, base_url):
+        return StubEngine(self, base_url)
+
+    def mark_backend_failed(self, base_url, error):
+        self.failed.append(base_url)
+
+    def record_generation_stats(self, model_name, metadata):
+        pass
+
+    def mark_model_loaded(self, base_url, model_name):
+        pass
+
+class StubEngine:
+    def __init__(self, ollama, base_url):
+        self.ollama = ollama
+        self.base_url = base_url
+
+    def invoke(self, messages):
+        in_flight, _ = self.ollama.scheduler.get_load(self.base_url)
+        self.ollama.calls.append({"backend": self.base_url, "in_flight": in_flight, "contents": [m.content for m in messages]})
+        if self.base_url in self.ollama.down:
+            raise httpx.ConnectError("connection refused")
+        return AIMessage(content=f"reply about {messages[-1].content[-20:]}", response_metadata={"eval_count": 5})
+
+@pytest.fixture
+def search(sqlite_storage):
+    search = ChatSearch(sqlite_storage, save_delay=3600)
+    yield search
+    search.shutdown()
+
+def make_service(search, ollama):
+    st.session_state.clear()
+    st.session_state.user_uid = USER_ID
+    llm = LLMService(ollama)
+    llm.scheduler = ollama.scheduler = FairScheduler(
+        max_in_flight=1, max_queue_size=8, max_queue_per_user=2, queue_timeout=5.0, poll_interval=0.01
+    )
+    llm.response_cache = None
+    llm.chat_search = search
+    llm.context_manager.storage = search.storage
+    return llm
+
+def long_chat(turns):
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"question {turn} " + "x" * 200})
+        history.append({"role": "ai", "content": f"answer {turn} " + "y" * 200})
+    return {"work": history}
+
+def test_summary_runs_in_a_scheduler_slot(search):
+    ollama = StubOllama()
+    llm = make_service(search, ollama)
+    # A budget this small evicts everything but the new question, so the turn needs a summary first
+    llm.context_manager.get_token_budget = lambda model_name: 100
+
+    assert llm.generate_response("latest question", long_chat(3), "work", MODEL, 0.7, stream=False)
+    summary_call, reply_call = ollama.calls
+    assert "summar" in summary_call["contents"][0].lower()
+    assert summary_call["in_flight"] == 1
+    assert reply_call["in_flight"] == 1
+    assert ollama.scheduler.get_load(BACKENDS[0]) == (0, 0)
+
+def test_summary_fails_over_and_the_reply_stays_on_the_new_backend(search):
+    ollama = StubOllama(down={BACKENDS[0]})
+    llm = make_service(search, ollama)
+    llm.context_manager.get_token_budget = lambda model_name: 100
+
+    chat_sessions = long_chat(3)
+    assert llm.generate_response("latest question", chat_sessions, "work", MODEL, 0.7, stream=False)
+    assert [call["backend"] for call in ollama.calls] == [BACKENDS[0], BACKENDS[1], BACKENDS[1]]
+    assert ollama.failed == [BACKENDS[0]]
+    assert chat_sessions["work"][-1]["content"].startswith("reply about")
+
+def test_a_new_chat_turn_is_found_by_search(search):
+    llm = make_service(search, StubOllama())
+    st.session_state.chat_offsets = {"work": 0}
+    chat_sessions = {"work": [{"role": "ai", "content": "Welcome to your new chat"}]}
+
+    assert llm.generate_response("how does functools.lru_cache evict entries", chat_sessions, "work", MODEL, 0.7, stream=False)
+    search.executor.submit(int).result()
+    hits = search.search(USER_ID, "lru_cache", limit=10)
+    assert [(hit["chat_name"], hit["seq"], hit["role"]) for hit in hits] == [("work", 1, "user"), ("work", 2, "ai")]
+
+def test_a_new_session_resumes_from_the_stored_summary(search, sqlite_storage):
+    ollama = StubOllama()
+    llm = make_service(search, ollama)
+    llm.context_manager.get_token_budget = lambda model_name: 3500
+    st.session_state.chat_offsets = {"work": 0}
+    chat_sessions = long_chat(60)
+    assert llm.generate_response("latest question", chat_sessions, "work", MODEL, 0.7, stream=False)
+    sqlite_storage.write_chat_changes(chat_sessions, {}, "work", USER_ID, "User", {})
+    summary = sqlite_storage.load_context_summary(USER_ID, "work")
+    assert summary["summary"].startswith("reply about")
+
+    # Signed in again: the chat pane loads only the newest page, which starts after the summarized messages
+    ollama.calls.clear()
+    llm = make_service(search, ollama)
+    llm.context_manager.get_token_budget = lambda model_name: 3500
+    page, offset = sqlite_storage.load_chat_messages(USER_ID, "work", before_seq=122, limit=20)
+    st.session_state.chat_offsets = {"work": offset}
+    assert offset > summary["upto"]
+    assert llm.generate_response("one more question", {"work": page}, "work", MODEL, 0.7, stream=False)
+
+    (reply_call,) = ollama.calls
+    contents = reply_call["contents"]
+    assert contents[1] == f"Earlier in this conversation: {summary['summary']}"
+    assert contents[2] == chat_sessions["work"][summary["upto"]]["content"]
+    assert contents[-1] == "one more question"
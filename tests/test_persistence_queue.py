@@ -0,0 +1,97 @@
+"""
+Two tabs of one user saving through the persistence queue.
+"""
+
+import pytest
+
+from persistence_queue import PersistenceQueue
+
+USER_ID = "user-1"
+
+def turn(label):
+    return [{"role": "user", "content": f"question {label}"}, {"role": "ai", "content": f"answer {label}"}]
+
+class Tab:
+    """The parts of one session's state the queue reads and updates."""
+
+    def __init__(self, chat_sessions, sync_state):
+        self.chat_sessions = {name: list(messages) for name, messages in chat_sessions.items()}
+        self.chat_offsets = {name: 0 for name in chat_sessions}
+        self.sync_state = {
+            "counts": dict(sync_state["counts"]),
+            "versions": dict(sync_state["versions"]),
+            "epochs": dict(sync_state["epochs"]),
+            "replaced": set(),
+            "deleted": set(),
+            "active_chat": sync_state["active_chat"]
+        }
+
+    def save(self, queue, active_chat="work"):
+        queue.mark_dirty(USER_ID, "User", self.chat_sessions, self.chat_offsets, active_chat, self.sync_state)
+
+@pytest.fixture(params=["sqlite", "firestore"])
+def storage(request):
+    if request.param == "sqlite":
+        return request.getfixturevalue("sqlite_storage")
+    from firebase_service import FirebaseService
+    client = request.getfixturevalue("fake_firestore_client")
+    client.collection("users").document(USER_ID).set({"uid": USER_ID, "email": "user@example.com"})
+    return FirebaseService()
+
+@pytest.fixture
+def queue(storage):
+    # The background flush never comes round during a test; flush_user is called directly
+    queue = PersistenceQueue(storage, interval=3600)
+    yield queue
+    with queue.lock:
+        queue.stopped = True
+        queue.wake.notify_all()
+
+@pytest.fixture
+def tabs(storage):
+    """Two tabs that both loaded the same stored "work" and "notes" chats."""
+    sync_state = {}
+    storage.write_chat_changes({"work": turn(0), "notes": turn("n")}, {}, "work", USER_ID, "User", sync_state)
+    return Tab({"work": turn(0), "notes": turn("n")}, sync_state), Tab({"work": turn(0), "notes": turn("n")}, sync_state)
+
+def stored(storage, chat_name):
+    return storage.load_chat_messages_since(USER_ID, chat_name, 0)
+
+def test_turns_in_different_chats_are_both_stored(storage, queue, tabs):
+    tab_a, tab_b = tabs
+    tab_a.chat_sessions["work"] += turn("a")
+    tab_a.save(queue)
+    tab_b.chat_sessions["notes"] += turn("b")
+    tab_b.save(queue, active_chat="notes")
+
+    assert queue.flush_user(USER_ID)
+    assert not queue.has_pending(USER_ID)
+    assert stored(storage, "work") == turn(0) + turn("a")
+    assert stored(storage, "notes") == turn("n") + turn("b")
+
+def test_turns_in_the_same_chat_are_both_stored(storage, queue, tabs):
+    tab_a, tab_b = tabs
+    tab_a.chat_sessions["work"] += turn("a")
+    tab_a.save(queue)
+    tab_b.chat_sessions["work"] += turn("b")
+    tab_b.save(queue)
+
+    assert queue.flush_user(USER_ID)
+    assert not queue.has_pending(USER_ID)
+    assert stored(storage, "work") == turn(0) + turn("a") + turn("b")
+    assert tab_b.sync_state["rebased"] == {"work": 2}
+
+def test_later_turns_of_a_rebased_tab_are_not_stored_twice(storage, queue, tabs):
+    tab_a, tab_b = tabs
+    tab_a.chat_sessions["work"] += turn("a")
+    tab_a.save(queue)
+    tab_b.chat_sessions["work"] += turn("b1")
+    tab_b.save(queue)
+    queue.flush_user(USER_ID)
+
+    # Tab B has not synced yet and keeps chatting on its own view of the chat
+    tab_b.chat_sessions["work"] += turn("b2")
+    tab_b.save(queue)
+    assert queue.flush_user(USER_ID)
+    assert stored(storage, "work") == turn(0) + turn("a") + turn("b1") + turn("b2")
+    assert tab_b.sync_state["rebased"] == {"work": 4}
@@ -0,0 +1,118 @@
+"""
+Admission control in FairScheduler: round-robin across users, queue caps and timeouts.
+"""
+
+import threading
+import time
+
+import pytest
+
+from request_scheduler import FairScheduler, QueueFullError, QueueTimeoutError
+
+BACKEND = "http://backend-1"
+
+def make_scheduler(max_queue_size=8, max_queue_per_user=2, queue_timeout=5.0):
+    return FairScheduler(
+        max_in_flight=1,
+        max_queue_size=max_queue_size,
+        max_queue_per_user=max_queue_per_user,
+        queue_timeout=queue_timeout,
+        poll_interval=0.01
+    )
+
+def wait_for_load(scheduler, in_flight, queued):
+    deadline = time.monotonic() + 5
+    while scheduler.get_load(BACKEND) != (in_flight, queued):
+        assert time.monotonic() < deadline, f"load stuck at {scheduler.get_load(BACKEND)}"
+        time.sleep(0.001)
+
+class Requests:
+    """Generations run on threads, each holding its slot until released."""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.order = []
+        self.release = threading.Event()
+        self.threads = []
+
+    def start(self, user_id, hold=False):
+        def run():
+            with self.scheduler.slot(user_id, BACKEND):
+                self.order.append(user_id)
+                if hold:
+                    self.release.wait()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def finish(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+@pytest.fixture
+def requests():
+    started = []
+
+    def make(scheduler):
+        started.append(Requests(scheduler))
+        return started[-1]
+
+    yield make
+    for started_requests in started:
+        started_requests.finish()
+
+def test_waiting_users_take_turns(requests):
+    scheduler = make_scheduler()
+    running = requests(scheduler)
+    running.start("alice", hold=True)
+    wait_for_load(scheduler, 1, 0)
+    # Alice queues two more before Bob queues one; Bob still runs before Alice's second
+    for queued, user_id in enumerate(["alice", "alice", "bob"], start=1):
+        running.start(user_id)
+        wait_for_load(scheduler, 1, queued)
+
+    running.finish()
+    assert running.order == ["alice", "alice", "bob", "alice"]
+
+def test_user_over_their_queue_cap_is_rejected(requests):
+    scheduler = make_scheduler(max_queue_per_user=2)
+    running = requests(scheduler)
+    running.start("alice", hold=True)
+    running.start("alice")
+    running.start("alice")
+    wait_for_load(scheduler, 1, 2)
+
+    with pytest.raises(QueueFullError):
+        with scheduler.slot("alice", BACKEND):
+            pass
+    # Other users still get in
+    running.start("bob")
+    wait_for_load(scheduler, 1, 3)
+
+def test_full_queue_rejects_everyone(requests):
+    scheduler = make_scheduler(max_queue_size=2)
+    running = requests(scheduler)
+    running.start("alice", hold=True)
+    running.start("bob")
+    running.start("carol")
+    wait_for_load(scheduler, 1, 2)
+
+    with pytest.raises(QueueFullError):
+        with scheduler.slot("dave", BACKEND):
+            pass
+
+def test_request_gives_up_after_the_queue_timeout(requests):
+    scheduler = make_scheduler(queue_timeout=0.05)
+    running = requests(scheduler)
+    running.start("alice", hold=True)
+    wait_for_load(scheduler, 1, 0)
+
+    positions = []
+    with pytest.raises(QueueTimeoutError):
+        with scheduler.slot("bob", BACKEND, on_wait=positions.append):
+            pass
+    assert positions and set(positions) == {1}
+    # The abandoned request no longer holds a place in the queue
+    assert scheduler.get_load(BACKEND) == (1, 0)
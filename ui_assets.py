@@ -0,0 +1,50 @@
+import html
+import os
+import re
+import streamlit as st
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# Styling lives in assets/app.css; these only carry structure and class names
+HTML_TEMPLATES = {
+    "profile_card": """
+        <div class="cc-profile-card">
+            <div class="cc-avatar">👤</div>
+            <h3>{user_name}</h3>
+            <p>{user_email}</p>
+            <div class="cc-status">🟢 Online</div>
+        </div>
+    """,
+    "chat_header": """
+        <div class="cc-chat-header">
+            <h3>💬 {chat_name}</h3>
+        </div>
+    """
+}
+
+def minify_css(css):
+    """Strip comments and the whitespace CSS does not need."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r"\s*:\s*", ":", css)
+    return css.replace(";}", "}").strip()
+
+def minify_html(markup):
+    """Drop the indentation between tags."""
+    return re.sub(r">\s+<", "><", markup.strip())
+
+@st.cache_resource
+def get_stylesheet():
+    """The <style> block for assets/app.css, read and minified once per process."""
+    with open(os.path.join(ASSETS_DIR, "app.css"), encoding="utf-8") as f:
+        return f"<style>{minify_css(f.read())}</style>"
+
+@st.cache_resource
+def get_templates():
+    """HTML_TEMPLATES minified once per process."""
+    return {name: minify_html(source) for name, source in HTML_TEMPLATES.items()}
+
+def render_template(name, **values):
+    """Fill in a template; values are HTML-escaped."""
+    return get_templates()[name].format(**{key: html.escape(str(value)) for key, value in values.items()})
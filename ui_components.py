@@ -1,292 +1,28 @@
 import streamlit as st
-from config import UI_CONFIG, SUCCESS_MESSAGES, ERROR_MESSAGES
+from ui_assets import get_stylesheet, render_template
+from config import UI_CONFIG, CHAT_CONFIG, SEARCH_CONFIG, SUCCESS_MESSAGES, ERROR_MESSAGES
 
 class UIComponents:
     @staticmethod
     def render_css():
-        """Render the minimal CSS styling."""
-        st.markdown("""
-        <style>
-        /* Hide default elements */
-        #MainMenu, header, footer {visibility: hidden;}
-        .block-container {padding: 1rem 2rem;}
-        
-        /* Global styles */
-        .stApp {
-            background: #000000 !important;
-        }
-        
-        /* Sidebar styling */
-        section[data-testid="stSidebar"] {
-            background: #111111 !important;
-            border-right: 1px solid #222222 !important;
-        }
-        
-        /* Main content area */
-        .main .block-container {
-            background: #000000 !important;
-            padding: 2rem !important;
-        }
-        
-        /* Typography */
-        h1, h2, h3, h4, h5, h6 {
-            font-weight: 600 !important;
-            color: #ffffff !important;
-        }
-        
-        /* Chat messages */
-        .stChatMessage {
-            background: #111111 !important;
-            color: #ffffff !important;
-            border-radius: 12px !important;
-            margin: 8px 0 !important;
-            padding: 16px 20px !important;
-            border: none !important;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.3) !important;
-            font-size: 0.95rem !important;
-            line-height: 1.5 !important;
-        }
-        
-        .stChatMessage[data-testid="chatMessage"] {
-            background: #111111 !important;
-        }
-        
-        /* User messages */
-        .stChatMessage.user {
-            background: #007bff !important;
-            color: #ffffff !important;
-            margin-left: auto !important;
-            max-width: 80% !important;
-        }
-        
-        /* AI messages */
-        .stChatMessage.assistant {
-            background: #111111 !important;
-            color: #ffffff !important;
-            max-width: 80% !important;
-        }
-        
-        /* Input styling */
-        .stTextInput textarea, .stTextInput input {
-            background: #111111 !important;
-            color: #ffffff !important;
-            border: 1px solid #222222 !important;
-            border-radius: 8px !important;
-            font-size: 0.95rem !important;
-            padding: 12px 16px !important;
-            transition: border-color 0.2s ease;
-        }
-        
-        .stTextInput textarea:focus, .stTextInput input:focus {
-            border-color: #007bff !important;
-            box-shadow: 0 0 0 0.2rem rgba(0,123,255,0.25) !important;
-        }
-        
-        /* Button styling */
-        .stButton > button[kind="primary"] {
-            background: #007bff !important;
-            color: #ffffff !important;
-            border: none !important;
-            border-radius: 8px !important;
-            font-size: 0.9rem !important;
-            padding: 8px 16px !important;
-            font-weight: 500 !important;
-            transition: all 0.2s ease;
-        }
-        
-        .stButton > button[kind="primary"]:hover {
-            background: #0056b3 !important;
-            transform: translateY(-1px) !important;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.15) !important;
-        }
-        
-        /* Logout button styling */
-        .stButton > button[kind="secondary"] {
-            background: linear-gradient(135deg, #ff4444 0%, #cc0000 100%) !important;
-            color: white !important;
-            border: none !important;
-            border-radius: 8px !important;
-            padding: 12px 16px !important;
-            font-size: 14px !important;
-            font-weight: 500 !important;
-            box-shadow: 0 2px 8px rgba(255,68,68,0.3) !important;
-            transition: all 0.3s ease !important;
-            margin-top: 10px !important;
-        }
-        
-        .stButton > button[kind="secondary"]:hover {
-            transform: translateY(-2px) !important;
-            box-shadow: 0 4px 12px rgba(255,68,68,0.4) !important;
-        }
-        
-        /* Secondary buttons */
-        .stButton > button[data-baseweb="button"] {
-            background: #6c757d !important;
-        }
-        
-        .stButton > button[data-baseweb="button"]:hover {
-            background: #545b62 !important;
-        }
-        
-        /* Selectbox styling */
-        .stSelectbox > div > div {
-            background: #111111 !important;
-            border: 1px solid #222222 !important;
-            border-radius: 8px !important;
-            color: #ffffff !important;
-        }
-        
-        .stSelectbox > div > div > div {
-            background: #111111 !important;
-            color: #ffffff !important;
-        }
-        
-        .stSelectbox > div > div > div > div {
-            background: #111111 !important;
-            color: #ffffff !important;
-        }
-        
-        /* Dropdown options */
-        .stSelectbox > div > div > div > div > div {
-            background: #111111 !important;
-            color: #ffffff !important;
-        }
-        
-        .stSelectbox > div > div > div > div > div:hover {
-            background: #222222 !important;
-            color: #ffffff !important;
-        }
-        
-        /* Slider styling */
-        .stSlider > div > div > div > div {
-            background: #007bff !important;
-        }
-        
-        /* Divider styling */
-        hr {
-            border: none !important;
-            height: 1px !important;
-            background: #222222 !important;
-            margin: 24px 0 !important;
-        }
-        
-        /* Info boxes */
-        .stAlert {
-            border-radius: 8px !important;
-            border: none !important;
-            padding: 12px 16px !important;
-        }
-        
-        /* Success styling */
-        .stAlert[data-baseweb="notification"] {
-            background: #1a2e1a !important;
-            color: #4ade80 !important;
-            border: 1px solid #22c55e !important;
-        }
-        
-        /* Warning styling */
-        .stAlert[data-baseweb="notification"].warning {
-            background: #2e2a1a !important;
-            color: #fbbf24 !important;
-            border: 1px solid #f59e0b !important;
-        }
-        
-        /* Error styling */
-        .stAlert[data-baseweb="notification"].error {
-            background: #2e1a1a !important;
-            color: #f87171 !important;
-            border: 1px solid #ef4444 !important;
-        }
-        
-        /* Chat container */
-        .chat-container {
-            background: #111111 !important;
-            border-radius: 12px !important;
-            padding: 20px !important;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.3) !important;
-        }
-        
-        /* Minimal spacing */
-        .element-container {
-            margin-bottom: 16px !important;
-        }
-        
-        /* Code blocks in messages */
-        .stChatMessage pre {
-            background: #000000 !important;
-            border: 1px solid #222222 !important;
-            border-radius: 6px !important;
-            padding: 12px !important;
-            margin: 8px 0 !important;
-            overflow-x: auto !important;
-        }
-        
-        
-        .stChatMessage code {
-            background: #111111 !important;
-            padding: 2px 6px !important;
-            border-radius: 4px !important;
-            font-family: 'Monaco', 'Menlo', 'Ubuntu Mono', monospace !important;
-            font-size: 0.9rem !important;
-        }
-        
-        /* Responsive design */
-        @media (max-width: 768px) {
-            .block-container {padding: 1rem !important;}
-            .stChatMessage {max-width: 95% !important;}
-        }
-        </style>
-        """, unsafe_allow_html=True)
+        """Render the app's stylesheet (assets/app.css, minified once per process)."""
+        st.markdown(get_stylesheet(), unsafe_allow_html=True)
     
     @staticmethod
-    def render_sidebar_user_info(user_name, user_email):
+    def render_sidebar_user_info(user_name, user_email, auth_interface):
         """Render user information in sidebar."""
         # Creative user profile card
-        st.markdown("""
-        <div style="
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            border-radius: 12px;
-            padding: 20px;
-            margin: 10px 0;
-            color: white;
-            text-align: center;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.2);
-        ">
-            <div style="
-                width: 60px;
-                height: 60px;
-                background: rgba(255,255,255,0.2);
-                border-radius: 50%;
-                margin: 0 auto 15px;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 24px;
-            ">
-                👤
-            </div>
-            <h3 style="margin: 0; font-size: 18px; font-weight: 600;">{}</h3>
-            <p style="margin: 5px 0 0; opacity: 0.9; font-size: 14px;">{}</p>
-            <div style="
-                margin-top: 15px;
-                padding: 8px 16px;
-                background: rgba(255,255,255,0.1);
-                border-radius: 20px;
-                font-size: 12px;
-                font-weight: 500;
-            ">
-                🟢 Online
-            </div>
-        </div>
-        """.format(user_name, user_email), unsafe_allow_html=True)
+        st.markdown(
+            render_template("profile_card", user_name=user_name, user_email=user_email),
+            unsafe_allow_html=True
+        )
         
         # Logout button positioned right below the online status
         if st.button("🚪 Sign Out", key="logout_btn", type="secondary", use_container_width=True):
-            st.session_state.authenticated = False
-            st.session_state.clear()
+            auth_interface.logout()
             st.rerun()
     
-
+    
     
     @staticmethod
     def render_model_selection(ollama_service):
@@ -298,6 +34,7 @@ class UIComponents:
             "Select Model",
             available_models,
             index=0,
+            key="selected_model",
             help="Choose your AI model"
         )
         
@@ -308,6 +45,15 @@ class UIComponents:
         else:
             st.warning(f"⚠️ {selected_model} is not available")
         
+        # Load the model as soon as it is picked, so the first reply doesn't pay for it
+        if st.session_state.get("warmed_model") != selected_model:
+            ollama_service.warm_up_model(selected_model)
+            st.session_state.warmed_model = selected_model
+        
+        latency_message = ollama_service.get_model_latency_message(selected_model)
+        if latency_message:
+            st.caption(latency_message)
+        
         # Add model info
         # st.caption(f"Model: **{selected_model}**")
         
@@ -322,6 +68,7 @@ class UIComponents:
         temperature = st.slider(
             "Temperature", 
             0.0, 1.0, 0.3, 0.1, 
+            key="temperature",
             help="Response creativity (0.3 recommended for coding)"
         )
         
@@ -339,6 +86,14 @@ class UIComponents:
         
         return temperature
     
+    @staticmethod
+    @st.fragment
+    def render_model_controls(ollama_service):
+        """Render model selection and settings; changing them reruns only this block."""
+        # The chat pane reads the choices back from st.session_state.selected_model and st.session_state.temperature
+        UIComponents.render_model_selection(ollama_service)
+        UIComponents.render_temperature_slider()
+    
     @staticmethod
     def render_model_capabilities():
         """Render model capabilities section."""
@@ -361,8 +116,10 @@ class UIComponents:
                 st.markdown(f"{icon} **{capability}**")
     
     @staticmethod
+    @st.fragment
     def render_chat_session_management(chat_manager, user_name):
         """Render chat session management in sidebar."""
+        # Typing a chat name only reruns this fragment; switching, creating, clearing or deleting a chat reruns the whole app
         st.markdown("### 💬 Chats")
         
         # Manual refresh button
@@ -391,11 +148,36 @@ class UIComponents:
                 st.rerun()
         
         # Chat selection
-        chat_names = list(st.session_state.chat_sessions.keys())
-        selected_chat = st.selectbox("Active Chats", chat_names, index=chat_names.index(st.session_state.active_chat))
+        chat_names = chat_manager.get_chat_names()
+        selected_chat = st.selectbox(
+            "Active Chats",
+            chat_names,
+            index=chat_names.index(st.session_state.active_chat)
+        )
         if selected_chat != st.session_state.active_chat:
             st.session_state.active_chat = selected_chat
             st.rerun()
+        # Kept out of the option labels: a label that changes every turn resets the widget
+        st.caption(f"{chat_manager.get_message_count(selected_chat)} messages")
+        
+        # Search across all chats
+        if SEARCH_CONFIG["enabled"]:
+            query = st.text_input("Search Chats", key="chat_search_query", placeholder="Search messages...")
+            if query.strip():
+                hits = chat_manager.search_chats(query)
+                if not hits:
+                    st.caption("No matching messages")
+                for i, hit in enumerate(hits):
+                    label = f"{hit['chat_name']} · {hit['role']}: {hit['preview']}"
+                    if st.button(label, key=f"chat_search_hit_{i}", use_container_width=True):
+                        if chat_manager.open_search_hit(hit):
+                            # Widen the rendered window so the hit is on screen
+                            windows = st.session_state.setdefault("message_windows", {})
+                            windows[hit["chat_name"]] = max(
+                                chat_manager.get_message_count(hit["chat_name"]) - hit["seq"],
+                                CHAT_CONFIG["render_window"]
+                            )
+                            st.rerun()
         
         # Clear current chat session
         if st.button("Clear Chat", type="primary", use_container_width=True):
@@ -403,42 +185,67 @@ class UIComponents:
             st.rerun()
         
         # Delete current chat session (only if more than one chat exists)
-        if len(st.session_state.chat_sessions) > 1:
+        if len(chat_names) > 1:
             if st.button("Delete Chat", type="primary", use_container_width=True):
                 if chat_manager.delete_current_chat(user_name):
                     st.rerun()
     
     @staticmethod
-    def render_firebase_status(firebase_service):
-        """Render Firebase connection status."""
+    def render_storage_status(chat_storage, chat_manager):
+        """Render chat storage connection status."""
         try:
-            if firebase_service.is_connected():
+            if chat_storage.is_connected():
                 st.success("✅ Database Connected")
-                st.caption("Chat history saved")
+                has_pending, last_error = chat_manager.get_save_status()
+                if last_error:
+                    st.warning(ERROR_MESSAGES["chat_save_failed"].format(error=last_error))
+                elif has_pending:
+                    st.caption("⏳ Saving changes in the background")
+                else:
+                    st.caption("Chat history saved")
             else:
                 st.error("❌ Database Connection Failed")
+                health = chat_storage.get_health()
+                if health["error"]:
+                    st.caption(ERROR_MESSAGES["storage_init_failed"].format(error=health["error"]))
         except Exception as e:
             st.error(f"Error: {e}")
     
     @staticmethod
     def render_chat_header(active_chat, user_name):
         """Render chat session header."""
-        st.markdown(f"""
-        <div style="
-            background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%);
-            padding: 15px;
-            border-radius: 12px;
-            margin-bottom: 20px;
-            text-align: center;
-            box-shadow: 0 4px 16px rgba(99, 102, 241, 0.2);
-        ">
-            <h3 style="color: white; margin: 0; font-weight: 600;">💬 {active_chat}</h3>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(render_template("chat_header", chat_name=active_chat), unsafe_allow_html=True)
+    
+    @staticmethod
+    def get_message_window(active_chat):
+        """Get how many of the active chat's most recent messages are rendered."""
+        return st.session_state.setdefault("message_windows", {}).get(active_chat, CHAT_CONFIG["render_window"])
+    
+    @staticmethod
+    def render_load_earlier_messages(chat_manager, active_chat):
+        """Render a button that shows older messages of the active chat, paging them in from storage when needed."""
+        window = UIComponents.get_message_window(active_chat)
+        hidden = chat_manager.get_message_count(active_chat) - window
+        if hidden > 0:
+            if st.button(f"⬆️ Show earlier messages ({hidden} more)", use_container_width=True):
+                window += CHAT_CONFIG["render_window"]
+                if window > len(st.session_state.chat_sessions[active_chat]):
+                    chat_manager.load_earlier_messages(active_chat)
+                st.session_state.message_windows[active_chat] = window
+                st.rerun(scope="fragment")
+    
+    @staticmethod
+    @st.fragment(run_every=CHAT_CONFIG["sync_poll_interval"])
+    def render_sync_watcher(chat_manager):
+        """Check for messages from the user's other tabs every few seconds, redrawing the page if any arrived."""
+        if chat_manager.sync_remote_changes():
+            st.rerun()
     
     @staticmethod
     def render_chat_messages(chat_sessions, active_chat):
-        """Render chat messages."""
-        for message in chat_sessions[active_chat]:
+        """Render the most recent messages of the active chat, up to its message window."""
+        # Older messages stay behind the "show earlier" button, so a rerun costs the same however long the chat gets
+        window = UIComponents.get_message_window(active_chat)
+        for message in chat_sessions[active_chat][-window:]:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"]) 
\ No newline at end of file